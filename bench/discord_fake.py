@@ -0,0 +1,209 @@
+# discord_fake.py
+import datetime
+import itertools
+import json
+import logging
+import time
+from aiohttp import web, WSMsgType
+from bench.fakes import Fault, _PIXEL_PNG
+
+# Initialize logger
+logger = logging.getLogger("bench")
+
+GUILD_ID = 1000
+CHANNEL_ID = 1001
+USER_ID = 1002
+BOT_ID = 1003
+APPLICATION_ID = 1004
+
+
+def _json(data, status=200):
+    # discord.py only parses bodies whose content type is exactly application/json, without a charset
+    return web.Response(body=json.dumps(data).encode('utf-8'), status=status, headers={'Content-Type': 'application/json'})
+
+
+def _now():
+    return datetime.datetime.now(datetime.timezone.utc).isoformat()
+
+
+def _user(user_id, name, bot=False):
+    return {'id': str(user_id), 'username': name, 'discriminator': '0', 'global_name': name,
+            'avatar': None, 'bot': bot}
+
+
+class FakeDiscord:
+    """
+    Discord REST API and gateway for one guild with one text channel.
+
+    The gateway goes through HELLO, IDENTIFY, READY and GUILD_CREATE like the real one
+    and acknowledges heartbeats. Commands are injected as MESSAGE_CREATE events and the
+    send time of each is recorded, messages the bot posts are recorded too.
+    """
+    def __init__(self, fault=None, token='bench.token'):
+        """
+        Args:
+            fault (Fault): Latency and failure injection for REST calls.
+            token (str): Bot token the fake accepts.
+        """
+        self.fault = fault or Fault()
+        self.token = token
+        self.port = None
+        self.sent = {}
+        self.posted = []
+        self._ids = itertools.count(int(time.time() * 1000) << 22)
+        self._sockets = set()
+        self._sequence = itertools.count(1)
+        self._runner = None
+
+    @property
+    def base(self):
+        return f"http://127.0.0.1:{self.port}"
+
+    def _message(self, content, author, attachments=(), embeds=()):
+        return {
+            'id': str(next(self._ids)), 'channel_id': str(CHANNEL_ID), 'guild_id': str(GUILD_ID),
+            'author': author, 'content': content, 'timestamp': _now(), 'edited_timestamp': None,
+            'tts': False, 'mention_everyone': False, 'mentions': [], 'mention_roles': [],
+            'attachments': list(attachments), 'embeds': list(embeds), 'pinned': False, 'type': 0,
+            'flags': 0, 'components': [],
+        }
+
+    def _guild(self):
+        member = {'roles': [], 'joined_at': _now(), 'deaf': False, 'mute': False, 'flags': 0}
+        return {
+            'id': str(GUILD_ID), 'name': 'bench', 'owner_id': str(USER_ID), 'icon': None,
+            'features': [], 'emojis': [], 'stickers': [], 'large': False, 'member_count': 2,
+            'roles': [{'id': str(GUILD_ID), 'name': '@everyone', 'permissions': '2251799813685247',
+                       'position': 0, 'color': 0, 'hoist': False, 'managed': False, 'mentionable': False}],
+            'channels': [{'id': str(CHANNEL_ID), 'type': 0, 'name': 'bench', 'position': 0,
+                          'guild_id': str(GUILD_ID), 'permission_overwrites': [], 'nsfw': False}],
+            'members': [dict(member, user=_user(USER_ID, 'bencher')), dict(member, user=_user(BOT_ID, 'jobot', True))],
+            'threads': [], 'presences': [], 'voice_states': [],
+        }
+
+    async def _send(self, ws, op, data=None, event=None):
+        payload = {'op': op, 'd': data, 's': None, 't': event}
+        if op == 0:
+            payload['s'] = next(self._sequence)
+        await ws.send_str(json.dumps(payload))
+
+    async def _gateway(self, request):
+        ws = web.WebSocketResponse()
+        await ws.prepare(request)
+        await self._send(ws, 10, {'heartbeat_interval': 41250})
+        async for message in ws:
+            if message.type != WSMsgType.TEXT:
+                break
+            payload = json.loads(message.data)
+            if payload['op'] == 1:
+                await self._send(ws, 11)
+            elif payload['op'] in (2, 6):
+                self._sockets.add(ws)
+                await self._send(ws, 0, {
+                    'v': 10, 'user': _user(BOT_ID, 'jobot', True), 'guilds': [{'id': str(GUILD_ID), 'unavailable': True}],
+                    'session_id': 'bench', 'resume_gateway_url': f"ws://127.0.0.1:{self.port}/",
+                    'application': {'id': str(APPLICATION_ID), 'flags': 0}, 'shard': [0, 1],
+                }, 'READY')
+                await self._send(ws, 0, self._guild(), 'GUILD_CREATE')
+        self._sockets.discard(ws)
+        return ws
+
+    async def inject(self, contents, attachments=False):
+        """
+        Send commands to the bot as MESSAGE_CREATE events.
+
+        Args:
+            contents (list): Message contents, sent back to back.
+            attachments (bool): Attach an image to every message.
+
+        Returns:
+            dict: Send time (time.monotonic) by message ID.
+        """
+        author = _user(USER_ID, 'bencher')
+        sent = {}
+        for content in contents:
+            files = []
+            if attachments:
+                files = [{'id': str(next(self._ids)), 'filename': 'pixel.png', 'size': len(_PIXEL_PNG),
+                          'url': f"{self.base}/attachments/pixel.png", 'proxy_url': f"{self.base}/attachments/pixel.png",
+                          'content_type': 'image/png'}]
+            message = self._message(content, author, files)
+            message['member'] = {'roles': [], 'joined_at': _now(), 'deaf': False, 'mute': False, 'flags': 0}
+            sent[message['id']] = time.monotonic()
+            for ws in list(self._sockets):
+                await self._send(ws, 0, message, 'MESSAGE_CREATE')
+        self.sent.update(sent)
+        return sent
+
+    async def _post_message(self, request):
+        if request.content_type.startswith('multipart/'):
+            form = await request.post()
+            body = json.loads(form['payload_json'])
+        else:
+            body = await request.json()
+        message = self._message(body.get('content') or '', _user(BOT_ID, 'jobot', True),
+                                embeds=body.get('embeds') or ())
+        self.posted.append(time.monotonic())
+        return _json(message)
+
+    async def _edit_message(self, request):
+        body = await request.json()
+        message = self._message(body.get('content') or '', _user(BOT_ID, 'jobot', True),
+                                embeds=body.get('embeds') or ())
+        message['id'] = request.match_info['message_id']
+        return _json(message)
+
+    async def _fallback(self, request):
+        # Typing, reactions and anything else the bench does not look at
+        return web.Response(status=204)
+
+    def app(self):
+        async def me(request):
+            if request.headers.get('Authorization') != f"Bot {self.token}":
+                return _json({'message': '401: Unauthorized', 'code': 0}, status=401)
+            return _json(_user(BOT_ID, 'jobot', True))
+
+        async def gateway(request):
+            return _json({
+                'url': f"ws://127.0.0.1:{self.port}/", 'shards': 1,
+                'session_start_limit': {'total': 1000, 'remaining': 1000, 'reset_after': 0, 'max_concurrency': 1},
+            })
+
+        async def application(request):
+            return _json({'id': str(APPLICATION_ID), 'name': 'jobot', 'description': '', 'icon': None,
+                                      'bot_public': True, 'bot_require_code_grant': False, 'verify_key': '',
+                                      'owner': _user(USER_ID, 'bencher'), 'flags': 0})
+
+        async def attachment(request):
+            return web.Response(body=_PIXEL_PNG, content_type='image/png')
+
+        @web.middleware
+        async def faults(request, handler):
+            if request.path.startswith('/api/') and await self.fault.delay():
+                return _json({'message': 'injected failure', 'code': 0}, status=500)
+            return await handler(request)
+
+        app = web.Application(middlewares=[faults])
+        app.router.add_get('/', self._gateway)
+        app.router.add_get('/api/v10/users/@me', me)
+        app.router.add_get('/api/v10/gateway', gateway)
+        app.router.add_get('/api/v10/gateway/bot', gateway)
+        app.router.add_get('/api/v10/oauth2/applications/@me', application)
+        app.router.add_get('/attachments/{name}', attachment)
+        app.router.add_post('/api/v10/channels/{channel_id}/messages', self._post_message)
+        app.router.add_patch('/api/v10/channels/{channel_id}/messages/{message_id}', self._edit_message)
+        app.router.add_route('*', '/api/v10/{tail:.*}', self._fallback)
+        return app
+
+    async def start(self):
+        self._runner = web.AppRunner(self.app(), access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, '127.0.0.1', 0)
+        await site.start()
+        self.port = site._server.sockets[0].getsockname()[1]
+
+    async def close(self):
+        for ws in list(self._sockets):
+            await ws.close()
+        if self._runner is not None:
+            await self._runner.cleanup()
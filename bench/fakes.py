@@ -0,0 +1,320 @@
+# fakes.py
+import asyncio
+import base64
+import datetime
+import hashlib
+import json
+import logging
+import os
+import random
+import ssl
+import struct
+import tempfile
+from aiohttp import web
+
+# Initialize logger
+logger = logging.getLogger("bench")
+
+# A 1x1 PNG, served as Discord attachments
+_PIXEL_PNG = base64.b64decode(
+    'iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAYAAAAfFcSJAAAADUlEQVR42mP8z8BQDwAEhQGAhKmMIQAAAABJRU5ErkJggg=='
+)
+
+
+class Fault:
+    """Latency and failure injection for one fake backend."""
+    def __init__(self, latency=0, jitter=0, fail=0.0):
+        """
+        Args:
+            latency (float): Added delay per request in milliseconds.
+            jitter (float): Random extra delay up to this many milliseconds.
+            fail (float): Share of requests that fail, between 0 and 1.
+        """
+        self.latency = latency
+        self.jitter = jitter
+        self.fail = fail
+
+    @classmethod
+    def parse(cls, text):
+        """
+        Parse 'latency=200,jitter=50,fail=0.1'.
+
+        Args:
+            text (str): Comma separated key=value pairs.
+
+        Returns:
+            Fault: Parsed settings.
+        """
+        values = {}
+        for pair in filter(None, text.split(',')):
+            key, value = pair.split('=')
+            values[key.strip()] = float(value)
+        return cls(**values)
+
+    def as_dict(self):
+        return {'latency': self.latency, 'jitter': self.jitter, 'fail': self.fail}
+
+    async def delay(self):
+        """Sleep for the configured latency, returns True when this request should fail."""
+        seconds = (self.latency + random.uniform(0, self.jitter)) / 1000
+        if seconds:
+            await asyncio.sleep(seconds)
+        return random.random() < self.fail
+
+
+def _fault_middleware(fault):
+    @web.middleware
+    async def middleware(request, handler):
+        if await fault.delay():
+            return web.json_response({'error': 'injected failure'}, status=500)
+        return await handler(request)
+    return middleware
+
+
+def embed_text(text, dimensions=64):
+    """Deterministic pseudo embedding, similar texts do not get similar vectors but equal ones match."""
+    digest = hashlib.sha256(text.encode('utf-8')).digest()
+    generator = random.Random(digest)
+    vector = [generator.gauss(0, 1) for _ in range(dimensions)]
+    norm = sum(value * value for value in vector) ** 0.5
+    return [value / norm for value in vector]
+
+
+def ollama_app(fault, models=('discord-bot:latest',)):
+    """Ollama API: chat, generate, ps and embed."""
+    resident = set(models)
+
+    async def chat(request):
+        body = await request.json()
+        resident.add(body['model'])
+        prompt = body['messages'][-1]['content']
+        return web.json_response({
+            'model': body['model'],
+            'created_at': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+            'message': {'role': 'assistant', 'content': f"echo: {prompt[:200]}"},
+            'done': True,
+        })
+
+    async def generate(request):
+        body = await request.json()
+        resident.add(body['model'])
+        return web.json_response({'model': body['model'], 'response': '', 'done': True})
+
+    async def ps(request):
+        return web.json_response({'models': [{'name': name, 'model': name} for name in sorted(resident)]})
+
+    async def embed(request):
+        body = await request.json()
+        inputs = body['input'] if isinstance(body['input'], list) else [body['input']]
+        return web.json_response({'model': body['model'], 'embeddings': [embed_text(text) for text in inputs]})
+
+    app = web.Application(middlewares=[_fault_middleware(fault)], client_max_size=64 * 1024 * 1024)
+    app.router.add_post('/api/chat', chat)
+    app.router.add_post('/api/generate', generate)
+    app.router.add_get('/api/ps', ps)
+    app.router.add_post('/api/embed', embed)
+    return app
+
+
+def stable_diffusion_app(fault, image_bytes=512 * 1024):
+    """Stable Diffusion web UI txt2img, answers with an image of about image_bytes."""
+    image = base64.b64encode(_PIXEL_PNG + os.urandom(image_bytes)).decode('ascii')
+
+    async def txt2img(request):
+        await request.json()
+        return web.json_response({'images': [image], 'parameters': {}, 'info': '{}'})
+
+    app = web.Application(middlewares=[_fault_middleware(fault)])
+    app.router.add_post('/sdapi/v1/txt2img', txt2img)
+    return app
+
+
+def proxmox_app(fault, state):
+    """Proxmox VE API for one VM, state is a dict holding 'status'."""
+    async def ticket(request):
+        return web.json_response({'data': {'ticket': 'PVE:bench', 'CSRFPreventionToken': 'bench', 'username': 'bench@pam'}})
+
+    async def current(request):
+        running = state['status'] == 'running'
+        return web.json_response({'data': {
+            'status': state['status'],
+            'cpu': random.uniform(0.05, 0.6) if running else 0,
+            'mem': random.randint(2, 6) * 2 ** 30 if running else 0,
+            'maxmem': 8 * 2 ** 30,
+        }})
+
+    async def action(request):
+        state['status'] = 'running' if request.match_info['action'] == 'start' else 'stopped'
+        return web.json_response({'data': 'UPID:bench'})
+
+    app = web.Application(middlewares=[_fault_middleware(fault)])
+    app.router.add_post('/api2/json/access/ticket', ticket)
+    app.router.add_get('/api2/json/nodes/{node}/qemu/{vmid}/status/current', current)
+    app.router.add_post('/api2/json/nodes/{node}/qemu/{vmid}/status/{action}', action)
+    return app
+
+
+def _self_signed_context(directory):
+    """TLS context with a throwaway certificate for the Proxmox fake."""
+    from cryptography import x509
+    from cryptography.hazmat.primitives import hashes, serialization
+    from cryptography.hazmat.primitives.asymmetric import ec
+    from cryptography.x509.oid import NameOID
+
+    key = ec.generate_private_key(ec.SECP256R1())
+    name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, 'localhost')])
+    now = datetime.datetime.now(datetime.timezone.utc)
+    certificate = (
+        x509.CertificateBuilder().subject_name(name).issuer_name(name).public_key(key.public_key())
+        .serial_number(x509.random_serial_number())
+        .not_valid_before(now - datetime.timedelta(days=1)).not_valid_after(now + datetime.timedelta(days=1))
+        .sign(key, hashes.SHA256())
+    )
+    cert_path = os.path.join(directory, 'cert.pem')
+    key_path = os.path.join(directory, 'key.pem')
+    with open(cert_path, 'wb') as file:
+        file.write(certificate.public_bytes(serialization.Encoding.PEM))
+    with open(key_path, 'wb') as file:
+        file.write(key.private_bytes(serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8,
+                                     serialization.NoEncryption()))
+    context = ssl.create_default_context(ssl.Purpose.CLIENT_AUTH)
+    context.load_cert_chain(cert_path, key_path)
+    return context
+
+
+async def _read_varint(reader):
+    value = 0
+    for shift in range(0, 35, 7):
+        byte = (await reader.readexactly(1))[0]
+        value |= (byte & 0x7f) << shift
+        if not byte & 0x80:
+            return value
+    raise ValueError('varint too long')
+
+
+def _varint(value):
+    out = bytearray()
+    while True:
+        byte = value & 0x7f
+        value >>= 7
+        out.append(byte | (0x80 if value else 0))
+        if not value:
+            return bytes(out)
+
+
+def slp_handler(fault, state):
+    """Minecraft server list ping (1.7+ JSON), other protocols get the connection closed."""
+    async def handle(reader, writer):
+        try:
+            if await fault.delay():
+                return
+            length = await _read_varint(reader)
+            handshake = await reader.readexactly(length)
+            if not handshake or handshake[0] != 0:
+                return
+            # Status request
+            await _read_varint(reader)
+            await reader.readexactly(1)
+            status = {
+                'version': {'name': '1.20.1', 'protocol': 763},
+                'players': {'max': 20, 'online': state.get('players', 0)},
+                'description': {'text': 'TerraFirmaGreg bench'},
+            }
+            payload = json.dumps(status).encode('utf-8')
+            body = b'\x00' + _varint(len(payload)) + payload
+            writer.write(_varint(len(body)) + body)
+            await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError, ValueError):
+            pass
+        finally:
+            writer.close()
+    return handle
+
+
+def rcon_handler(fault, password):
+    """Minecraft RCON, answers every command with a short echo."""
+    async def handle(reader, writer):
+        try:
+            while True:
+                (length,) = struct.unpack('<i', await reader.readexactly(4))
+                packet = await reader.readexactly(length)
+                request_id, kind = struct.unpack('<ii', packet[:8])
+                text = packet[8:-2].decode('utf-8')
+                if await fault.delay():
+                    return
+                if kind == 3:
+                    request_id = request_id if text == password else -1
+                    body = b''
+                else:
+                    body = f"There are 0 of a max of 20 players online: ({text})".encode('utf-8')
+                out = struct.pack('<ii', request_id, 0) + body + b'\x00\x00'
+                writer.write(struct.pack('<i', len(out)) + out)
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+    return handle
+
+
+class Backends:
+    """
+    Every fake backend on one event loop, each on its own free local port.
+    """
+    def __init__(self, faults=None, rcon_password='bench'):
+        """
+        Args:
+            faults (dict): Fault per backend name: ollama, sd, proxmox, rcon, slp.
+            rcon_password (str): Password the RCON fake accepts.
+        """
+        faults = faults or {}
+        self.faults = {name: faults.get(name, Fault()) for name in ('ollama', 'sd', 'proxmox', 'rcon', 'slp')}
+        self.rcon_password = rcon_password
+        self.state = {'status': 'running', 'players': 0}
+        self.ports = {}
+        self._runners = []
+        self._servers = []
+        self._tempdir = tempfile.TemporaryDirectory()
+
+    async def _serve_app(self, name, app, ssl_context=None):
+        runner = web.AppRunner(app, access_log=None)
+        await runner.setup()
+        site = web.TCPSite(runner, '127.0.0.1', 0, ssl_context=ssl_context)
+        await site.start()
+        self._runners.append(runner)
+        self.ports[name] = site._server.sockets[0].getsockname()[1]
+
+    async def _serve_tcp(self, name, handler):
+        server = await asyncio.start_server(handler, '127.0.0.1', 0)
+        self._servers.append(server)
+        self.ports[name] = server.sockets[0].getsockname()[1]
+
+    async def start(self):
+        await self._serve_app('ollama', ollama_app(self.faults['ollama']))
+        await self._serve_app('sd', stable_diffusion_app(self.faults['sd']))
+        await self._serve_app('proxmox', proxmox_app(self.faults['proxmox'], self.state),
+                              _self_signed_context(self._tempdir.name))
+        await self._serve_tcp('rcon', rcon_handler(self.faults['rcon'], self.rcon_password))
+        await self._serve_tcp('slp', slp_handler(self.faults['slp'], self.state))
+
+    async def close(self):
+        for server in self._servers:
+            server.close()
+        for runner in self._runners:
+            await runner.cleanup()
+        self._tempdir.cleanup()
+
+    def environment(self):
+        """Environment variables pointing the bot at the fakes."""
+        return {
+            'LLM_ADDRESSES': f"http://127.0.0.1:{self.ports['ollama']}",
+            'LLM_ADDRESS': f"http://127.0.0.1:{self.ports['ollama']}",
+            'IMG_ADDRESS': f"http://127.0.0.1:{self.ports['sd']}",
+            'PROXMOX_ADDRESS': f"127.0.0.1:{self.ports['proxmox']}",
+            'PROXMOX_USER': 'bench@pam',
+            'PROXMOX_PASSWORD': 'bench',
+            'MINECRAFT_ADDRESS': '127.0.0.1',
+            'MINECRAFT_PORT': str(self.ports['slp']),
+            'MC_RCON_PORT': str(self.ports['rcon']),
+            'MC_RCON_PASSWORD': self.rcon_password,
+        }
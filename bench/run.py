@@ -0,0 +1,356 @@
+# run.py
+"""
+Offline benchmark of the bot against local fakes of every backend.
+
+Usage, from the repository root:
+
+    python -m bench.run --bursts 5 --count 50 --output results.json
+    python -m bench.run --fault ollama:latency=200,jitter=100,fail=0.05 --compare results.json
+
+The fakes run in a separate process so they do not share the bot's event loop, CPU
+or memory. Each burst injects `count` commands through the fake gateway at once and
+waits for all of them to finish, latency is measured from the gateway send to the
+end of the command handler.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import multiprocessing
+import os
+import platform
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+# Initialize logger
+logger = logging.getLogger("bench")
+
+DEFAULT_MIX = "tfg=3,tfg command list=2,tfg power=1,tfg stats=1,chat hello there=3,dream a castle=1,ping=2,add 1 2=1"
+
+
+def _serve(faults, discord_fault, conn):
+    """Fake process body, answers inject requests from the pipe until told to stop."""
+    from bench.fakes import Backends
+    from bench.discord_fake import FakeDiscord
+
+    async def main():
+        backends = Backends(faults)
+        discord = FakeDiscord(discord_fault)
+        await backends.start()
+        await discord.start()
+        conn.send({'environment': backends.environment(), 'discord': discord.base, 'token': discord.token})
+        loop = asyncio.get_running_loop()
+        while True:
+            request = await loop.run_in_executor(None, conn.recv)
+            if request[0] == 'inject':
+                conn.send(await discord.inject(request[1], request[2]))
+            elif request[0] == 'stop':
+                break
+        await discord.close()
+        await backends.close()
+
+    asyncio.run(main())
+
+
+class FakeProcess:
+    """Starts the fakes in a child process and forwards inject requests to it."""
+    def __init__(self, faults, discord_fault):
+        context = multiprocessing.get_context('spawn')
+        self._conn, child = context.Pipe()
+        self._process = context.Process(target=_serve, args=(faults, discord_fault, child), name='bench-fakes', daemon=True)
+        self._process.start()
+        self.info = self._conn.recv()
+        self._lock = asyncio.Lock()
+
+    async def inject(self, contents, attachments=False):
+        async with self._lock:
+            def call():
+                self._conn.send(('inject', contents, attachments))
+                return self._conn.recv()
+            return await asyncio.to_thread(call)
+
+    def stop(self):
+        try:
+            self._conn.send(('stop',))
+        except OSError:
+            pass
+        self._process.join(timeout=5)
+        if self._process.is_alive():
+            self._process.terminate()
+
+
+def percentiles(values, points=(50, 95, 99)):
+    """
+    Percentiles of a list of numbers, nearest rank.
+
+    Args:
+        values (list): Samples.
+        points (tuple): Percentiles to compute.
+
+    Returns:
+        dict: p50, p95, ... plus mean and max, all None without samples.
+    """
+    if not values:
+        return {**{f'p{point}': None for point in points}, 'mean': None, 'max': None}
+    ordered = sorted(values)
+    result = {f'p{point}': ordered[min(len(ordered) - 1, max(0, round(point / 100 * len(ordered)) - 1))]
+              for point in points}
+    result['mean'] = sum(ordered) / len(ordered)
+    result['max'] = ordered[-1]
+    return {key: round(value, 3) for key, value in result.items()}
+
+
+def rss_mb():
+    """Resident memory of this process in MiB."""
+    try:
+        with open('/proc/self/statm') as file:
+            return int(file.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 2 ** 20
+    except OSError:
+        # ru_maxrss is the peak, in KiB on Linux and bytes on macOS
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak / 2 ** 20 if sys.platform == 'darwin' else peak / 1024
+
+
+def parse_mix(text):
+    """Parse 'tfg=3,chat hello=2' into (content, weight) pairs."""
+    mix = []
+    for entry in filter(None, text.split(',')):
+        content, _, weight = entry.rpartition('=')
+        mix.append((content.strip(), float(weight)))
+    return mix
+
+
+def _version():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True).stdout.strip()
+        dirty = subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'], capture_output=True, text=True).stdout.strip()
+        return commit + ('-dirty' if dirty else '')
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _prefill_telemetry(series, days=7, step=300):
+    """Give $tfg stats a week of history to chart."""
+    now = time.time()
+    for timestamp in range(int(now - days * 86400), int(now), step):
+        players = max(0, round(random.gauss(3, 2)))
+        series.add(timestamp=timestamp, vm=1, online=1, players=players, latency=random.uniform(5, 40),
+                   cpu=random.uniform(10, 80), mem=random.uniform(30, 70))
+
+
+async def _bench(args, fakes):
+    """Run the bot, inject the bursts and collect measurements."""
+    import main
+    from jobot.watchdog import LoopWatchdog
+
+    bot = main.DiscordBot()
+
+    completed = {}
+    errors = {}
+
+    async def on_command_completion(ctx):
+        completed[str(ctx.message.id)] = (time.monotonic(), ctx.command.qualified_name)
+
+    async def on_command_error(ctx, error):
+        errors[str(ctx.message.id)] = (time.monotonic(), ctx.command.qualified_name if ctx.command else None, str(error))
+
+    bot._bot.add_listener(on_command_completion)
+    bot._bot.add_listener(on_command_error)
+
+    supervisor = asyncio.create_task(bot._supervise(1))
+    ready_by = time.monotonic() + 30
+    while not bot._bot.is_ready():
+        if supervisor.done() or time.monotonic() > ready_by:
+            error = supervisor.done() and supervisor.exception()
+            raise RuntimeError(f"Bot did not connect to the fake gateway: {error!r}")
+        await asyncio.sleep(0.05)
+    # Command modules are extensions loaded during login
+    from jobot.commands.minecraft import mc_telemetry
+    _prefill_telemetry(mc_telemetry.series)
+    # Commands that are off by default still get benchmarked
+    for name in ('chat', 'img', 'dream'):
+        if bot._bot.get_command(name) is not None:
+            bot._bot.get_command(name).enabled = True
+
+    mix = parse_mix(args.mix)
+    contents = [content for content, _ in mix]
+    weights = [weight for _, weight in mix]
+    random.seed(args.seed)
+
+    watchdog = LoopWatchdog(threshold=args.stall, interval=0.02, history=10 ** 6)
+    watchdog.start()
+    memory = [rss_mb()]
+    sent = {}
+    kinds = {}
+    started = time.monotonic()
+    for burst in range(args.bursts):
+        batch = random.choices(contents, weights, k=args.count)
+        with_image = [content for content in batch if content.split()[0] == 'img']
+        plain = [content for content in batch if content.split()[0] != 'img']
+        for group, attachments in ((plain, False), (with_image, True)):
+            if group:
+                ids = await fakes.inject([args.prefix + content for content in group], attachments)
+                sent.update(ids)
+                kinds.update(zip(ids, group))
+        deadline = time.monotonic() + args.timeout
+        while time.monotonic() < deadline and any(mid not in completed and mid not in errors for mid in sent):
+            memory.append(rss_mb())
+            await asyncio.sleep(0.05)
+        logger.info(f"Burst {burst + 1}/{args.bursts} done")
+        if args.pause and burst + 1 < args.bursts:
+            await asyncio.sleep(args.pause)
+    wall = time.monotonic() - started
+    memory.append(rss_mb())
+    watchdog.stop()
+
+    await bot._bot.close()
+    await asyncio.wait_for(supervisor, timeout=30)
+
+    latencies = {}
+    for mid, (finished, name) in completed.items():
+        latencies.setdefault(name, []).append((finished - sent[mid]) * 1000)
+    every = [value for values in latencies.values() for value in values]
+    timed_out = [kinds[mid] for mid in sent if mid not in completed and mid not in errors]
+    return {
+        'version': _version(),
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'python': platform.python_version(),
+        'config': {
+            'bursts': args.bursts, 'count': args.count, 'pause': args.pause, 'mix': args.mix, 'seed': args.seed,
+            'faults': args.fault, 'compute_workers': os.getenv('COMPUTE_WORKERS'),
+        },
+        'commands': len(sent),
+        'completed': len(completed),
+        'errors': len(errors),
+        'timeouts': len(timed_out),
+        'error_samples': sorted({error for _, _, error in errors.values()})[:10],
+        'wall_s': round(wall, 3),
+        'throughput_per_s': round(len(completed) / wall, 3) if wall else None,
+        'latency_ms': percentiles(every),
+        'latency_by_command_ms': {name: percentiles(values) for name, values in sorted(latencies.items())},
+        'loop_lag_ms': percentiles([lag * 1000 for lag in watchdog.lags]),
+        'loop_stalls': watchdog.stalls,
+        'memory_mb': {'start': round(memory[0], 1), 'end': round(memory[-1], 1), 'peak': round(max(memory), 1)},
+    }
+
+
+# Metric path, and whether higher is better
+_COMPARED = [
+    (('latency_ms', 'p50'), False),
+    (('latency_ms', 'p95'), False),
+    (('latency_ms', 'p99'), False),
+    (('throughput_per_s',), True),
+    (('loop_lag_ms', 'p99'), False),
+    (('loop_lag_ms', 'max'), False),
+    (('memory_mb', 'peak'), False),
+]
+
+
+def compare(old, new, max_regression=None):
+    """
+    Print the change of the main metrics between two result files.
+
+    Args:
+        old (dict): Baseline results.
+        new (dict): Current results.
+        max_regression (float): Percentage a metric may get worse by before failing.
+
+    Returns:
+        bool: True when no metric regressed by more than max_regression.
+    """
+    print(f"{'metric':<22}{old.get('version') or 'old':>14}{new.get('version') or 'new':>14}{'change':>10}")
+    ok = True
+    for path, higher_is_better in _COMPARED:
+        before, after = old, new
+        for key in path:
+            before = (before or {}).get(key)
+            after = (after or {}).get(key)
+        if not before or after is None:
+            continue
+        change = (after - before) / before * 100
+        worse = -change if higher_is_better else change
+        flag = ''
+        if max_regression is not None and worse > max_regression:
+            flag = '  REGRESSION'
+            ok = False
+        print(f"{'.'.join(path):<22}{before:>14.2f}{after:>14.2f}{change:>+9.1f}%{flag}")
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--bursts', type=int, default=5, help="Number of command bursts")
+    parser.add_argument('--count', type=int, default=50, help="Commands per burst")
+    parser.add_argument('--pause', type=float, default=1.0, help="Seconds between bursts")
+    parser.add_argument('--timeout', type=float, default=120, help="Seconds to wait for a burst to finish")
+    parser.add_argument('--mix', default=DEFAULT_MIX, help="Weighted commands, 'content=weight,...' without the prefix")
+    parser.add_argument('--prefix', default='$')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--fault', action='append', default=[], metavar='BACKEND:SPEC',
+                        help="e.g. ollama:latency=200,jitter=50,fail=0.1, backends are ollama, sd, proxmox, "
+                             "rcon, slp and discord")
+    parser.add_argument('--stall', type=float, default=0.25, help="Loop lag in seconds counted as a stall")
+    parser.add_argument('--workers', type=int, default=2, help="Compute pool workers")
+    parser.add_argument('--output', help="Write results to this JSON file")
+    parser.add_argument('--compare', help="Compare with an earlier results file")
+    parser.add_argument('--max-regression', type=float, help="Exit with 1 when a metric gets worse by more than this many percent")
+    parser.add_argument('--verbose', action='store_true', help="Keep the bot's info logging")
+    args = parser.parse_args()
+
+    from bench.fakes import Fault
+    faults = {}
+    for entry in args.fault:
+        name, _, spec = entry.partition(':')
+        faults[name] = Fault.parse(spec)
+    logging.basicConfig(level=logging.INFO, format="%(levelname)-10s - %(name)-15s : %(message)s")
+
+    fakes = FakeProcess({name: fault for name, fault in faults.items() if name != 'discord'}, faults.get('discord'))
+    workdir = tempfile.TemporaryDirectory()
+    try:
+        # Settings are read at import, so the environment has to be in place before importing the bot
+        os.environ.update(fakes.info['environment'])
+        os.environ.update({
+            'DISCORD_TOKEN': fakes.info['token'],
+            'LOG_FILE': os.path.join(workdir.name, 'bench.log'),
+            'LOOP_WATCHDOG': 'false',
+            'COMPUTE_WORKERS': str(args.workers),
+            'MC_TELEMETRY_INTERVAL': '3600',
+            'MC_TELEMETRY_FILE': os.path.join(workdir.name, 'telemetry.npz'),
+            'MC_IDLE_SHUTDOWN': '0',
+            'MC_PRESTART_LEAD': '0',
+            'LLM_HEALTH_INTERVAL': '3600',
+            # A config.toml in the working directory must not change the run
+            'CONFIG_FILE': os.path.join(workdir.name, 'config.toml'),
+        })
+        import discord
+        import yarl
+        discord.http.Route.BASE = f"{fakes.info['discord']}/api/v10"
+        discord.gateway.DiscordWebSocket.DEFAULT_GATEWAY = yarl.URL(f"{fakes.info['discord'].replace('http', 'ws', 1)}/")
+        import settings
+        settings.configure_logging()
+        if not args.verbose:
+            logging.getLogger('bot').setLevel(logging.WARNING)
+            logging.getLogger('discord').setLevel(logging.WARNING)
+
+        results = asyncio.run(_bench(args, fakes))
+    finally:
+        fakes.stop()
+        workdir.cleanup()
+
+    print(json.dumps(results, indent=2))
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(results, file, indent=2)
+    if args.compare:
+        with open(args.compare) as file:
+            baseline = json.load(file)
+        if not compare(baseline, results, args.max_regression):
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
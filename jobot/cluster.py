@@ -0,0 +1,300 @@
+# cluster.py
+import asyncio
+import json
+import logging
+import multiprocessing
+import os
+import queue
+import signal
+import threading
+import time
+import urllib.request
+import uuid
+from multiprocessing.managers import BaseManager, DictProxy
+
+# Initialize logger
+logger = logging.getLogger("bot")
+
+# Environment variables handed to shard processes
+_ADDRESS_ENV = "CLUSTER_STORE_ADDRESS"
+_AUTHKEY_ENV = "CLUSTER_STORE_AUTHKEY"
+
+# Objects served by the coordinator
+_state = {}
+_jobs = queue.Queue()
+
+
+class ClusterStore(BaseManager):
+    """
+    Shared state served by the coordinator over a local socket.
+
+    Exposes a dict (`state`) for values that every shard process should see, such as
+    the latest Proxmox status and open circuit breakers, and a queue (`jobs`) for work
+    that has to run on the primary process. Values are pickled on every access, store
+    snapshots rather than live objects.
+    """
+
+
+ClusterStore.register('state', callable=lambda: _state, proxytype=DictProxy)
+ClusterStore.register('jobs', callable=lambda: _jobs)
+
+
+class _Store:
+    """Connected store handles, or plain local objects when running a single process."""
+    def __init__(self, state, jobs):
+        self.state = state
+        self.jobs = jobs
+
+
+_store = None
+
+
+def get_store():
+    """
+    Get the shared store for this process.
+
+    Shard processes started by the coordinator connect to its store, a standalone bot
+    gets a local dict and queue with the same interface.
+
+    Returns:
+        _Store: Object with `state` (dict-like) and `jobs` (queue-like) attributes.
+    """
+    global _store
+    if _store is None:
+        address = os.getenv(_ADDRESS_ENV)
+        if address:
+            host, port = address.rsplit(':', 1)
+            manager = ClusterStore(address=(host, int(port)), authkey=bytes.fromhex(os.environ[_AUTHKEY_ENV]))
+            manager.connect()
+            _store = _Store(manager.state(), manager.jobs())
+        else:
+            _store = _Store(_state, _jobs)
+    return _store
+
+
+# Job handlers by kind, registered by the command modules
+_handlers = {}
+
+
+def handle(kind, func):
+    """
+    Register the function that runs jobs of a kind on the primary process.
+
+    Registering a kind again replaces its handler, so a reloaded module takes over.
+
+    Args:
+        kind (str): Job kind.
+        func (callable): Coroutine function called with the job arguments.
+    """
+    _handlers[kind] = func
+
+
+async def submit(kind, *args, timeout=None):
+    """
+    Queue a job for the primary process.
+
+    Args:
+        kind (str): Job kind, see handle.
+        args: Picklable arguments for the handler.
+        timeout (float): Seconds to wait for the result, None to return at once.
+
+    Returns:
+        Any: Return value of the handler when waiting, otherwise None.
+
+    Raises:
+        TimeoutError: No result within the timeout.
+        RuntimeError: The handler failed.
+    """
+    store = get_store()
+    job_id = uuid.uuid4().hex
+    # The primary only stores a result while someone is still waiting for it
+    deadline = None if timeout is None else time.time() + timeout
+    store.jobs.put((job_id, kind, args, deadline))
+    if timeout is None:
+        return None
+    key = f'job:{job_id}'
+    async with asyncio.timeout(timeout):
+        while (result := store.state.pop(key, None)) is None:
+            await asyncio.sleep(0.05)
+    ok, value = result
+    if not ok:
+        raise RuntimeError(value)
+    return value
+
+
+class JobServer:
+    """
+    Runs the jobs queued by every shard process, started on the primary only.
+
+    Jobs queued while the primary is down wait in the coordinator until it is back.
+    """
+    def __init__(self):
+        self._task = None
+        self._running = set()
+
+    def start(self):
+        """Start taking jobs in the background."""
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def close(self):
+        """Stop taking jobs, jobs already running are cancelled."""
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        for task in list(self._running):
+            task.cancel()
+
+    async def _run(self):
+        jobs = get_store().jobs
+        while True:
+            try:
+                # Short timeout so the thread does not outlive a cancelled task for long
+                job = await asyncio.to_thread(jobs.get, True, 1)
+            except queue.Empty:
+                continue
+            except (OSError, EOFError) as e:
+                logger.error(f"Lost the cluster job queue: {e}")
+                await asyncio.sleep(5)
+                continue
+            task = asyncio.create_task(self._execute(*job))
+            self._running.add(task)
+            task.add_done_callback(self._running.discard)
+
+    async def _execute(self, job_id, kind, args, deadline):
+        func = _handlers.get(kind)
+        try:
+            if func is None:
+                raise LookupError(f"no handler for {kind} jobs")
+            result = (True, await func(*args))
+        except Exception as e:
+            logger.error(f"Cluster job {kind} failed: {e}")
+            result = (False, str(e) or type(e).__name__)
+        if deadline is not None and time.time() < deadline:
+            get_store().state[f'job:{job_id}'] = result
+
+
+def recommended_shard_count(token):
+    """
+    Ask Discord how many shards the bot should use.
+
+    Args:
+        token (str): Bot token.
+
+    Returns:
+        int: Recommended shard count.
+    """
+    request = urllib.request.Request(
+        "https://discord.com/api/v10/gateway/bot",
+        headers={"Authorization": f"Bot {token}", "User-Agent": "DiscordBot (jobot, 1.0)"},
+    )
+    with urllib.request.urlopen(request, timeout=10) as response:
+        return json.load(response)["shards"]
+
+
+def split_shards(shard_count, processes):
+    """
+    Split shard IDs into contiguous ranges, one per process.
+
+    Args:
+        shard_count (int): Total number of shards.
+        processes (int): Number of processes.
+
+    Returns:
+        list: List of shard ID lists, never more lists than shards.
+    """
+    processes = max(1, min(processes, shard_count))
+    size, extra = divmod(shard_count, processes)
+    ranges = []
+    start = 0
+    for i in range(processes):
+        end = start + size + (1 if i < extra else 0)
+        ranges.append(list(range(start, end)))
+        start = end
+    return ranges
+
+
+def _terminate(signum, frame):
+    """Treat SIGTERM like Ctrl+C so shard processes get stopped."""
+    raise KeyboardInterrupt
+
+
+def run_cluster(target, processes, shard_count=None, token=None, address=("127.0.0.1", 0),
+                restart_delay=5, max_restart_delay=300):
+    """
+    Run shard clusters as separate processes and restart any that die.
+
+    Each process is started with `target(cluster_id, shard_ids, shard_count)`. The
+    coordinator serves the shared store in a background thread and keeps watching the
+    processes until interrupted.
+
+    Args:
+        target (callable): Picklable function that runs a bot for the given shards.
+        processes (int): Number of shard processes.
+        shard_count (int): Total number of shards, asks Discord when None.
+        token (str): Bot token, needed when shard_count is None.
+        address (tuple): Host and port for the shared store, port 0 picks a free one.
+        restart_delay (float): Initial delay before restarting a crashed process.
+        max_restart_delay (float): Upper bound of the restart delay.
+    """
+    if not shard_count:
+        shard_count = recommended_shard_count(token)
+    ranges = split_shards(shard_count, processes)
+    logger.info(f"Starting {len(ranges)} shard processes for {shard_count} shards: {ranges}")
+
+    # Serve shared state from this process
+    authkey = os.urandom(16)
+    server = ClusterStore(address=address, authkey=authkey).get_server()
+    threading.Thread(target=server.serve_forever, name="cluster-store", daemon=True).start()
+    host, port = server.address
+    os.environ[_ADDRESS_ENV] = f"{host}:{port}"
+    os.environ[_AUTHKEY_ENV] = authkey.hex()
+
+    context = multiprocessing.get_context("spawn")
+    base_log_file = os.getenv("LOG_FILE", "logs/infos.log")
+
+    def spawn(cluster_id):
+        # Every process gets its own log file so rotation does not race
+        root, ext = os.path.splitext(base_log_file)
+        os.environ["LOG_FILE"] = f"{root}-cluster{cluster_id}{ext}"
+        process = context.Process(
+            target=target,
+            args=(cluster_id, ranges[cluster_id], shard_count),
+            name=f"shard-cluster-{cluster_id}",
+        )
+        process.start()
+        logger.info(f"Cluster {cluster_id} started (pid {process.pid}, shards {ranges[cluster_id]})")
+        return process
+
+    signal.signal(signal.SIGTERM, _terminate)
+    workers = {i: spawn(i) for i in range(len(ranges))}
+    started = {i: time.monotonic() for i in workers}
+    delays = {i: restart_delay for i in workers}
+    restart_at = {}
+    try:
+        while True:
+            time.sleep(1)
+            now = time.monotonic()
+            for cluster_id, process in list(workers.items()):
+                if process.is_alive():
+                    continue
+                if cluster_id not in restart_at:
+                    # Reset the backoff if the process had been up for a while
+                    if now - started[cluster_id] > max_restart_delay:
+                        delays[cluster_id] = restart_delay
+                    logger.error(f"Cluster {cluster_id} exited with code {process.exitcode}, "
+                                 f"restarting in {delays[cluster_id]}s")
+                    restart_at[cluster_id] = now + delays[cluster_id]
+                    delays[cluster_id] = min(delays[cluster_id] * 2, max_restart_delay)
+                elif now >= restart_at[cluster_id]:
+                    del restart_at[cluster_id]
+                    workers[cluster_id] = spawn(cluster_id)
+                    started[cluster_id] = now
+    except KeyboardInterrupt:
+        logger.info("Stopping shard processes...")
+    finally:
+        for process in workers.values():
+            if process.is_alive():
+                process.terminate()
+        for process in workers.values():
+            process.join(timeout=30)
@@ -0,0 +1,119 @@
+# admin.py
+import asyncio
+import io
+import logging
+import threading
+from discord.ext import commands
+import discord
+from jobot.watchdog import sample_stacks, render_profile
+from jobot.resilience import snapshot
+from jobot import state as shared_state
+
+# Initialize logger
+logger = logging.getLogger("bot")
+
+def admin_commands(bot):
+    """
+    Admin commands
+    """
+    @bot.command(
+        help="Profile the event loop for a number of seconds and upload the report",
+        enabled=True,
+        hidden=True
+    )
+    @commands.is_owner()
+    async def profile(ctx,
+                      seconds: int = commands.parameter(default=10, description="Seconds to sample (1-120)")):
+        """
+        Sample the event loop thread for a while and upload a text report of where it spent its time.
+
+        Args:
+            ctx (Context): Message context.
+            seconds (int): Length of the sampling session.
+        """
+        seconds = max(1, min(seconds, 120))
+        logger.info(f"{ctx.author} used profile command for {seconds}s")
+        await ctx.send(f"Profiling the event loop for {seconds} seconds...")
+
+        # The loop thread is the one running this coroutine
+        loop_thread = threading.get_ident()
+        stacks, samples = await asyncio.to_thread(sample_stacks, loop_thread, seconds)
+        report = render_profile(stacks, samples)
+
+        file = discord.File(io.BytesIO(report.encode('utf-8')), filename="profile.txt")
+        await ctx.send(content=f"Collected {samples} samples.", file=file)
+
+    @bot.command(
+        help="Show the circuit breaker state of every backend",
+        enabled=True,
+        hidden=True
+    )
+    @commands.is_owner()
+    async def backends(ctx):
+        """
+        Show breaker state and call counters for each backend.
+
+        Args:
+            ctx (Context): Message context.
+        """
+        states = snapshot()
+        if not states:
+            await ctx.send("No backend has been used yet.")
+            return
+        lines = [f"{'Backend':<18}{'State':<11}{'Calls':>7}{'Fails':>7}{'Reject':>8}{'Trips':>7}"]
+        for name, state in states.items():
+            lines.append(f"{name:<18}{state['state']:<11}{state['calls']:>7}{state['failures']:>7}"
+                         f"{state['rejected']:>8}{state['trips']:>7}")
+            if state['state'] != 'closed':
+                lines.append(f"  retry in {state['retry_in']:.0f}s, last error: {state['last_error']}")
+        await ctx.send("```\n" + '\n'.join(lines)[:1900] + "\n```")
+
+    @bot.command(
+        help="Reload command modules and the config file: $reload [module]",
+        enabled=True,
+        hidden=True
+    )
+    @commands.is_owner()
+    async def reload(ctx, name: str = None):
+        """
+        Reload one command module, or all of them, without dropping the gateway session.
+
+        Routers, pools, caches and collectors are shared objects and survive the reload.
+
+        Args:
+            ctx (Context): Message context.
+            name (str): Module name such as 'llm' or 'jobot.commands.llm', all modules when omitted.
+        """
+        logger.info(f"{ctx.author} used reload command: {name}")
+        watcher = shared_state.get('config')
+        changed = watcher.apply() if watcher is not None else set()
+
+        if name is None:
+            extensions = list(bot.extensions)
+        else:
+            extensions = [name if '.' in name else f"jobot.commands.{name}"]
+        reloaded, failed = [], []
+        for extension in extensions:
+            try:
+                if extension in bot.extensions:
+                    await bot.reload_extension(extension)
+                else:
+                    await bot.load_extension(extension)
+                reloaded.append(extension.rsplit('.', 1)[-1])
+            except commands.ExtensionError as e:
+                # A failed reload rolls back to the previous version of the module
+                logger.error(f"Failed to reload {extension}: {e}")
+                failed.append(f"{extension.rsplit('.', 1)[-1]} ({e.__cause__ or e})")
+
+        lines = []
+        if reloaded:
+            lines.append(f"Reloaded {', '.join(reloaded)}.")
+        if failed:
+            lines.append(f"Failed: {', '.join(failed)}")
+        if changed:
+            lines.append(f"Config changed: {', '.join(sorted(changed))}.")
+        await ctx.send('\n'.join(lines)[:1900] or "Nothing to reload.")
+
+async def setup(bot):
+    """Extension entry point, also run when the extension is reloaded"""
+    admin_commands(bot)
@@ -1,47 +1,78 @@
 # llm_commands.py
 import settings
-from ollama import AsyncClient
 import discord
 import os
+import time
 import aiohttp
 import aiofiles
-import pyvips
-import base64
+from discord.ext import commands
+from jobot import config
+from jobot.compute import compute, transcode_image, decode_sd_image
+from jobot.ollama_router import ModelError, OllamaRouter, parse_hours
+from jobot.rag import Retriever
+from jobot.resilience import BackendUnavailable, breaker, configure as configure_breakers
+from jobot.state import shared
 
 # Initialize logger
 logger = settings.logging.getLogger("bot")
 
+# Errors each backend fails with, the router already fails over between Ollama hosts
+# and only raises ConnectionError once none of them answers
+_OLLAMA_ERRORS = (ConnectionError, TimeoutError)
+_IMG_ERRORS = (aiohttp.ClientError, TimeoutError)
+
+# Circuit breakers, counting the errors above as failures. An error answer from Ollama,
+# such as an unknown model, shows the host is up and is reported to the user instead.
+_ollama_breaker = breaker('Ollama', failures=_OLLAMA_ERRORS, ignore=(ModelError,))
+_img_breaker = breaker('Stable Diffusion', timeout=settings.IMG_TIMEOUT, failures=_IMG_ERRORS)
+
+def _backend_error(error):
+    """Message telling the user a backend call failed"""
+    if isinstance(error, BackendUnavailable):
+        return str(error)
+    if isinstance(error, ModelError):
+        return f"The model could not answer: {error}"
+    return f"The server did not answer ({str(error) or type(error).__name__}), please try again later."
+
+def _http_timeout():
+    """Connect and read deadlines for HTTP backends"""
+    return aiohttp.ClientTimeout(total=settings.IMG_TIMEOUT, sock_connect=settings.LLM_CONNECT_TIMEOUT)
+
 class _LLMHandler:
     """
     A private handler class that manages interaction with a language model
     """
-    def __init__(self, llm_address):
+    def __init__(self, router):
         """
-        Initialize handler with specific address for the language model API call.
+        Initialize handler with the router for language model API calls.
 
         Attributes:
-            _client (AsyncClient): Client for interacting with Ollama.
+            _client (OllamaRouter): Routes requests to the Ollama servers.
 
         Args:
-            llm_address (str): The address of the language model server
+            router (OllamaRouter): Router over the language model servers.
         """
-        self._client = AsyncClient(host=llm_address)
+        self._client = router
 
-    async def send_prompt(self, prompt):
+    async def send_prompt(self, prompt, model=None, context=''):
         """
         Send a text promp to the language model and return the response.
 
         Args:
             prompt (str): Text promp to send to the language model.
+            model (str): Model to use, defaults to the chat model.
+            context (str): Retrieved server messages placed before the prompt.
 
         Returns:
             str: Response content from the language model.
         """
+        if context:
+            prompt = f"Relevant messages from this server:\n{context}\n\n{prompt}"
         message = {'role': 'user', 'content': prompt}
-        response = await self._client.chat(model='discord-bot:latest', messages=[message], stream=False)
+        response = await _ollama_breaker.call(self._client.chat, model or settings.LLM_CHAT_MODEL, [message], stream=False)
         return response['message']['content']
 
-    async def process_image_and_send_prompt(self, url, prompt, msg_id):
+    async def process_image_and_send_prompt(self, url, prompt):
         """
         Download attached image, process it and send to the language model with text prompt,
         and return the response.
@@ -49,34 +80,22 @@ class _LLMHandler:
         Args:
             url (str): URL of the image attachment.
             prompt (str): Text prompt to send to the language model.
-            msg_id (str): Discord message ID for unique filename.
 
         Returns:
             str: Response content from the language model after processing the image.
         """
-        async with aiohttp.ClientSession() as session:
+        async with aiohttp.ClientSession(timeout=_http_timeout()) as session:
             async with session.get(url) as response:
-                if response.status == 200:
-                    # process url
-                    file_name = url.split("/")[-1]
-                    # save images
-                    async with aiofiles.open(file_name, 'wb') as f:
-                        while True:
-                            chunk = await response.content.read(1024)
-                            if not chunk:
-                                break
-                            await f.write(chunk)
-
-        # Convert image to JPG
-        image = pyvips.Image.new_from_file(file_name, access="sequential")
-        image_path = f'{msg_id}.jpg'
-        image.write_to_file(image_path)
-        os.remove(file_name)
+                if response.status != 200:
+                    return "Failed to download the image."
+                data = await response.read()
+
+        # Convert image to JPG, large images are converted in the compute pool
+        image = await compute.run_shared(transcode_image, data)
 
         # Send image and prompt to LLM
-        message = {'role': 'user', 'content': prompt, 'images': [image_path]}
-        response = await self._client.chat(model='llava:13b', messages=[message], stream=False)
-        os.remove(image_path)
+        message = {'role': 'user', 'content': prompt, 'images': [image]}
+        response = await _ollama_breaker.call(self._client.chat, settings.LLM_VISION_MODEL, [message], stream=False)
         return response['message']['content']
 
     async def generate_image(self, prompt, msg_id):
@@ -95,25 +114,174 @@ class _LLMHandler:
             "seed": -1,
         }
 
-        async with aiohttp.ClientSession() as session:
+        status, data = await _img_breaker.call(self._txt2img, url, payload)
+        if status != 200:
+            return "no-valid-response"
+        try:
+            # JSON parsing and base64 decoding of the image happen off the event loop
+            img_data = await compute.run_shared(decode_sd_image, data)
+            async with aiofiles.open(f"{msg_id}.png", 'wb') as f:
+                await f.write(img_data)
+            return "success"
+        except KeyError:
+            return "img-key-404"
+
+    async def _txt2img(self, url, payload):
+        """Post a txt2img request, server errors count as backend failures"""
+        async with aiohttp.ClientSession(timeout=_http_timeout()) as session:
             async with session.post(url, json=payload) as response:
-                if response.status == 200:
-                    try:
-                        data = await response.json()
-                        img_data = base64.b64decode(data['images'][0])
-                        with open(f"{msg_id}.png", 'wb') as f:
-                            f.write(img_data)
-                        return "success"
-                    except KeyError:
-                        return "img-key-404"
-                else:
-                    return "no-valid-response"
+                if response.status >= 500:
+                    response.raise_for_status()
+                return response.status, await response.read()
+
+def _client_options():
+    """httpx (connect, read, write, pool) deadlines for the Ollama clients"""
+    return {'timeout': (settings.LLM_CONNECT_TIMEOUT, settings.LLM_TIMEOUT,
+                        settings.LLM_TIMEOUT, settings.LLM_CONNECT_TIMEOUT)}
+
+# Shared router, kept with its clients and resident model state across reloads
+llm_router = shared('llm_router', lambda: OllamaRouter(
+    settings.LLM_ADDRESSES,
+    warm_models=settings.LLM_WARM_MODELS,
+    active_hours=parse_hours(settings.LLM_ACTIVE_HOURS),
+    active_keep_alive=settings.LLM_ACTIVE_KEEP_ALIVE,
+    health_interval=settings.LLM_HEALTH_INTERVAL,
+    client_options=_client_options(),
+))
+
+llm_handler = _LLMHandler(llm_router)
+
+async def _embed(texts):
+    """Embed a batch of texts with the retrieval model"""
+    return await _ollama_breaker.call(llm_router.embed, settings.RAG_EMBED_MODEL, texts)
+
+# Guild message indexes for $chat, started when RAG_ENABLED is set
+retriever = shared('retriever', lambda: Retriever(
+    settings.RAG_DIR,
+    _embed,
+    batch_size=settings.RAG_BATCH_SIZE,
+    top_k=settings.RAG_TOP_K,
+    token_budget=settings.RAG_TOKEN_BUDGET,
+    nprobe=settings.RAG_NPROBE,
+    flush_interval=settings.RAG_FLUSH_INTERVAL,
+))
+retriever.bind(_embed)
+
+def _apply_settings(bot, changed):
+    """Push changed settings into the shared router, breakers, retriever and $index"""
+    if changed & {'BREAKER_FAILURES', 'BREAKER_RESET'}:
+        configure_breakers(settings.BREAKER_FAILURES, settings.BREAKER_RESET)
+    timeouts = changed & {'LLM_CONNECT_TIMEOUT', 'LLM_TIMEOUT'}
+    if timeouts or changed & {'LLM_ADDRESS', 'LLM_ADDRESSES', 'LLM_WARM_MODELS', 'LLM_ACTIVE_HOURS', 'LLM_ACTIVE_KEEP_ALIVE'}:
+        hosts = None
+        if 'LLM_ADDRESSES' in changed:
+            hosts = settings.LLM_ADDRESSES
+        elif 'LLM_ADDRESS' in changed and settings.LLM_ADDRESS:
+            hosts = [settings.LLM_ADDRESS]
+        llm_router.configure(
+            hosts=hosts,
+            warm_models=settings.LLM_WARM_MODELS,
+            active_hours=parse_hours(settings.LLM_ACTIVE_HOURS),
+            active_keep_alive=settings.LLM_ACTIVE_KEEP_ALIVE,
+            client_options=_client_options() if timeouts else None,
+        )
+    _img_breaker.timeout = settings.IMG_TIMEOUT
+    retriever.top_k = settings.RAG_TOP_K
+    retriever.token_budget = settings.RAG_TOKEN_BUDGET
+    retriever.batch_size = settings.RAG_BATCH_SIZE
+    retriever.nprobe = settings.RAG_NPROBE
+    if 'RAG_ENABLED' in changed:
+        enabled = _switch_retrieval(bot)
+        logger.info(f"Chat retrieval {'enabled' if enabled else 'disabled'}")
+
+def _switch_retrieval(bot):
+    """
+    Start or stop indexing and $index to match RAG_ENABLED.
+
+    Intents are fixed at startup, without message content every indexed message would be
+    empty, so retrieval stays off until a restart requests the intent.
+
+    Returns:
+        bool: Whether retrieval is on.
+    """
+    enabled = settings.RAG_ENABLED
+    if enabled and not (bot.intents.message_content and bot.intents.messages):
+        logger.error("RAG_ENABLED needs the message content intent, restart the bot to start indexing")
+        enabled = False
+    index = bot.get_command('index')
+    if index is not None:
+        index.enabled = enabled
+    if enabled:
+        retriever.start()
+    else:
+        retriever.stop()
+    return enabled
+
+def _readable_channels(member):
+    """
+    Channels and threads of a guild whose history a member can read.
+
+    Args:
+        member (discord.Member): Member asking.
+
+    Returns:
+        set: Channel IDs, empty for users that are not a guild member.
+    """
+    if not isinstance(member, discord.Member):
+        return set()
+    channels = list(member.guild.channels) + list(member.guild.threads)
+    readable = set()
+    for channel in channels:
+        permissions = channel.permissions_for(member)
+        if permissions.view_channel and permissions.read_message_history:
+            readable.add(channel.id)
+    return readable
+
+async def chat_reply(ctx, prompt, model=None):
+    """
+    Answer a chat prompt, shared by the prefix and slash commands.
+
+    Args:
+        ctx (Context): Message context.
+        prompt (str): User prompt.
+        model (str): Model to use, defaults to the chat model.
+    """
+    logger.info(f"{ctx.author} used chat command: {prompt}")
+    context = ''
+    if settings.RAG_ENABLED and ctx.guild is not None:
+        try:
+            # Never quote messages from channels the asker cannot see
+            context = await retriever.context(ctx.guild.id, prompt, _readable_channels(ctx.author))
+        except Exception as e:
+            # Answer without server context rather than not at all
+            logger.warning(f"Retrieval failed for chat prompt: {e}")
+    try:
+        response = await llm_handler.send_prompt(prompt, model, context)
+    except (BackendUnavailable, ModelError, *_OLLAMA_ERRORS) as e:
+        logger.warning(f"Chat prompt failed: {e!r}")
+        response = _backend_error(e)
+    await ctx.send(response)
 
 def llm_commands(bot):
     """
     LLM commands
     """
-    llm_handler = _LLMHandler(settings.LLM_ADDRESS)
+    # Always listening, RAG_ENABLED can be switched in the config file while running.
+    # Deletions are applied even while it is off so an index never serves deleted messages.
+    @bot.listen('on_message')
+    async def index_message(message):
+        if settings.RAG_ENABLED:
+            retriever.observe(message)
+
+    @bot.listen('on_raw_message_delete')
+    async def forget_message(payload):
+        if payload.guild_id is not None:
+            await retriever.forget(payload.guild_id, [payload.message_id])
+
+    @bot.listen('on_raw_bulk_message_delete')
+    async def forget_messages(payload):
+        if payload.guild_id is not None:
+            await retriever.forget(payload.guild_id, payload.message_ids)
 
     @bot.command(
         aliases=['c'],
@@ -135,10 +303,7 @@ def llm_commands(bot):
         Return:
             None: Output response to chat.
         """
-        prompt = ' '.join(args)
-        logger.info(f"{ctx.author} used chat command: {prompt}")
-        response = await llm_handler.send_prompt(prompt)
-        await ctx.send(response)
+        await chat_reply(ctx, ' '.join(args))
 
     @bot.command(
         aliases=['i'],
@@ -163,7 +328,12 @@ def llm_commands(bot):
         logger.info(f"{ctx.author} used img command: {prompt}")
         if ctx.message.attachments:
             url = ctx.message.attachments[0].url
-            response = await llm_handler.process_image_and_send_prompt(url, prompt, ctx.message.id)
+            try:
+                response = await llm_handler.process_image_and_send_prompt(url, prompt)
+            except (BackendUnavailable, ModelError, aiohttp.ClientError, *_OLLAMA_ERRORS) as e:
+                # The attachment download fails with aiohttp errors
+                logger.warning(f"Image prompt failed: {e!r}")
+                response = _backend_error(e)
             await ctx.send(response)
         else:
             await ctx.send("Please attach an image.")
@@ -188,7 +358,12 @@ def llm_commands(bot):
         """
         prompt = ' '.join(args)
         logger.info(f"{ctx.author} used dream command: {prompt}")
-        response = await llm_handler.generate_image(prompt, ctx.message.id)
+        try:
+            response = await llm_handler.generate_image(prompt, ctx.message.id)
+        except (BackendUnavailable, *_IMG_ERRORS) as e:
+            logger.warning(f"Image generation failed: {e!r}")
+            await ctx.send(_backend_error(e))
+            return
         if response == "success":
             img_path = f'{ctx.message.id}.png'
             file = discord.File(img_path)
@@ -196,3 +371,60 @@ def llm_commands(bot):
             os.remove(img_path)
         else:
             await ctx.send("Failed to generate image.")
+
+    @bot.command(
+        help="Index channel history for chat retrieval: $index [all|status]",
+        description="Embeds the message history of this channel, or of every readable channel with 'all', so $chat can use it",
+        enabled=settings.RAG_ENABLED,
+        hidden=True
+    )
+    @commands.is_owner()
+    async def index(ctx, scope: str = None):
+        """
+        Backfill the retrieval index, resuming where the last run stopped.
+
+        Args:
+            ctx (Context): Message context.
+            scope (str): None for this channel, 'all' for every readable text channel,
+                         'status' to show the index size.
+        """
+        logger.info(f"{ctx.author} used index command: {scope}")
+        if ctx.guild is None:
+            await ctx.send("Indexing only works in a server.")
+            return
+        if scope == 'status':
+            stats = retriever.index(ctx.guild.id).stats()
+            await ctx.send(f"{stats['messages']} messages from {stats['channels']} channels "
+                           f"({stats['complete']} caught up), {stats['lists']} inverted lists.")
+            return
+        if scope == 'all':
+            channels = [channel for channel in ctx.guild.text_channels
+                        if channel.permissions_for(ctx.guild.me).read_message_history]
+        else:
+            channels = [ctx.channel]
+
+        status = await ctx.send(f"Indexing {len(channels)} channel(s)...")
+        total = 0
+        edited = time.monotonic()
+        for channel in channels:
+            async def progress(added, channel=channel):
+                nonlocal edited
+                # Edit now and then, not after every batch
+                if time.monotonic() - edited >= 5:
+                    edited = time.monotonic()
+                    await status.edit(content=f"Indexing {channel.mention}: {total + added} messages so far...")
+            try:
+                total += await retriever.backfill(channel, progress)
+            except (BackendUnavailable, ModelError, *_OLLAMA_ERRORS) as e:
+                await ctx.send(f"Stopped at {channel.mention}, run again to resume: {_backend_error(e)}")
+                return
+        await status.edit(content=f"Indexed {total} new messages from {len(channels)} channel(s).")
+
+async def setup(bot):
+    """Extension entry point, also run when the extension is reloaded"""
+    llm_commands(bot)
+    configure_breakers(settings.BREAKER_FAILURES, settings.BREAKER_RESET)
+    config.on_change('llm', lambda changed: _apply_settings(bot, changed))
+    # Model warm-up can take a while, the router does it in the background
+    llm_router.start()
+    _switch_retrieval(bot)
@@ -1,30 +1,67 @@
-from proxmoxer.core import AuthenticationError
+import io
 import logging
-import os
-import paramiko
-from dotenv import load_dotenv
-from proxmoxer import ProxmoxAPI, ResourceException
+import re
+import time
+import types
 import asyncio
-import minestat
 import discord
-from mcrcon import MCRcon
+import settings
+from jobot import config
+from jobot import cluster
+from jobot.lazy import lazy_import
+from jobot.mclog import CATEGORIES, FileLogSource, LogRelay, SSHLogSource
+from jobot.telemetry import TelemetryCollector, render_chart
+from jobot.compute import compute
+from jobot.power import PowerPolicy
+from jobot.rcon import RconClient
+from jobot.resilience import breaker, configure as configure_breakers, snapshot
+from jobot.state import shared
 
-# Load environment variables
-load_dotenv()
+# Backend libraries are imported on first use to keep startup fast
+paramiko = lazy_import("paramiko")
+proxmoxer = lazy_import("proxmoxer")
+minestat = lazy_import("minestat")
 
-# Environment variable settings
-PROXMOX_HOSTNAME = os.getenv('PROXMOX_ADDRESS')
-PROXMOX_USER = os.getenv('PROXMOX_USER')
-PROXMOX_PASSWORD = os.getenv('PROXMOX_PASSWORD')
-SSH_HOSTNAME = os.getenv('SSH_HOST')
-SSH_USER = os.getenv('SSH_USER')
-SSH_KEY = os.getenv('SSHK')
-MC_HOST = os.getenv('MINECRAFT_ADDRESS')
-RCON_PASSWORD = os.getenv('MC_RCON_PASSWORD')
+# Modpack versions end up in shell commands, only allow plain version strings
+VERSION_PATTERN = re.compile(r'^[\w.\-]+$')
+
+# Files of a modpack version that an update overwrites, relative to its .minecraft directory
+UPDATE_FILES = ('world', 'server.properties', 'config/ftbbackups2.json')
 
 # Initialize logger
 logger = logging.getLogger("bot")
 
+# Kept across reloads of this module:
+#   versions: installed modpack versions as (timestamp, list), read over SSH and served from memory
+#   versions_refresh: running refresh of versions
+#   log_relay: running log relay, one per bot
+#   proxmox: logged in Proxmox API as (settings it was made with, ProxmoxAPI)
+_cache = shared('minecraft', lambda: types.SimpleNamespace(
+    versions=(0, []), versions_refresh=None, log_relay=None, proxmox=None,
+))
+
+# Circuit breakers, each call also gets a deadline covering connect and read
+_proxmox_breaker = breaker('Proxmox', timeout=settings.PROXMOX_TIMEOUT * 2, failures=(OSError,))
+_ssh_breaker = breaker('SSH', timeout=settings.SSH_TIMEOUT * 2)
+_rcon_breaker = breaker('RCON', timeout=settings.RCON_TIMEOUT * 2, failures=(OSError,))
+_status_breaker = breaker('Minecraft', timeout=settings.MC_STATUS_TIMEOUT * 2)
+
+def start_script():
+    """Path of the script that starts the server in a screen session"""
+    return settings.MC_START_SCRIPT or f"{settings.MC_SERVER_HOME}/start-screen"
+
+def log_path():
+    """Remote latest.log, defaults to the most recently used modpack directory"""
+    return settings.MC_LOG_PATH or f'"$(ls -1dt {settings.MC_SERVER_HOME}/tfg*/.minecraft | head -n 1)/logs/latest.log"'
+
+def latest_vm_status():
+    """Latest Proxmox status fetched by any shard process as (timestamp, status dict), or None"""
+    return cluster.get_store().state.get('vm_status')
+
+def _vm():
+    """Proxmox API path of the server VM"""
+    return connect_to_proxmox().nodes(settings.PROXMOX_NODE).qemu(settings.PROXMOX_VMID)
+
 def retry_proxmox_request(func):
     """
     Decorator to retry Proxmox requests on authentication error.
@@ -33,51 +70,210 @@ def retry_proxmox_request(func):
     async def wrapper(*args, **kwargs):
         try:
             return await func(*args, **kwargs)
-        except AuthenticationError as e:
+        except proxmoxer.core.AuthenticationError as e:
             logger.error(f"Authentication failed: {e}")
             raise e
-        except ResourceException as e:
+        except proxmoxer.ResourceException as e:
             logger.error(f"Proxmox resource error: {e}")
             raise e
     return wrapper
 
-# Function to establish Proxmox API connection
+# Function to establish Proxmox API connection, reused until the settings change or a request fails
 def connect_to_proxmox():
+    key = (settings.PROXMOX_ADDRESS, settings.PROXMOX_USER, settings.PROXMOX_PASSWORD, settings.PROXMOX_TIMEOUT)
+    if _cache.proxmox is not None and _cache.proxmox[0] == key:
+        return _cache.proxmox[1]
     try:
-        proxmox = ProxmoxAPI(PROXMOX_HOSTNAME, user=PROXMOX_USER, password=PROXMOX_PASSWORD, verify_ssl=False)
+        proxmox = proxmoxer.ProxmoxAPI(settings.PROXMOX_ADDRESS, user=settings.PROXMOX_USER, password=settings.PROXMOX_PASSWORD, verify_ssl=False,
+                                       timeout=settings.PROXMOX_TIMEOUT)
         logger.info("Proxmox connection established")
+        _cache.proxmox = (key, proxmox)
         return proxmox
-    except AuthenticationError as e:
+    except proxmoxer.core.AuthenticationError as e:
         logger.error(f"Failed to authenticate Proxmox user: {e}")
         raise e
     except Exception as e:
         logger.error(f"Failed to connect to Proxmox: {e}")
         raise e
 
+def _vm_request(request):
+    """
+    Run a blocking request against the server VM.
+
+    A failed request drops the connection, the next one logs in again.
+
+    Args:
+        request (callable): Called with the VM API path, returns the response.
+    """
+    try:
+        return request(_vm())
+    except Exception:
+        _cache.proxmox = None
+        raise
+
+def _fetch_vm_status():
+    """Fetch the current VM status from Proxmox, blocking"""
+    return _vm_request(lambda vm: vm.status.current.get())
+
+def _post_vm_action(action):
+    """Send a power action to the VM, blocking"""
+    _vm_request(lambda vm: getattr(vm.status, action).post())
+
+async def vm_action(action):
+    """
+    Start or stop the VM.
+
+    Args:
+        action (str): Proxmox status action, 'start' or 'stop'.
+    """
+    await _proxmox_breaker.call(asyncio.to_thread, _post_vm_action, action)
+    logger.info(f'Proxmox {settings.PROXMOX_VMID} {action} requested')
+
 @retry_proxmox_request
+async def get_vm_current():
+    """
+    Get the full current VM status, including CPU and memory use.
+
+    The latest result is kept in the cluster store so telemetry and the other shard
+    processes can reuse it.
+    """
+    vm_status = await _proxmox_breaker.call(asyncio.to_thread, _fetch_vm_status)
+    cluster.get_store().state['vm_status'] = (time.time(), vm_status)
+    return vm_status
+
 async def get_vm_status():
     """Get VM status"""
-    proxmox = connect_to_proxmox()  # Connect when function is called
-    vm_status = proxmox.nodes('pve1').qemu('105').status.current.get()
+    vm_status = await get_vm_current()
     return vm_status['status']
 
-async def execute_ssh_command(command):
-    """Execute a command via SSH to stop the server"""
+def connect_ssh():
+    """Open an SSH connection to the Minecraft VM"""
     sshcon = paramiko.SSHClient()
     sshcon.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-    sshcon.connect(SSH_HOSTNAME, username=SSH_USER, key_filename=SSH_KEY)
-    
-    # Execute the command
-    _stdin, _stdout, _stderr = sshcon.exec_command(command, get_pty=True)
-    output = _stdout.readlines()
+    sshcon.connect(settings.SSH_HOST, username=settings.SSH_USER, key_filename=settings.SSHK,
+                   timeout=settings.SSH_TIMEOUT, banner_timeout=settings.SSH_TIMEOUT, auth_timeout=settings.SSH_TIMEOUT)
+    return sshcon
+
+async def open_ssh():
+    """Open an SSH connection without blocking the event loop"""
+    return await _ssh_breaker.call(asyncio.to_thread, connect_ssh)
+
+async def execute_ssh_command(command):
+    """Execute a command via SSH to stop the server"""
+    sshcon = await open_ssh()
+    try:
+        # Execute the command
+        output = []
+        await stream_ssh_command(sshcon, command, output.append)
+    finally:
+        sshcon.close()
     logger.info(f'SSH output: {output}')
-    sshcon.close()
     return output  # Return the last line
 
+async def stream_ssh_command(sshcon, command, on_line):
+    """
+    Run a command over SSH and hand each output line to a callback as it arrives.
+
+    Carriage returns count as line breaks so progress output shows up live.
+
+    Args:
+        sshcon (SSHClient): Connected SSH client.
+        command (str): Command to run.
+        on_line (callable): Called on the event loop with each line.
+
+    Returns:
+        int: Exit status of the command.
+    """
+    loop = asyncio.get_running_loop()
+
+    def reader():
+        _stdin, _stdout, _stderr = sshcon.exec_command(command, get_pty=True)
+        channel = _stdout.channel
+        pending = ''
+        while True:
+            chunk = channel.recv(4096)
+            if not chunk:
+                break
+            pending += chunk.decode('utf-8', errors='replace')
+            *lines, pending = re.split(r'\r\n|\r|\n', pending)
+            for line in lines:
+                if line:
+                    loop.call_soon_threadsafe(on_line, line)
+        if pending:
+            loop.call_soon_threadsafe(on_line, pending)
+        return channel.recv_exit_status()
+
+    return await asyncio.to_thread(reader)
+
+class _LiveOutput:
+    """
+    Shows the tail of a command's output in one Discord message, edited every few seconds.
+    """
+    def __init__(self, ctx, title, lines=15, interval=2):
+        """
+        Args:
+            ctx (Context): Message context.
+            title (str): Text shown above the output.
+            lines (int): Number of output lines to show.
+            interval (float): Seconds between message edits.
+        """
+        self._ctx = ctx
+        self._title = title
+        self._lines = []
+        self._max_lines = lines
+        self._interval = interval
+        self._message = None
+        self._task = None
+        self._dirty = False
+
+    def add(self, line):
+        """Append an output line."""
+        self._lines.append(line)
+        del self._lines[:-self._max_lines]
+        self._dirty = True
+
+    def _render(self):
+        body = '\n'.join(self._lines)[-1800:] or '...'
+        return f"{self._title}\n```\n{body}\n```"
+
+    async def __aenter__(self):
+        self._message = await self._ctx.send(self._render())
+        self._task = asyncio.create_task(self._refresh())
+        return self
+
+    async def __aexit__(self, *exc):
+        self._task.cancel()
+        await self._show()
+
+    async def _show(self):
+        """Edit the message, continuing in a channel message once the interaction token expired."""
+        interaction = getattr(self._ctx, 'interaction', None)
+        if interaction is not None and interaction.is_expired() and isinstance(self._message, discord.WebhookMessage):
+            self._message = await self._ctx.channel.send(self._render())
+        else:
+            await self._message.edit(content=self._render())
+
+    async def _refresh(self):
+        while True:
+            await asyncio.sleep(self._interval)
+            if self._dirty:
+                self._dirty = False
+                await self._show()
+
+def _format_bytes(size):
+    """Human readable byte count"""
+    for unit in ('B', 'KiB', 'MiB', 'GiB'):
+        if size < 1024:
+            return f"{size:.1f} {unit}"
+        size /= 1024
+    return f"{size:.1f} TiB"
+
 async def execute_rcon_command(ctx, command):
     """Execute a command via rcon to mc server"""
-    with MCRcon(MC_HOST, RCON_PASSWORD) as mcr:
-        resp = mcr.command(command)
+    def run():
+        with RconClient(settings.MINECRAFT_ADDRESS, settings.MC_RCON_PASSWORD, port=settings.MC_RCON_PORT, timeout=settings.RCON_TIMEOUT) as rcon:
+            return rcon.command(command)
+    resp = await _rcon_breaker.call(asyncio.to_thread, run)
     if resp:
         await ctx.send(resp)
 
@@ -86,8 +282,10 @@ async def check_minecraft_status():
     Check Minecraft server status using MineStat.
     Returns True if online, False otherwise.
     """
-    logger.info(f'Checking MC status')
-    mc = minestat.MineStat(MC_HOST)
+    logger.debug(f'Checking MC status')
+    # Only the 1.7+ JSON ping, probing every protocol costs a Bedrock UDP query and three extra connections
+    mc = await _status_breaker.call(asyncio.to_thread, minestat.MineStat, settings.MINECRAFT_ADDRESS, settings.MINECRAFT_PORT,
+                                    timeout=settings.MC_STATUS_TIMEOUT, query_protocol=minestat.SlpProtocols.JSON)
     return mc
 
 async def check_vm_status():
@@ -123,9 +321,7 @@ async def start_server(ctx):
         vm_status = await get_vm_status()
         if vm_status == 'stopped':
             await ctx.send("Starting the server... Please wait.")
-            proxmox = connect_to_proxmox()
-            proxmox.nodes('pve1').qemu('105').status.start.post()
-            logger.info(f'Starting proxmox 105')
+            await vm_action('start')
             await asyncio.sleep(40)  # Wait for the server to start
             mc_status = await check_minecraft_status()
             if not mc_status.online:
@@ -148,7 +344,7 @@ async def start_server(ctx):
         else:
             mc_status = await check_minecraft_status()
             if not mc_status.online:
-                await execute_ssh_command("/home/applebbolin/start-screen")
+                await execute_ssh_command(start_script())
                 logger.info(f'Starting TFG server')
                 await asyncio.sleep(26)
                 for _ in range(7):
@@ -187,12 +383,10 @@ async def stop_server(ctx):
                 for _ in range(7):
                     mc_status = await check_minecraft_status()
                     if not mc_status.online:
-                        proxmox = connect_to_proxmox()
-                        proxmox.nodes('pve1').qemu('105').status.stop.post()
-                        logger.info(f'Stopping proxmox 105')
+                        await vm_action('stop')
                         await asyncio.sleep(5)
                         if await wait_vm_status("stopped"):
-                            logger.info(f'Proxmox 105 stopped')
+                            logger.info(f'Proxmox {settings.PROXMOX_VMID} stopped')
                             await ctx.send("Server stopped successfully.")
                             return
                         else: 
@@ -201,12 +395,10 @@ async def stop_server(ctx):
                             return
                     await asyncio.sleep(5)
             except:
-                proxmox = connect_to_proxmox()
-                proxmox.nodes('pve1').qemu('105').status.stop.post()
-                logger.info(f'Stopping proxmox 105')
+                await vm_action('stop')
                 await asyncio.sleep(5)
                 if await wait_vm_status("stopped"):
-                    logger.info(f'Proxmox 105 stopped')
+                    logger.info(f'Proxmox {settings.PROXMOX_VMID} stopped')
                     await ctx.send("Server stopped successfully.")
                     return
                 else: 
@@ -249,33 +441,57 @@ async def server_status(ctx, delay=0):
     embed_wait.add_field(name="Status", value="Checking", inline=True)
     waiting_embed = await ctx.send(embed=embed_wait)
     await asyncio.sleep(delay)
-    vm_status = await check_vm_status()
-    mc_status = await check_minecraft_status()
+    try:
+        vm_status = await check_vm_status()
+    except Exception as e:
+        logger.info(f"Failed to get VM status: {e}")
+        vm_status = "unreachable"
+    if vm_status == "running":
+        try:
+            mc_status = await check_minecraft_status()
+        except Exception as e:
+            logger.info(f"Failed to get server status: {e}")
+            mc_status = None
 
     if vm_status == "stopped":
         # If VM is stopped, send vm offline status
         embed=discord.Embed(title="Server Status", color=0xf66151)
         embed.add_field(name="Status", value="Offline", inline=True)
-        await waiting_embed.edit(embed=embed)
     elif vm_status == "running":
         # If VM is running, check mc server status
-        if mc_status.online:
+        if mc_status is not None and mc_status.online:
             player_status = f"{mc_status.current_players}/{mc_status.max_players}"
-            server_version = f"{mc_status.version}"
             embed=discord.Embed(title="Server Status", color=0x33d17a)
             embed.add_field(name="Status", value="Online", inline=True)
             embed.add_field(name="Player count", value=player_status, inline=True)
             embed.add_field(name="Version", value=mc_status.version, inline=True)
-            await waiting_embed.edit(embed=embed)
         else:
             embed=discord.Embed(title="Server Status", description="VM running, server offline", color=0xf66151)
             embed.add_field(name="Status", value="Unknown", inline=True)
-            await waiting_embed.edit(embed=embed)
-
     else:
         embed=discord.Embed(title="Server Status", color=0xf66151)
         embed.add_field(name="Status", value=f"VM status: {vm_status}", inline=True)
-        await waiting_embed.edit(embed=embed)
+
+    # Backend health, so a down backend is visible next to the answer it caused
+    embed.set_footer(text=backend_summary())
+    await waiting_embed.edit(embed=embed)
+
+def backend_summary():
+    """
+    One line summary of the backend circuit breakers.
+
+    Returns:
+        str: Each backend with its breaker state.
+    """
+    parts = []
+    for name, state in snapshot().items():
+        if state['state'] == 'open':
+            parts.append(f"{name} down ({state['retry_in']:.0f}s)")
+        elif state['state'] == 'half-open':
+            parts.append(f"{name} probing")
+        else:
+            parts.append(f"{name} ok")
+    return ' · '.join(parts)
 
 async def download_update(ctx):
     """
@@ -287,50 +503,386 @@ async def download_update(ctx):
     try:
         vm_status = await get_vm_status()
         if vm_status == 'running':
-            await ctx.send("Downloading update...")
-            output = await execute_ssh_command("/home/appleboblin/update.sh")
-            await ctx.send(f"{output[-1]}")
+            sshcon = await open_ssh()
+            try:
+                async with _LiveOutput(ctx, "Downloading update...") as live:
+                    status = await stream_ssh_command(sshcon, f"{settings.MC_SERVER_HOME}/update.sh", live.add)
+            finally:
+                sshcon.close()
+            logger.info(f'update.sh exited with {status}')
+            if status != 0:
+                await ctx.send(f"Update script failed with exit status {status}.")
         else:
             await ctx.send("Please start the server first.")
     except Exception as e:
         logger.info(f'Failed to execute script: {e}')
         await ctx.send(f"Failed to execute script: {e}")
 
+def _restore_update_snapshot(dst, snapshot):
+    """Shell command putting back the files an update snapshot saved of `dst`, using the snapshot up"""
+    paths = ' '.join(f'"{path}"' for path in UPDATE_FILES)
+    return (
+        f'for path in {paths}; do rm -rf "{dst}/$path" && '
+        f'if [ -e "{snapshot}/$path" ]; then mv "{snapshot}/$path" "{dst}/$path" || exit 1; fi; done && '
+        f'rm -rf "{snapshot}"'
+    )
+
 async def update_mc_server(ctx, arg1, arg2):
-    """Execute a commands via SSH to update MC server"""
-    sshcon = paramiko.SSHClient()
-    sshcon.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-    sshcon.connect(SSH_HOSTNAME, username=SSH_USER, key_filename=SSH_KEY)
-    await execute_rcon_command(ctx, "/stop")
-    await asyncio.sleep(10)
-    await ctx.send(f"Updating server...")
-    # Move world
+    """
+    Move the world from one modpack version to another and start the new version.
+
+    The world is copied with rsync while the current version is still running, so after
+    the server stops only a final delta of what changed since is copied. Downtime scales
+    with what changed rather than with the world size.
+
+    Before anything is copied, the files of the new version that the update overwrites
+    and the start script are saved in an update snapshot next to them, so `$tfg rollback`
+    can bring back the state from before the update.
+
+    Args:
+        ctx (Context): The message context.
+        arg1 (str): Current modpack version.
+        arg2 (str): New modpack version.
+    """
+    if not VERSION_PATTERN.match(arg1) or not VERSION_PATTERN.match(arg2):
+        await ctx.send("Versions may only contain letters, numbers, dots, dashes and underscores.")
+        return
+    src = f"{settings.MC_SERVER_HOME}/tfg{arg1}/.minecraft"
+    dst = f"{settings.MC_SERVER_HOME}/tfg{arg2}/.minecraft"
+    snapshot = f"{dst}/update-snapshot-{time.strftime('%Y%m%d-%H%M%S')}"
+    sync = f'rsync -a --delete --stats --info=progress2 "{src}/world/" "{dst}/world/"'
+
+    sshcon = await open_ssh()
     try:
-        move_files = (
-            f'cp -pf "/home/appleboblin/tfg{arg1}/.minecraft/server.properties" "/home/appleboblin/tfg{arg2}/.minecraft/server.properties" && '
-            f'cp -pf "/home/appleboblin/tfg{arg1}/.minecraft/config/ftbbackups2.json" "/home/appleboblin/tfg{arg2}/.minecraft/config/ftbbackups2.json" && '
-            f'mkdir -p "/home/appleboblin/tfg{arg2}/.minecraft/world/" && '
-            f'cp -rpf "/home/appleboblin/tfg{arg1}/.minecraft/world/"* "/home/appleboblin/tfg{arg2}/.minecraft/world/"'
+        # The new version is not running, its files can be copied while players are online.
+        # A full copy rather than hard links, the server rewrites region files in place.
+        paths = ' '.join(f'"{path}"' for path in UPDATE_FILES)
+        save = (
+            f'mkdir -p "{snapshot}/config" && cp -p "{start_script()}" "{snapshot}/start-script" && '
+            f'echo "{arg1}" > "{snapshot}/previous-version" && '
+            f'for path in {paths}; do if [ -e "{dst}/$path" ]; then '
+            f'cp -a --reflink=auto "{dst}/$path" "{snapshot}/$path" || exit 1; fi; done'
+        )
+        status = await stream_ssh_command(sshcon, save, lambda line: None)
+        if status != 0:
+            await stream_ssh_command(sshcon, f'rm -rf "{snapshot}"', lambda line: None)
+            await ctx.send(f"Failed to snapshot v{arg2} (exit status {status}), update aborted, v{arg1} is still running.")
+            return
+        logger.info(f'snapshot of {dst} taken at {snapshot}')
+
+        # Bulk copy while players are still online, the files may change under rsync
+        prepare = (
+            f'cp -pf "{src}/server.properties" "{dst}/server.properties" && '
+            f'cp -pf "{src}/config/ftbbackups2.json" "{dst}/config/ftbbackups2.json" && '
+            f'mkdir -p "{dst}/world/"'
         )
-        _stdin, _stdout, _stderr = sshcon.exec_command(move_files, get_pty=True)
-        output = _stdout.readlines()
-        logger.info(f'copying world from {arg1} to {arg2}: {output}')
-        _stdin, _stdout, _stderr = sshcon.exec_command('screen -X -S minecraft quit', get_pty=True)
-        output = _stdout.readlines()
+        status = await stream_ssh_command(sshcon, prepare, lambda line: None)
+        if status == 0:
+            async with _LiveOutput(ctx, f"Copying world from v{arg1} to v{arg2}, the server keeps running...") as live:
+                status = await stream_ssh_command(sshcon, sync, live.add)
+        logger.info(f'pre-syncing world from {arg1} to {arg2} exited with {status}')
+        if status != 0:
+            await stream_ssh_command(sshcon, _restore_update_snapshot(dst, snapshot), lambda line: None)
+            await ctx.send(f"Failed to copy the world (exit status {status}), update aborted, v{arg1} is still running.")
+            return
+
+        await execute_rcon_command(ctx, "/stop")
+        await asyncio.sleep(10)
+        await ctx.send(f"Updating server...")
+        started = time.monotonic()
+
+        # Final delta, only what changed since the copy above
+        stats = []
+        async with _LiveOutput(ctx, f"Syncing world changes from v{arg1} to v{arg2}...") as live:
+            def on_line(line):
+                live.add(line)
+                stats.append(line)
+            status = await stream_ssh_command(sshcon, sync, on_line)
+        logger.info(f'syncing world from {arg1} to {arg2} exited with {status}')
+
+        if status != 0:
+            # The old world was only read, it starts again as it stopped
+            await stream_ssh_command(sshcon, _restore_update_snapshot(dst, snapshot), lambda line: None)
+            await execute_ssh_command(start_script())
+            await ctx.send(f"World sync failed (exit status {status}), restarted v{arg1}.")
+            return
+
+        # Keep the newest snapshots only
+        prune = f'ls -1d "{dst}"/update-snapshot-* | head -n -{settings.MC_WORLD_SNAPSHOTS} | xargs -r rm -rf'
+        await stream_ssh_command(sshcon, prune, lambda line: None)
+
+        transferred = 0
+        for line in stats:
+            match = re.match(r'Total transferred file size: ([\d,.]+) bytes', line)
+            if match:
+                transferred = int(re.sub(r'[,.]', '', match.group(1)))
+
+        await stream_ssh_command(sshcon, 'screen -X -S minecraft quit', lambda line: None)
         logger.info(f'killed minecraft screen instance')
-        replace_starter = f"sed -i 's/{arg1}/{arg2}/g' /home/appleboblin/start-screen"
-        _stdin, _stdout, _stderr = sshcon.exec_command(replace_starter, get_pty=True)
-        output = _stdout.readlines()
+        replace_starter = f"sed -i 's/{arg1}/{arg2}/g' {start_script()}"
+        await stream_ssh_command(sshcon, replace_starter, lambda line: None)
         logger.info(f'update start-screen script')
-        _stdin, _stdout, _stderr = sshcon.exec_command('/home/appleboblin/start-screen', get_pty=True)
-        output = _stdout.readlines()
+        await stream_ssh_command(sshcon, start_script(), lambda line: None)
         logger.info(f'run start-screen script')
-        await ctx.send(f"Updated modpack from v{arg1} to v{arg2}, starting server.")
+        elapsed = time.monotonic() - started
+        await ctx.send(
+            f"Updated modpack from v{arg1} to v{arg2} "
+            f"({_format_bytes(transferred)} copied, {elapsed:.1f}s offline), starting server."
+        )
         await server_status(ctx, delay=70)
     except Exception as e:
         await ctx.send(f"Failed to upgrade modpack: {e}")
-    sshcon.close()
+    finally:
+        sshcon.close()
+
+async def rollback_mc_world(ctx, version):
+    """
+    Undo the newest update to a modpack version.
+
+    The server is stopped, the files of `version` and the start script are put back as
+    they were before the update, and the version updated from is started again with
+    its world as it was when the update stopped it.
+
+    Args:
+        ctx (Context): The message context.
+        version (str): Modpack version that was updated to.
+    """
+    if not VERSION_PATTERN.match(version):
+        await ctx.send("Versions may only contain letters, numbers, dots, dashes and underscores.")
+        return
+    dst = f"{settings.MC_SERVER_HOME}/tfg{version}/.minecraft"
+    # The pty mixes stderr into the output, only a line with the marker names the snapshot
+    marker = 'update-snapshot:'
+    find = (
+        f'snapshot=$(ls -1d "{dst}"/update-snapshot-* 2>/dev/null | tail -n 1) && [ -n "$snapshot" ] && '
+        f'echo "{marker}$snapshot $(cat "$snapshot/previous-version")"'
+    )
+    try:
+        if await get_vm_status() != 'running':
+            await ctx.send("Please start the server first.")
+            return
+        output = await execute_ssh_command(find)
+        found = [line[len(marker):].split() for line in output if line.startswith(marker)]
+        if not found or len(found[-1]) != 2:
+            await ctx.send(f"No update snapshot found for v{version}.")
+            return
+        snapshot, previous = found[-1]
+        if not VERSION_PATTERN.match(previous):
+            await ctx.send(f"Snapshot `{snapshot.split('/')[-1]}` does not name a valid previous version.")
+            return
 
+        await ctx.send(f"Rolling back from v{version} to v{previous}...")
+        try:
+            await execute_rcon_command(ctx, "/stop")
+            await asyncio.sleep(10)
+        except Exception as e:
+            # A version that fails to start is the usual reason to roll back
+            logger.info(f'Server did not take /stop before rollback: {e}')
+        restore = (
+            f'screen -X -S minecraft quit; '
+            f'cp -p "{snapshot}/start-script" "{start_script()}" && {_restore_update_snapshot(dst, snapshot)}'
+        )
+        sshcon = await open_ssh()
+        try:
+            status = await stream_ssh_command(sshcon, restore, lambda line: None)
+            if status != 0:
+                await ctx.send(f"Failed to restore the snapshot (exit status {status}), the server is stopped.")
+                return
+            await stream_ssh_command(sshcon, start_script(), lambda line: None)
+        finally:
+            sshcon.close()
+        logger.info(f'rolled back {version} to {previous} from {snapshot}')
+        await ctx.send(f"Rolled back from v{version} to v{previous}, starting server.")
+        await server_status(ctx, delay=70)
+    except Exception as e:
+        logger.info(f'Failed to roll back: {e}')
+        await ctx.send(f"Failed to roll back: {e}")
+
+async def refresh_modpack_versions():
+    """
+    Read the installed modpack versions from the server directories.
+
+    Returns:
+        list: Versions, newest directory first.
+    """
+    output = await execute_ssh_command(f'ls -1dt {settings.MC_SERVER_HOME}/tfg*/')
+    versions = []
+    for line in output:
+        name = line.rstrip('/').rsplit('/', 1)[-1][len('tfg'):]
+        if name and VERSION_PATTERN.match(name):
+            versions.append(name)
+    _cache.versions = (time.time(), versions)
+    return versions
+
+def modpack_versions(max_age=300):
+    """
+    Cached modpack versions, for autocomplete which has to answer within 3 seconds.
+
+    A stale cache is refreshed in the background when the VM is known to be running,
+    the cached list is returned straight away either way.
+
+    Args:
+        max_age (float): Seconds after which the cache is refreshed.
+
+    Returns:
+        list: Versions, newest first.
+    """
+    updated, versions = _cache.versions
+    latest = latest_vm_status()
+    running = latest is not None and latest[1].get('status') == 'running'
+    refresh = _cache.versions_refresh
+    if running and time.time() - updated > max_age and (refresh is None or refresh.done()):
+        _cache.versions_refresh = asyncio.create_task(refresh_modpack_versions())
+        _cache.versions_refresh.add_done_callback(lambda task: task.cancelled() or task.exception())
+    return versions
+
+async def sample_server():
+    """
+    Take one telemetry sample of the VM and the Minecraft server.
+
+    A Proxmox status fetched by a command in any shard process within the last
+    sampling interval is reused instead of asking Proxmox again.
+
+    Returns:
+        tuple: (metrics dict, MOTD or None).
+    """
+    latest = latest_vm_status()
+    if latest is not None and time.time() - latest[0] < settings.MC_TELEMETRY_INTERVAL / 2:
+        vm_status = latest[1]
+    else:
+        vm_status = await get_vm_current()
+    metrics = {}
+    if vm_status.get('status') == 'running':
+        metrics['vm'] = 1
+        metrics['cpu'] = vm_status.get('cpu', 0) * 100
+        if vm_status.get('maxmem'):
+            metrics['mem'] = vm_status.get('mem', 0) / vm_status['maxmem'] * 100
+        mc_status = await check_minecraft_status()
+        metrics['online'] = 1 if mc_status.online else 0
+        if mc_status.online:
+            metrics['players'] = mc_status.current_players
+            metrics['latency'] = mc_status.latency
+            return metrics, mc_status.stripped_motd
+    else:
+        metrics['vm'] = 0
+        metrics['online'] = 0
+        metrics['players'] = 0
+    return metrics, None
+
+# Shared collector, started by the primary process
+mc_telemetry = shared('mc_telemetry', lambda: TelemetryCollector(
+    sample_server, interval=settings.MC_TELEMETRY_INTERVAL, path=settings.MC_TELEMETRY_FILE,
+    save_every=settings.MC_TELEMETRY_SAVE_EVERY,
+))
+mc_telemetry.bind(sample_server)
+
+# Idle shutdown and pre-start driven by the telemetry history, started with the collector
+mc_power = shared('mc_power', lambda: PowerPolicy(
+    mc_telemetry.series, start_server, stop_server,
+    idle_timeout=settings.MC_IDLE_SHUTDOWN * 60,
+    grace=settings.MC_START_GRACE * 60,
+    lead=settings.MC_PRESTART_LEAD * 60,
+    threshold=settings.MC_PRESTART_PLAYERS,
+    interval=max(settings.MC_TELEMETRY_INTERVAL, 60),
+    stale=settings.MC_TELEMETRY_INTERVAL * 5,
+    channel_id=settings.MC_POWER_CHANNEL or None,
+))
+mc_power.bind(start_server, stop_server)
+
+async def describe_power():
+    """Job run on the primary, the other shards only have an idle copy of the power policy"""
+    return mc_power.describe()
+
+async def note_power_manual(action, when):
+    """Job run on the primary, where the power policy runs, for a start or stop done on any shard"""
+    mc_power.note_manual(action, when)
+
+# Telemetry periods offered by $tfg stats, in seconds
+STATS_WINDOWS = {'day': 86400, 'week': 7 * 86400}
+
+async def render_stats(period):
+    """
+    Draw the server history of the primary process.
+
+    Args:
+        period (str): Key of STATS_WINDOWS.
+
+    Returns:
+        bytes: PNG chart, None when there is not enough data yet.
+    """
+    series = mc_telemetry.series
+    times, values = series.query(STATS_WINDOWS[period])
+    if len(times) < 2:
+        return None
+    title = f"TFG server, last {period}"
+    if series.motd:
+        title += f" - {series.motd}"
+    # Rendering is CPU work, always done in the compute pool
+    return await compute.run(render_chart, times, values, title, size=None)
+
+async def server_stats(ctx, period='day'):
+    """
+    Send a chart of the server history kept in memory.
+
+    Args:
+        ctx (Context): The message context.
+        period (str): 'day' or 'week'.
+    """
+    if period not in STATS_WINDOWS:
+        await ctx.send("Please use 'stats day' or 'stats week'.")
+        return
+    try:
+        if getattr(ctx.bot, 'is_primary', True):
+            image = await render_stats(period)
+        else:
+            # Only the primary process samples, it draws the chart for the other shards
+            image = await cluster.submit('mc_stats', period, timeout=60)
+    except TimeoutError:
+        await ctx.send("The shard collecting server stats did not answer, please try again later.")
+        return
+    except Exception as e:
+        logger.info(f'Failed to draw server stats: {e}')
+        await ctx.send(f"Failed to draw server stats: {e}")
+        return
+    if image is None:
+        await ctx.send("Not enough data collected yet.")
+        return
+    await ctx.send(file=discord.File(io.BytesIO(image), filename=f"tfg-{period}.png"))
+
+async def log_stream(ctx, action=None, *categories):
+    """
+    Start or stop relaying server log events to the current channel.
+
+    Args:
+        ctx (Context): The message context.
+        action (str): 'start' or 'stop'.
+        categories (str): Event categories to relay, defaults to joins, leaves, deaths, TPS warnings and errors.
+    """
+    if action == 'stop':
+        if _cache.log_relay is None or not _cache.log_relay.running:
+            await ctx.send("Log stream is not running.")
+            return
+        _cache.log_relay.stop()
+        _cache.log_relay = None
+        await ctx.send("Log stream stopped.")
+    elif action == 'start':
+        unknown = [category for category in categories if category not in CATEGORIES]
+        if unknown:
+            await ctx.send(f"Unknown categories: {', '.join(unknown)}. Available: {', '.join(CATEGORIES)}.")
+            return
+        if _cache.log_relay is not None:
+            _cache.log_relay.stop()
+        if settings.MC_LOG_FILE:
+            source = FileLogSource(settings.MC_LOG_FILE)
+        else:
+            source = SSHLogSource(connect_ssh, log_path())
+        options = {'categories': categories} if categories else {}
+        relay = _cache.log_relay = LogRelay(source, ctx.channel.send, **options)
+        relay.start()
+        logger.info(f"Log stream started in {ctx.channel} for {sorted(relay.categories)}")
+        await ctx.send(f"Streaming server log ({', '.join(sorted(relay.categories))}) to this channel.")
+    else:
+        await ctx.send("Please use 'log start [categories]' or 'log stop'.")
 
 def mc_commands(bot):
     """
@@ -366,8 +918,10 @@ def mc_commands(bot):
 
         # Execute corresponding command function
         if cmd == 'start':
+            await cluster.submit('mc_power_manual', 'start', time.time())
             await start_server(ctx)
         elif cmd == 'stop':
+            await cluster.submit('mc_power_manual', 'stop', time.time())
             await stop_server(ctx)
         elif cmd == 'restart':
             await restart_server(ctx)
@@ -385,5 +939,53 @@ def mc_commands(bot):
             arg1, arg2 = args[0], args[1]
             print(arg1 + ' ' + arg2)
             await update_mc_server(ctx, arg1, arg2)
+        elif cmd == 'stats':
+            await server_stats(ctx, *args[:1])
+        elif cmd == 'log':
+            await log_stream(ctx, *args)
+        elif cmd == 'power':
+            if getattr(ctx.bot, 'is_primary', True):
+                await ctx.send(mc_power.describe())
+            else:
+                try:
+                    await ctx.send(await cluster.submit('mc_power_describe', timeout=30))
+                except TimeoutError:
+                    await ctx.send("The shard running the power policy did not answer, please try again later.")
+        elif cmd == 'rollback':
+            if not args:
+                await ctx.send("Please provide the version to roll back.")
+                return
+            await rollback_mc_world(ctx, args[0])
         else:
-            await ctx.send("Invalid command. Please use 'start', 'stop', 'restart', 'command', 'downlaod'.")
+            await ctx.send("Invalid command. Please use 'start', 'stop', 'restart', 'command', 'downlaod', 'update', 'rollback', 'log', 'stats', 'power'.")
+
+def _apply_settings(bot):
+    """Push settings into the breakers, collector and power policy kept across reloads"""
+    configure_breakers(settings.BREAKER_FAILURES, settings.BREAKER_RESET)
+    _proxmox_breaker.timeout = settings.PROXMOX_TIMEOUT * 2
+    _ssh_breaker.timeout = settings.SSH_TIMEOUT * 2
+    _rcon_breaker.timeout = settings.RCON_TIMEOUT * 2
+    _status_breaker.timeout = settings.MC_STATUS_TIMEOUT * 2
+    mc_telemetry.interval = settings.MC_TELEMETRY_INTERVAL
+    mc_telemetry.save_every = settings.MC_TELEMETRY_SAVE_EVERY
+    mc_power.idle_timeout = settings.MC_IDLE_SHUTDOWN * 60
+    mc_power.grace = settings.MC_START_GRACE * 60
+    mc_power.lead = settings.MC_PRESTART_LEAD * 60
+    mc_power.threshold = settings.MC_PRESTART_PLAYERS
+    mc_power.channel_id = settings.MC_POWER_CHANNEL or None
+    # Only one process samples the server when running shard clusters
+    if getattr(bot, 'is_primary', True):
+        mc_telemetry.start()
+        if mc_power.enabled:
+            mc_power.start(bot)
+        else:
+            mc_power.stop()
+
+async def setup(bot):
+    """Extension entry point, also run when the extension is reloaded"""
+    mc_commands(bot)
+    cluster.handle('mc_power_manual', note_power_manual)
+    cluster.handle('mc_stats', render_stats)
+    cluster.handle('mc_power_describe', describe_power)
+    _apply_settings(bot)
+    config.on_change('minecraft', lambda changed: _apply_settings(bot))
@@ -2,6 +2,8 @@ import logging
 from discord.ext import commands
 import discord
 import os
+import aiofiles
+from jobot.compute import compute, format_history
 
 # Initialize logger
 logger = logging.getLogger("bot")
@@ -173,26 +175,34 @@ def misc_commands(bot):
         # Generate a unique filename
         file_name = get_unique_filename(base_name, ".txt")
 
-        # Create/open the file for writing with utf-8 encoding
-        with open(file_name, 'w', encoding='utf-8') as file:
-            # List to store messages
-            messages = []
+        # List to store messages
+        rows = []
+        size = 0
 
-            # Scrape messages (oldest to newest)
-            async for message in channel.history(limit=None, oldest_first=True):
-                if message.content.strip():  # Only save non-empty messages
-                    messages.append(f"[{message.created_at}] {message.author}: {message.content}")
+        # Scrape messages (oldest to newest)
+        async for message in channel.history(limit=None, oldest_first=True):
+            if message.content.strip():  # Only save non-empty messages
+                rows.append((message.created_at, str(message.author), message.content))
+                size += len(message.content)
 
-            # If there are no messages, notify the user
-            if not messages:
-                await ctx.send(f"No messages found in {channel.mention}.")
-                return
+        # If there are no messages, notify the user
+        if not rows:
+            await ctx.send(f"No messages found in {channel.mention}.")
+            return
+
+        # Format the history off the event loop when it is large
+        text = await compute.run(format_history, rows, size=size)
 
-            # Write the messages in order to the file (oldest first)
-            file.write('\n'.join(messages))
+        # Write the messages in order to the file (oldest first) with utf-8 encoding
+        async with aiofiles.open(file_name, 'w', encoding='utf-8') as file:
+            await file.write(text)
 
         # Send a confirmation message
         await ctx.send(f"Messages from {channel.mention} have been saved to `{file_name}`.")
 
         # Send the file in Discord
         await ctx.send(file=discord.File(file_name))
+
+async def setup(bot):
+    """Extension entry point, also run when the extension is reloaded"""
+    misc_commands(bot)
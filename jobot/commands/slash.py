@@ -0,0 +1,197 @@
+# slash.py
+import logging
+import discord
+from discord import app_commands
+from discord.ext import commands
+from discord.ext.commands.view import StringView
+from jobot.mclog import CATEGORIES
+
+# Initialize logger
+logger = logging.getLogger("bot")
+
+
+def _extension(client, name):
+    """
+    Current module of a command extension.
+
+    Looked up on every call, $reload replaces the module object and anything imported
+    from the old one would keep running the old code.
+
+    Args:
+        client (commands.Bot): Bot the extensions are loaded on.
+        name (str): Module name in jobot.commands.
+
+    Returns:
+        module: The loaded module, None when the extension is not loaded.
+    """
+    return client.extensions.get(f'jobot.commands.{name}')
+
+
+def _quote(arg):
+    """Quote an argument so the prefix command parser reads it back as one word."""
+    return '"' + arg.replace('"', '\\"') + '"'
+
+
+async def _invoke(interaction, bot, name, *args, attachments=(), handler=None):
+    """
+    Defer an interaction and run a prefix command for it.
+
+    The command goes through its checks, cooldowns and converters as if it had been
+    typed with the given arguments. Its context answers with followups, and with
+    channel messages once the interaction token expired after 15 minutes.
+
+    Args:
+        interaction (discord.Interaction): Incoming interaction.
+        bot (commands.Bot): Bot the prefix command is registered on.
+        name (str): Prefix command name, a disabled prefix command disables the slash command too.
+        args (str): Arguments as the prefix command would receive them.
+        attachments (list): Attachments handed to the handler as message attachments.
+        handler (callable): Coroutine function taking the context, replaces the prefix command
+                            callback after the command's checks passed.
+    """
+    # Acknowledge within Discord's 3 second window, the command answers with followups
+    await interaction.response.defer(thinking=True)
+    ctx = await commands.Context.from_interaction(interaction)
+    ctx.message.attachments = list(attachments)
+    ctx.command = bot.get_command(name)
+    if ctx.command is None:
+        await ctx.send("This command is disabled.")
+        return
+    ctx.invoked_with = name
+    ctx.view = StringView(' '.join(_quote(arg) for arg in args))
+    try:
+        if handler is None:
+            await ctx.command.invoke(ctx)
+        elif await ctx.command.can_run(ctx):
+            await handler(ctx)
+        else:
+            raise commands.CheckFailure(f"The check functions for command {name} failed.")
+    except commands.DisabledCommand:
+        await ctx.send("This command is disabled.")
+    except (commands.CheckFailure, commands.CommandOnCooldown, commands.UserInputError) as e:
+        await ctx.send(str(e))
+    except Exception as e:
+        error = getattr(e, 'original', e)
+        logger.error(f"/{name} failed for {interaction.user}: {error}")
+        await ctx.send(f"Command failed: {error}")
+
+
+def _matches(values, current, limit=25):
+    """Autocomplete choices containing the typed text."""
+    current = current.lower()
+    return [app_commands.Choice(name=value, value=value) for value in values if current in value.lower()][:limit]
+
+
+async def _model_autocomplete(interaction, current):
+    llm = _extension(interaction.client, 'llm')
+    return _matches(llm.llm_router.models if llm else [], current)
+
+
+async def _version_autocomplete(interaction, current):
+    minecraft = _extension(interaction.client, 'minecraft')
+    return _matches(minecraft.modpack_versions() if minecraft else [], current)
+
+
+async def _category_autocomplete(interaction, current):
+    # Completes the last of a space separated list
+    *chosen, last = current.split(' ') if current else ['']
+    prefix = ' '.join(chosen + [''])
+    return _matches([prefix + category for category in CATEGORIES if category not in chosen and category.startswith(last)], '')
+
+
+def slash_commands(bot):
+    """
+    Slash commands, each runs the prefix command handler of the same name
+    """
+    tfg = app_commands.Group(name="tfg", description="Control TFG server")
+
+    @tfg.command(name="status", description="Show the server status")
+    async def tfg_status(interaction: discord.Interaction):
+        await _invoke(interaction, bot, 'tfg')
+
+    @tfg.command(name="start", description="Start the server")
+    async def tfg_start(interaction: discord.Interaction):
+        await _invoke(interaction, bot, 'tfg', 'start')
+
+    @tfg.command(name="stop", description="Stop the server")
+    async def tfg_stop(interaction: discord.Interaction):
+        await _invoke(interaction, bot, 'tfg', 'stop')
+
+    @tfg.command(name="restart", description="Restart the server")
+    async def tfg_restart(interaction: discord.Interaction):
+        await _invoke(interaction, bot, 'tfg', 'restart')
+
+    @tfg.command(name="command", description="Run a console command over RCON")
+    @app_commands.describe(command="Console command")
+    async def tfg_command(interaction: discord.Interaction, command: str):
+        await _invoke(interaction, bot, 'tfg', 'command', *command.split())
+
+    @tfg.command(name="download", description="Download the latest modpack update")
+    async def tfg_download(interaction: discord.Interaction):
+        await _invoke(interaction, bot, 'tfg', 'download')
+
+    @tfg.command(name="update", description="Move the world to a new modpack version")
+    @app_commands.describe(old="Current modpack version", new="New modpack version")
+    @app_commands.autocomplete(old=_version_autocomplete, new=_version_autocomplete)
+    async def tfg_update(interaction: discord.Interaction, old: str, new: str):
+        await _invoke(interaction, bot, 'tfg', 'update', old, new)
+
+    @tfg.command(name="rollback", description="Undo the newest update to a modpack version")
+    @app_commands.describe(version="Modpack version that was updated to")
+    @app_commands.autocomplete(version=_version_autocomplete)
+    async def tfg_rollback(interaction: discord.Interaction, version: str):
+        await _invoke(interaction, bot, 'tfg', 'rollback', version)
+
+    @tfg.command(name="stats", description="Chart of the server history")
+    @app_commands.choices(period=[app_commands.Choice(name='day', value='day'),
+                                  app_commands.Choice(name='week', value='week')])
+    async def tfg_stats(interaction: discord.Interaction, period: str = 'day'):
+        await _invoke(interaction, bot, 'tfg', 'stats', period)
+
+    @tfg.command(name="log", description="Relay server log events to this channel")
+    @app_commands.describe(action="start or stop", categories="Space separated event categories")
+    @app_commands.choices(action=[app_commands.Choice(name='start', value='start'),
+                                  app_commands.Choice(name='stop', value='stop')])
+    @app_commands.autocomplete(categories=_category_autocomplete)
+    async def tfg_log(interaction: discord.Interaction, action: str, categories: str = ''):
+        await _invoke(interaction, bot, 'tfg', 'log', action, *categories.split())
+
+    @tfg.command(name="power", description="Show automatic power management")
+    async def tfg_power(interaction: discord.Interaction):
+        await _invoke(interaction, bot, 'tfg', 'power')
+
+    bot.tree.add_command(tfg)
+
+    @bot.tree.command(name="chat", description="Send a text prompt to LLM")
+    @app_commands.describe(prompt="Prompt", model="Model to use, defaults to the chat model")
+    @app_commands.autocomplete(model=_model_autocomplete)
+    async def chat(interaction: discord.Interaction, prompt: str, model: str = None):
+        await _invoke(interaction, bot, 'chat', handler=lambda ctx: _extension(bot, 'llm').chat_reply(ctx, prompt, model))
+
+    @bot.tree.command(name="img", description="Send a text prompt and image to LLM")
+    @app_commands.describe(prompt="Prompt", image="Image to describe")
+    async def img(interaction: discord.Interaction, prompt: str, image: discord.Attachment):
+        await _invoke(interaction, bot, 'img', *prompt.split(), attachments=[image])
+
+    @bot.tree.command(name="dream", description="Generate image with text prompt")
+    @app_commands.describe(prompt="Prompt")
+    async def dream(interaction: discord.Interaction, prompt: str):
+        await _invoke(interaction, bot, 'dream', *prompt.split())
+
+    @bot.tree.command(name="models", description="List the language models that are loaded")
+    async def models(interaction: discord.Interaction):
+        llm = _extension(bot, 'llm')
+        loaded = llm.llm_router.models if llm else []
+        await interaction.response.send_message(', '.join(loaded) if loaded else "No models loaded.", ephemeral=True)
+
+    @bot.tree.command(name="ping", description="Sends pong")
+    async def ping(interaction: discord.Interaction):
+        await _invoke(interaction, bot, 'ping')
+
+    @bot.tree.command(name="add", description="Adds two number together")
+    async def add(interaction: discord.Interaction, one: str, two: str):
+        await _invoke(interaction, bot, 'add', one, two)
+
+async def setup(bot):
+    """Extension entry point, also run when the extension is reloaded"""
+    slash_commands(bot)
@@ -0,0 +1,219 @@
+# compute.py
+import asyncio
+import base64
+import json
+import logging
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+# Initialize logger
+logger = logging.getLogger("bot")
+
+
+def _warm():
+    """Import heavy modules in a worker so the first real job does not pay for it."""
+    try:
+        import pyvips  # noqa: F401
+    except (ImportError, OSError):
+        pass
+    try:
+        import matplotlib
+        matplotlib.use('Agg')
+        import matplotlib.pyplot  # noqa: F401
+    except ImportError:
+        pass
+    return os.getpid()
+
+
+def _shared_call(func, name, size):
+    """
+    Run a bytes-to-bytes function on data passed through shared memory.
+
+    The input is read in place from the block the parent created and the result is
+    copied into a new block. Each side copies the payload once instead of pickling it
+    through the pool's pipe, it is not zero-copy.
+
+    Args:
+        func (callable): Function taking a bytes-like object and returning bytes.
+        name (str): Name of the input shared memory block.
+        size (int): Length of the input.
+
+    Returns:
+        tuple: (name, size) of the output shared memory block.
+    """
+    source = shared_memory.SharedMemory(name=name)
+    try:
+        with source.buf[:size] as data:
+            result = func(data)
+    finally:
+        source.close()
+    target = shared_memory.SharedMemory(create=True, size=max(len(result), 1))
+    try:
+        target.buf[:len(result)] = result
+    except BaseException:
+        target.unlink()
+        raise
+    finally:
+        target.close()
+    return target.name, len(result)
+
+
+def _discard_output(future):
+    """Unlink the output block of a _shared_call nobody is waiting for anymore."""
+    if future.cancelled() or future.exception() is not None:
+        return
+    name, _ = future.result()
+    try:
+        block = shared_memory.SharedMemory(name=name)
+    except FileNotFoundError:
+        return
+    block.close()
+    block.unlink()
+
+
+def transcode_image(data):
+    """
+    Convert an image to JPEG.
+
+    Args:
+        data (bytes): Image in any format libvips can read.
+
+    Returns:
+        bytes: JPEG encoded image.
+    """
+    import pyvips
+    image = pyvips.Image.new_from_buffer(data, "", access="sequential")
+    return image.write_to_buffer(".jpg")
+
+
+def decode_sd_image(data):
+    """
+    Decode the first image of a Stable Diffusion txt2img response.
+
+    Args:
+        data (bytes): Raw JSON response body.
+
+    Returns:
+        bytes: Decoded image.
+
+    Raises:
+        KeyError: The response has no images.
+    """
+    payload = json.loads(bytes(data))
+    return base64.b64decode(payload['images'][0])
+
+
+def format_history(rows):
+    """
+    Format scraped messages as one line each.
+
+    Args:
+        rows (list): (created_at, author, content) tuples.
+
+    Returns:
+        str: Formatted history.
+    """
+    return '\n'.join(f"[{created_at}] {author}: {content}" for created_at, author, content in rows)
+
+
+class ComputeService:
+    """
+    Shared process pool for CPU-bound work.
+
+    Small jobs run inline since handing them to another process costs more than doing
+    them, big jobs go to a pool of warm worker processes so the event loop stays free.
+    """
+    def __init__(self, workers=None, inline_threshold=64 * 1024):
+        """
+        Args:
+            workers (int): Number of worker processes, defaults to the CPU count.
+            inline_threshold (int): Jobs smaller than this many bytes run inline.
+        """
+        self._workers = workers or os.cpu_count() or 1
+        self._inline_threshold = inline_threshold
+        self._pool = None
+
+    def configure(self, workers=None, inline_threshold=None):
+        """Change pool settings, only applies to a pool that has not started yet."""
+        if workers:
+            self._workers = workers
+        if inline_threshold is not None:
+            self._inline_threshold = inline_threshold
+
+    def start(self):
+        """Create the pool and start every worker."""
+        if self._pool is not None:
+            return
+        self._pool = ProcessPoolExecutor(
+            max_workers=self._workers,
+            mp_context=multiprocessing.get_context("spawn"),
+        )
+        for _ in range(self._workers):
+            self._pool.submit(_warm)
+        logger.info(f"Compute pool started with {self._workers} workers")
+
+    def shutdown(self):
+        """Stop the workers, queued jobs are cancelled and running ones finish."""
+        if self._pool is not None:
+            self._pool.shutdown(wait=True, cancel_futures=True)
+            self._pool = None
+
+    async def run(self, func, *args, size=0):
+        """
+        Run a function inline or in the pool depending on the job size.
+
+        Args:
+            func (callable): Picklable module-level function.
+            args: Picklable arguments.
+            size (int): Approximate size of the job in bytes, None always uses the pool.
+
+        Returns:
+            Any: Return value of func.
+        """
+        if size is not None and size < self._inline_threshold:
+            return func(*args)
+        self.start()
+        return await asyncio.get_running_loop().run_in_executor(self._pool, func, *args)
+
+    async def run_shared(self, func, data):
+        """
+        Run a bytes-to-bytes function, passing big payloads through shared memory.
+
+        The input is copied into a shared block and the result copied out of one, which
+        avoids pickling both ways but still costs a copy on each side.
+
+        Args:
+            func (callable): Picklable module-level function taking a bytes-like object.
+            data (bytes): Input payload.
+
+        Returns:
+            bytes: Return value of func.
+        """
+        if len(data) < self._inline_threshold:
+            return func(data)
+        self.start()
+        source = shared_memory.SharedMemory(create=True, size=len(data))
+        try:
+            source.buf[:len(data)] = data
+            future = self._pool.submit(_shared_call, func, source.name, len(data))
+            try:
+                name, size = await asyncio.wrap_future(future)
+            except asyncio.CancelledError:
+                # A worker that already started still creates the output block
+                future.add_done_callback(_discard_output)
+                raise
+        finally:
+            source.close()
+            source.unlink()
+        target = shared_memory.SharedMemory(name=name)
+        try:
+            return bytes(target.buf[:size])
+        finally:
+            target.close()
+            target.unlink()
+
+
+# Shared instance, started by the bot on startup
+compute = ComputeService()
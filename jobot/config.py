@@ -0,0 +1,169 @@
+# config.py
+import asyncio
+import logging
+import os
+import tomllib
+
+# Initialize logger
+logger = logging.getLogger("bot")
+
+# Settings that are only read while the process starts
+RESTART_ONLY = {
+    'DISCORD_API_TOKEN', 'PREFIX_COMMANDS', 'SHARDING', 'SHARD_COUNT', 'SHARD_PROCESSES',
+    'COMPUTE_WORKERS', 'LOG_FILE', 'LOG_FORMAT', 'LOG_MAX_BYTES', 'LOG_ROTATE_WHEN',
+    'LOG_BACKUP_COUNT', 'LOG_RATE_LIMIT', 'LOGGING_CONFIG', 'CONFIG_FILE', 'CONFIG_POLL',
+}
+
+# Settings read once while the bot starts, the config file may set them but a later
+# change only takes effect after a restart
+STARTUP_ONLY = {
+    'RAG_DIR', 'RAG_FLUSH_INTERVAL', 'LLM_HEALTH_INTERVAL', 'MC_TELEMETRY_FILE', 'LOOP_WATCHDOG',
+    'LOOP_STALL_THRESHOLD', 'SYNC_APP_COMMANDS', 'APP_COMMAND_GUILD', 'COMPUTE_INLINE_BYTES',
+}
+
+# Callbacks run after a change, by owner so a reloaded module replaces its own
+_hooks = {}
+
+
+def on_change(owner, callback):
+    """
+    Run a callback whenever the config file changes settings.
+
+    Args:
+        owner (str): Name of the registering module, registering again replaces the callback.
+        callback (callable): Called with the set of changed setting names.
+    """
+    _hooks[owner] = callback
+
+
+def _coerce(name, value, current):
+    """Convert a TOML value to the type of the current setting."""
+    if isinstance(current, bool):
+        if not isinstance(value, bool):
+            raise TypeError(f"{name} must be true or false")
+        return value
+    if isinstance(current, (int, float)) and not isinstance(value, bool) and isinstance(value, (int, float)):
+        return type(current)(value)
+    if isinstance(current, list):
+        if isinstance(value, str):
+            value = [item.strip() for item in value.split(',') if item.strip()]
+        if not isinstance(value, list):
+            raise TypeError(f"{name} must be a list")
+        return value
+    if current is None or isinstance(current, str):
+        if isinstance(value, (dict, list)):
+            raise TypeError(f"{name} must be a plain value")
+        return str(value)
+    raise TypeError(f"{name} must be a {type(current).__name__}")
+
+
+class ConfigWatcher:
+    """
+    Applies a TOML file on top of the settings module and again whenever it changes.
+
+    Keys are setting names in any case, tables only group them. Settings that code reads
+    at call time take effect immediately, modules that copy a setting into a long-lived
+    object register an on_change hook. Settings in STARTUP_ONLY are taken from the first
+    load only. Removing a key restores the value from the environment.
+    """
+    def __init__(self, path, target, interval=5):
+        """
+        Args:
+            path (str): TOML file, it does not have to exist.
+            target (module): Settings module to update.
+            interval (float): Seconds between checks for changes.
+        """
+        self._path = path
+        self._target = target
+        self._interval = interval
+        self._defaults = {}
+        self._mtime = None
+        self._applied = False
+        self._task = None
+
+    def _read(self):
+        with open(self._path, 'rb') as file:
+            data = tomllib.load(file)
+        values = {}
+        for key, value in data.items():
+            if isinstance(value, dict):
+                values.update({name.upper(): item for name, item in value.items()})
+            else:
+                values[key.upper()] = value
+        return values
+
+    def apply(self):
+        """
+        Load the file if it changed and update the settings.
+
+        Returns:
+            set: Names of the settings whose value changed.
+        """
+        # Only the first load, done before anything reads the settings, may set STARTUP_ONLY
+        starting, self._applied = not self._applied, True
+        try:
+            mtime = os.stat(self._path).st_mtime_ns
+        except FileNotFoundError:
+            mtime = None
+        if mtime == self._mtime:
+            return set()
+        try:
+            values = self._read() if mtime is not None else {}
+        except (OSError, tomllib.TOMLDecodeError) as e:
+            logger.error(f"Ignoring invalid config file {self._path}: {e}")
+            return set()
+        self._mtime = mtime
+
+        wanted = {}
+        for name, value in values.items():
+            if name in RESTART_ONLY or not name.isupper():
+                logger.warning(f"Config {name} can not be changed while running, ignored")
+                continue
+            if not hasattr(self._target, name):
+                logger.warning(f"Unknown config setting {name}, ignored")
+                continue
+            current = self._defaults.get(name, getattr(self._target, name))
+            try:
+                wanted[name] = _coerce(name, value, current)
+            except TypeError as e:
+                logger.warning(f"Config {e}, ignored")
+        # Keys that left the file go back to their environment value
+        for name in list(self._defaults):
+            if name not in wanted:
+                wanted[name] = self._defaults.pop(name)
+
+        changed = set()
+        for name, value in wanted.items():
+            if name in values:
+                self._defaults.setdefault(name, getattr(self._target, name))
+            if getattr(self._target, name) == value:
+                continue
+            if not starting and name in STARTUP_ONLY:
+                logger.warning(f"Config {name} only takes effect after a restart")
+                continue
+            setattr(self._target, name, value)
+            changed.add(name)
+        if changed:
+            logger.info(f"Config applied from {self._path}: {', '.join(sorted(changed))}")
+            for owner, callback in list(_hooks.items()):
+                try:
+                    callback(changed)
+                except Exception as e:
+                    logger.error(f"Config hook of {owner} failed: {e}")
+        return changed
+
+    def start(self):
+        """Check the file for changes in the background."""
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self._interval)
+            # A stat per interval, hooks run on the event loop
+            self.apply()
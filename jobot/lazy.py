@@ -0,0 +1,43 @@
+# lazy.py
+import importlib
+import logging
+import time
+
+# Initialize logger
+logger = logging.getLogger("bot")
+
+
+class _LazyModule:
+    """Module stand-in that imports the real module on first attribute access."""
+    def __init__(self, name):
+        self.__dict__['_name'] = name
+        self.__dict__['_module'] = None
+
+    def _load(self):
+        module = self.__dict__['_module']
+        if module is None:
+            start = time.perf_counter()
+            module = importlib.import_module(self.__dict__['_name'])
+            self.__dict__['_module'] = module
+            logger.info(f"Imported {self.__dict__['_name']} in {(time.perf_counter() - start) * 1000:.0f} ms")
+        return module
+
+    def __getattr__(self, attr):
+        return getattr(self._load(), attr)
+
+    def __repr__(self):
+        state = "loaded" if self.__dict__['_module'] is not None else "not loaded"
+        return f"<lazy module {self.__dict__['_name']!r} ({state})>"
+
+
+def lazy_import(name):
+    """
+    Defer importing a heavy module until it is first used.
+
+    Args:
+        name (str): Dotted module name.
+
+    Returns:
+        _LazyModule: Proxy that forwards attribute access to the module.
+    """
+    return _LazyModule(name)
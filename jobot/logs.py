@@ -0,0 +1,196 @@
+# logs.py
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import threading
+import time
+
+
+class RotatingFileHandler(logging.handlers.TimedRotatingFileHandler):
+    """
+    File handler that rotates on a time schedule and on file size.
+
+    Records are written without flushing, the queue listener flushes once per batch.
+    Size rollovers within the same time period get a numbered suffix so earlier
+    backups are not overwritten.
+    """
+    def __init__(self, filename, when='midnight', interval=1, backupCount=7, maxBytes=0,
+                 encoding='utf-8', delay=True):
+        """
+        Args:
+            filename (str): Log file path.
+            when (str): Time rotation unit, as in TimedRotatingFileHandler.
+            interval (int): Number of units between time rotations.
+            backupCount (int): Number of rotated files to keep.
+            maxBytes (int): Rotate once the file reaches this size, 0 disables.
+        """
+        super().__init__(filename, when=when, interval=interval, backupCount=backupCount,
+                         encoding=encoding, delay=delay)
+        self.maxBytes = maxBytes
+
+    def shouldRollover(self, record):
+        """Roll over when the time is up or the file is too big."""
+        if super().shouldRollover(record):
+            return True
+        if self.maxBytes > 0:
+            if self.stream is None:
+                self.stream = self._open()
+            return self.stream.tell() >= self.maxBytes
+        return False
+
+    def _backups(self):
+        """
+        Backups of this log, oldest first.
+
+        Returns:
+            list: (period, counter, path) tuples. Period suffixes sort by time and the
+                  first backup of a period has counter 0.
+        """
+        directory, base = os.path.split(self.baseFilename)
+        prefix = base + '.'
+        backups = []
+        for name in os.listdir(directory or '.'):
+            if not name.startswith(prefix):
+                continue
+            period, _, counter = name[len(prefix):].partition('.')
+            if not self.extMatch.fullmatch(period) or (counter and not counter.isdigit()):
+                continue
+            backups.append((period, int(counter or 0), os.path.join(directory, name)))
+        return sorted(backups)
+
+    def rotation_filename(self, default_name):
+        """Number size rollovers within a period after the newest backup of that period."""
+        period = default_name[len(self.baseFilename) + 1:]
+        counters = [counter for backup_period, counter, _ in self._backups() if backup_period == period]
+        if not counters:
+            return default_name
+        # Never reuse a counter freed by retention, it would sort as older than it is
+        return f"{default_name}.{max(counters) + 1:04d}"
+
+    def getFilesToDelete(self):
+        """Oldest backups beyond backupCount, sorted by period and counter rather than by name."""
+        backups = self._backups()
+        if len(backups) <= self.backupCount:
+            return []
+        return [path for _, _, path in backups[:len(backups) - self.backupCount]]
+
+    def emit(self, record):
+        """Write a record without flushing."""
+        try:
+            if self.shouldRollover(record):
+                self.doRollover()
+            if self.stream is None:
+                self.stream = self._open()
+            self.stream.write(self.format(record) + self.terminator)
+        except RecursionError:
+            raise
+        except Exception:
+            self.handleError(record)
+
+
+class JsonFormatter(logging.Formatter):
+    """Format records as one JSON object per line."""
+    def format(self, record):
+        entry = {
+            "time": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "module": record.module,
+            "message": record.getMessage(),
+        }
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry["exception"] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False)
+
+
+class RateLimitFilter(logging.Filter):
+    """
+    Token bucket rate limit per call site.
+
+    Log calls here use f-strings, so records are grouped by the file and line that
+    emitted them rather than by message text. Once a call site runs out of tokens its
+    records are dropped, and the next record that gets through reports how many were
+    suppressed.
+    """
+    def __init__(self, name='', rate=1.0, burst=10):
+        """
+        Args:
+            name (str): Logger name prefix the filter applies to, as in logging.Filter.
+            rate (float): Records per second allowed per call site.
+            burst (int): Records allowed in a burst per call site.
+        """
+        super().__init__(name)
+        self.rate = float(rate)
+        self.burst = float(burst)
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def filter(self, record):
+        if not super().filter(record):
+            return True
+        key = (record.name, record.pathname, record.lineno)
+        now = time.monotonic()
+        with self._lock:
+            tokens, last, suppressed = self._buckets.get(key, (self.burst, now, 0))
+            tokens = min(self.burst, tokens + (now - last) * self.rate)
+            if tokens < 1:
+                self._buckets[key] = (tokens, now, suppressed + 1)
+                return False
+            self._buckets[key] = (tokens - 1, now, 0)
+        if suppressed:
+            record.msg = f"{record.getMessage()} ({suppressed} similar messages suppressed)"
+            record.args = None
+        return True
+
+
+class BatchingQueueListener(logging.handlers.QueueListener):
+    """
+    Queue listener that drains records in batches and flushes handlers once per batch.
+    """
+    batch_size = 256
+
+    def _monitor(self):
+        q = self.queue
+        has_task_done = hasattr(q, 'task_done')
+        while True:
+            batch = [self.dequeue(True)]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self.dequeue(False))
+                except queue.Empty:
+                    break
+            stop = False
+            for record in batch:
+                if record is self._sentinel:
+                    stop = True
+                else:
+                    self.handle(record)
+                if has_task_done:
+                    q.task_done()
+            for handler in self.handlers:
+                handler.flush()
+            if stop:
+                break
+
+
+def start_listeners(*names):
+    """
+    Start the listener threads of queue handlers configured through dictConfig.
+
+    Args:
+        names (str): Names of the queue handlers.
+
+    Returns:
+        list: Started listeners, stop them on exit to flush pending records.
+    """
+    listeners = []
+    for name in names:
+        handler = logging.getHandlerByName(name)
+        if handler is not None and handler.listener is not None:
+            handler.listener.start()
+            listeners.append(handler.listener)
+    return listeners
@@ -0,0 +1,271 @@
+# mclog.py
+import asyncio
+import collections
+import logging
+import os
+import re
+import threading
+
+# Initialize logger
+logger = logging.getLogger("bot")
+
+# Log line header, covers vanilla "[10:00:00] [Server thread/INFO]: msg" and
+# Forge "[18Oct2026 10:00:00.123] [Server thread/INFO] [minecraft/MinecraftServer]: msg"
+_HEADER = re.compile(r'^\[(?P<time>[^\]]+)\] \[(?P<thread>[^\]/]+)/(?P<level>[A-Z]+)\](?: \[[^\]]*\])?: (?P<message>.*)$')
+_JOIN = re.compile(r'^(\w+) joined the game$')
+_LEAVE = re.compile(r'^(\w+) left the game$')
+_CHAT = re.compile(r'^<(\w+)> (.*)$')
+_TPS = re.compile(r"Can't keep up! .*Running (\d+)ms or (\d+) ticks behind")
+_DEATH = re.compile(
+    r'^(\w+) (was (slain|shot|killed|blown up|fireballed|struck|impaled|squashed|squished|'
+    r'pricked|poked|stung|obliterated|frozen)|drowned|died|fell|hit the ground|burned|went up in flames|'
+    r'blew up|starved|suffocated|froze|walked into|tried to swim in lava|withered away|'
+    r'experienced kinetic energy|discovered the floor was lava|didn\'t want to live)'
+)
+
+CATEGORIES = ('join', 'leave', 'death', 'chat', 'tps', 'error', 'warn')
+
+# Lower value is more important, kept first when the buffer is full
+_PRIORITY = {'error': 0, 'tps': 1, 'death': 2, 'join': 3, 'leave': 3, 'warn': 4, 'chat': 5}
+_ICONS = {'join': '+', 'leave': '-', 'death': '☠', 'chat': '>', 'tps': '⏱', 'error': '!', 'warn': '?'}
+
+LogEvent = collections.namedtuple('LogEvent', ['category', 'time', 'text'])
+
+
+def parse_line(line):
+    """
+    Classify one line of latest.log.
+
+    Args:
+        line (str): Raw log line.
+
+    Returns:
+        LogEvent: Parsed event, or None for lines that are not interesting.
+    """
+    match = _HEADER.match(line)
+    if match is None:
+        return None
+    level = match['level']
+    message = match['message']
+    if level in ('ERROR', 'FATAL'):
+        return LogEvent('error', match['time'], message)
+    if level == 'WARN':
+        if "Can't keep up" in message:
+            tps = _TPS.search(message)
+            text = f"Server is {tps[1]}ms ({tps[2]} ticks) behind" if tps else message
+            return LogEvent('tps', match['time'], text)
+        return LogEvent('warn', match['time'], message)
+    if match['thread'] != 'Server thread' or level != 'INFO':
+        return None
+    if message.endswith(' joined the game') and _JOIN.match(message):
+        return LogEvent('join', match['time'], message)
+    if message.endswith(' left the game') and _LEAVE.match(message):
+        return LogEvent('leave', match['time'], message)
+    if message.startswith('<') and _CHAT.match(message):
+        return LogEvent('chat', match['time'], message)
+    if _DEATH.match(message):
+        return LogEvent('death', match['time'], message)
+    return None
+
+
+class FileLogSource:
+    """Follows a local log file, used for testing without a server."""
+    def __init__(self, path, poll=0.5):
+        """
+        Args:
+            path (str): Log file to follow.
+            poll (float): Seconds between checks for new data.
+        """
+        self._path = path
+        self._poll = poll
+
+    async def chunks(self):
+        """Yield lists of new lines as they are appended, starting at the end of the file."""
+        with open(self._path, 'r', encoding='utf-8', errors='replace') as file:
+            file.seek(0, os.SEEK_END)
+            pending = ''
+            while True:
+                data = await asyncio.to_thread(file.read, 65536)
+                if not data:
+                    # A shorter file means it was rotated
+                    if os.path.getsize(self._path) < file.tell():
+                        file.seek(0)
+                    await asyncio.sleep(self._poll)
+                    continue
+                *lines, pending = (pending + data).split('\n')
+                if lines:
+                    yield lines
+
+
+class SSHLogSource:
+    """
+    Follows a remote log file with `tail -F` over one persistent SSH channel.
+
+    A reader thread hands whole chunks of lines to the event loop, so a busy log costs
+    one loop wake-up per network read rather than one per line.
+    """
+    def __init__(self, connect, path, retry_delay=10):
+        """
+        Args:
+            connect (callable): Blocking function returning a connected SSHClient.
+            path (str): Remote log file, may be a shell expression.
+            retry_delay (float): Seconds to wait before reconnecting after the channel drops.
+        """
+        self._connect = connect
+        self._path = path
+        self._retry_delay = retry_delay
+
+    def _read(self, loop, queue, stop):
+        sshcon = self._connect()
+        try:
+            _stdin, _stdout, _stderr = sshcon.exec_command(f'tail -n0 -F {self._path}')
+            channel = _stdout.channel
+            channel.settimeout(1)
+            pending = ''
+            while not stop.is_set():
+                try:
+                    data = channel.recv(65536)
+                except TimeoutError:
+                    continue
+                if not data:
+                    break
+                *lines, pending = (pending + data.decode('utf-8', errors='replace')).split('\n')
+                if lines:
+                    loop.call_soon_threadsafe(queue.put_nowait, [line.rstrip('\r') for line in lines])
+        finally:
+            sshcon.close()
+
+    async def chunks(self):
+        """Yield lists of new lines, reconnecting when the SSH channel drops."""
+        loop = asyncio.get_running_loop()
+        while True:
+            queue = asyncio.Queue()
+            stop = threading.Event()
+            reader = asyncio.ensure_future(asyncio.to_thread(self._read, loop, queue, stop))
+            try:
+                while not reader.done() or not queue.empty():
+                    getter = asyncio.ensure_future(queue.get())
+                    await asyncio.wait({getter, reader}, return_when=asyncio.FIRST_COMPLETED)
+                    if getter.done():
+                        yield getter.result()
+                    else:
+                        getter.cancel()
+                if reader.exception():
+                    logger.warning(f"Log stream dropped: {reader.exception()}")
+            finally:
+                stop.set()
+            await asyncio.sleep(self._retry_delay)
+
+
+class LogRelay:
+    """
+    Relays interesting log events to a Discord channel in batches.
+
+    Events are buffered and flushed as a few messages every interval. When Discord is
+    slow the buffer fills up, the least important events are dropped first and the
+    next batch says how many were skipped, so the relay never falls behind the log.
+    """
+    def __init__(self, source, send, categories=('join', 'leave', 'death', 'tps', 'error'),
+                 interval=3, max_pending=200, max_length=1900):
+        """
+        Args:
+            source (FileLogSource | SSHLogSource): Where lines come from.
+            send (callable): Coroutine function sending one message.
+            categories (tuple): Event categories to relay.
+            interval (float): Seconds between batches.
+            max_pending (int): Events buffered before dropping.
+            max_length (int): Maximum message length.
+        """
+        self._source = source
+        self._send = send
+        self.categories = set(categories)
+        self._interval = interval
+        self._max_pending = max_pending
+        self._max_length = max_length
+        # One queue per priority, entries are (sequence, event) so batches keep log order
+        self._pending = {priority: collections.deque() for priority in set(_PRIORITY.values())}
+        self._count = 0
+        self._sequence = 0
+        self._dropped = 0
+        self._tasks = []
+        self.lines_seen = 0
+
+    def start(self):
+        """Start following the log and flushing batches."""
+        self._tasks = [asyncio.create_task(self._follow()), asyncio.create_task(self._flush_loop())]
+
+    def stop(self):
+        """Stop relaying."""
+        for task in self._tasks:
+            task.cancel()
+        self._tasks = []
+
+    @property
+    def running(self):
+        return any(not task.done() for task in self._tasks)
+
+    def _push(self, event):
+        self._sequence += 1
+        self._pending[_PRIORITY[event.category]].append((self._sequence, event))
+        self._count += 1
+        if self._count > self._max_pending:
+            # Drop the oldest event of the least important kind
+            for priority in sorted(self._pending, reverse=True):
+                if self._pending[priority]:
+                    self._pending[priority].popleft()
+                    break
+            self._count -= 1
+            self._dropped += 1
+
+    async def _follow(self):
+        categories = self.categories
+        try:
+            async for lines in self._source.chunks():
+                self.lines_seen += len(lines)
+                for line in lines:
+                    event = parse_line(line)
+                    if event is not None and event.category in categories:
+                        self._push(event)
+        except Exception as e:
+            logger.error(f"Log stream stopped: {e!r}")
+            # Send what was read so far, then tell the channel the stream is gone
+            messages = self._batch() if self._count or self._dropped else []
+            messages.append(f"Log stream stopped: {str(e) or type(e).__name__}. Use `$tfg log start` to restart it.")
+            for message in messages:
+                try:
+                    await self._send(message)
+                except Exception as send_error:
+                    logger.warning(f"Failed to relay log batch: {send_error}")
+            self.stop()
+
+    def _batch(self):
+        """Turn pending events into messages no longer than max_length."""
+        events = sorted(entry for queue in self._pending.values() for entry in queue)
+        lines = [f"{_ICONS[event.category]} {event.text}"[:self._max_length] for _, event in events]
+        if self._dropped:
+            lines.append(f"... {self._dropped} events skipped")
+        for queue in self._pending.values():
+            queue.clear()
+        self._count = 0
+        self._dropped = 0
+        messages = []
+        current = ''
+        for line in lines:
+            if current and len(current) + len(line) + 1 > self._max_length:
+                messages.append(current)
+                current = ''
+            current = f"{current}\n{line}" if current else line
+        if current:
+            messages.append(current)
+        return messages
+
+    async def _flush_loop(self):
+        while True:
+            await asyncio.sleep(self._interval)
+            if not self._count and not self._dropped:
+                continue
+            for message in self._batch():
+                try:
+                    await self._send(message)
+                except Exception as e:
+                    logger.warning(f"Failed to relay log batch: {e}")
@@ -0,0 +1,296 @@
+# ollama_router.py
+import asyncio
+import datetime
+import logging
+from jobot.lazy import lazy_import
+
+# Imported on first use to keep startup fast
+ollama = lazy_import("ollama")
+httpx = lazy_import("httpx")
+
+# Initialize logger
+logger = logging.getLogger("bot")
+
+
+class ModelError(Exception):
+    """An Ollama host answered with an error, such as an unknown model or a failed load."""
+    def __init__(self, message, status_code=None):
+        self.status_code = status_code
+        super().__init__(message)
+
+
+def parse_hours(text):
+    """
+    Parse an hour range such as '8-23'.
+
+    Args:
+        text (str): 'start-end' in 24h clock, end exclusive, may wrap past midnight.
+                    Equal start and end, such as '0-24', means all day.
+
+    Returns:
+        tuple: (start, end) or None when text is empty.
+    """
+    if not text:
+        return None
+    start, end = text.split('-')
+    return int(start) % 24, int(end) % 24
+
+
+class _Host:
+    """State of one Ollama server"""
+    def __init__(self, address, client_options):
+        self.address = address
+        self.models = set()
+        self.inflight = 0
+        self.healthy = True
+        self._client_options = client_options
+        self._client = None
+
+    def reset_client(self, client_options):
+        """Create the client again with new options on next use."""
+        self._client_options = client_options
+        self._client = None
+
+    @property
+    def client(self):
+        """Ollama client, created on first use."""
+        if self._client is None:
+            self._client = ollama.AsyncClient(host=self.address, **self._client_options)
+        return self._client
+
+
+class OllamaRouter:
+    """
+    Routes Ollama requests across several hosts.
+
+    A request goes to a healthy host that already has the model loaded, and to the
+    least busy healthy host otherwise, so models stay where they are instead of being
+    swapped in and out of one GPU. A background task polls `/api/ps` to track which
+    models are resident, ejects hosts that stop answering and brings them back once
+    they do. During active hours the warm models are kept loaded with a long keep_alive.
+    """
+    def __init__(self, hosts, warm_models=(), active_hours=None, active_keep_alive='1h',
+                 health_interval=30, client_options=None):
+        """
+        Args:
+            hosts (list): Ollama server addresses.
+            warm_models (list): Models to load on startup and keep loaded during active hours.
+            active_hours (tuple): (start, end) hours during which models are kept warm, None for never.
+            active_keep_alive (str): keep_alive used during active hours.
+            health_interval (float): Seconds between health checks.
+            client_options (dict): Extra keyword arguments for each AsyncClient.
+        """
+        self._client_options = client_options or {}
+        self._hosts = [_Host(address, self._client_options) for address in hosts]
+        self._warm_models = list(warm_models)
+        self._active_hours = active_hours
+        self._active_keep_alive = active_keep_alive
+        self._health_interval = health_interval
+        self._task = None
+
+    @property
+    def hosts(self):
+        """Addresses of the configured hosts and whether they are healthy."""
+        return {host.address: host.healthy for host in self._hosts}
+
+    @property
+    def models(self):
+        """Models known to be loaded on any healthy host, plus the warm models."""
+        models = set(self._warm_models)
+        for host in self._hosts:
+            if host.healthy:
+                models |= host.models
+        return sorted(models)
+
+    def is_active(self, now=None):
+        """
+        Check whether models should be kept warm right now.
+
+        Args:
+            now (datetime): Time to check, defaults to the current local time.
+
+        Returns:
+            bool: True during active hours.
+        """
+        if self._active_hours is None:
+            return False
+        hour = (now or datetime.datetime.now()).hour
+        start, end = self._active_hours
+        if start == end:
+            return True
+        if start < end:
+            return start <= hour < end
+        return hour >= start or hour < end
+
+    def keep_alive(self):
+        """keep_alive for requests, None leaves the server default outside active hours."""
+        return self._active_keep_alive if self.is_active() else None
+
+    def start(self):
+        """Check every host, load the warm models and keep checking in the background."""
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    def configure(self, hosts=None, warm_models=None, active_hours=None, active_keep_alive=None, client_options=None):
+        """
+        Change the routing settings while running, hosts that stay keep their clients and state.
+
+        Args:
+            hosts (list): Ollama server addresses, None keeps the current ones.
+            warm_models (list): Models to keep loaded, None keeps the current ones.
+            active_hours (tuple): (start, end) hours during which models are kept warm.
+            active_keep_alive (str): keep_alive used during active hours, None keeps the current one.
+            client_options (dict): Extra keyword arguments for each AsyncClient, None keeps the
+                                   current ones. Hosts get new clients, running requests finish
+                                   on the old ones.
+        """
+        if client_options is not None:
+            self._client_options = client_options
+            for host in self._hosts:
+                host.reset_client(client_options)
+        if hosts is not None:
+            current = {host.address: host for host in self._hosts}
+            self._hosts = [current.get(address) or _Host(address, self._client_options) for address in hosts]
+            logger.info(f"Ollama hosts set to {', '.join(hosts)}")
+        if warm_models is not None:
+            self._warm_models = list(warm_models)
+        self._active_hours = active_hours
+        if active_keep_alive is not None:
+            self._active_keep_alive = active_keep_alive
+
+    async def close(self):
+        """Stop the health check task."""
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    def _pick(self, model, exclude=()):
+        """Choose a host for a model, preferring hosts that have it loaded."""
+        candidates = [host for host in self._hosts if host.healthy and host not in exclude]
+        if not candidates:
+            # Everything looks down, try the ejected hosts rather than failing outright
+            candidates = [host for host in self._hosts if host not in exclude]
+        if not candidates:
+            return None
+        resident = [host for host in candidates if model in host.models]
+        if resident:
+            return min(resident, key=lambda host: host.inflight)
+        # Least loaded: fewest requests in flight, then fewest models taking up memory
+        return min(candidates, key=lambda host: (host.inflight, len(host.models)))
+
+    async def _call(self, model, method, **kwargs):
+        """
+        Run a client method on the best host, moving on to the next one if it is unreachable.
+
+        Only connection failures move on, a host that took the request but was slow or
+        broke off may still be working on it, sending it elsewhere would double the load.
+
+        Raises:
+            ConnectionError: No host accepted the connection, or one dropped it.
+            TimeoutError: The host did not answer in time.
+            ModelError: The host answered with an error.
+        """
+        tried = []
+        keep_alive = self.keep_alive()
+        if keep_alive is not None:
+            kwargs.setdefault('keep_alive', keep_alive)
+        while True:
+            host = self._pick(model, exclude=tried)
+            if host is None:
+                raise ConnectionError(f"No Ollama host reachable for {model}")
+            tried.append(host)
+            host.inflight += 1
+            try:
+                response = await getattr(host.client, method)(model=model, **kwargs)
+                host.models.add(model)
+                host.healthy = True
+                return response
+            except (httpx.ConnectError, httpx.ConnectTimeout) as e:
+                logger.warning(f"Ollama host {host.address} failed, ejecting: {e}")
+                host.healthy = False
+            except httpx.TimeoutException as e:
+                raise TimeoutError(f"Ollama host {host.address} timed out: {e}") from e
+            except httpx.TransportError as e:
+                raise ConnectionError(f"Ollama host {host.address} failed: {e}") from e
+            except ollama.ResponseError as e:
+                raise ModelError(e.error, e.status_code) from e
+            finally:
+                host.inflight -= 1
+
+    async def chat(self, model, messages, **kwargs):
+        """
+        Send a chat request to the best host for the model.
+
+        Args:
+            model (str): Model name.
+            messages (list): Chat messages.
+
+        Returns:
+            Mapping: Ollama chat response.
+        """
+        return await self._call(model, 'chat', messages=messages, **kwargs)
+
+    async def embed(self, model, inputs, **kwargs):
+        """
+        Embed texts on the best host for the model.
+
+        Args:
+            model (str): Embedding model name.
+            inputs (list): Texts to embed in one request.
+
+        Returns:
+            list: One vector per input.
+        """
+        response = await self._call(model, 'embed', input=inputs, **kwargs)
+        return response['embeddings']
+
+    async def _check(self, host):
+        """Refresh the resident models of a host, marking it down if it does not answer."""
+        try:
+            response = await host.client.ps()
+        except Exception as e:
+            if host.healthy:
+                logger.warning(f"Ollama host {host.address} failed health check, ejecting: {e}")
+            host.healthy = False
+            host.models = set()
+            return
+        if not host.healthy:
+            logger.info(f"Ollama host {host.address} is back")
+        host.healthy = True
+        host.models = {model['name'] for model in response.get('models', [])}
+
+    async def _check_all(self):
+        await asyncio.gather(*(self._check(host) for host in self._hosts))
+
+    async def _warm(self, model):
+        """Load a model on the best host with an empty prompt."""
+        host = self._pick(model)
+        if host is None or not host.healthy:
+            return
+        try:
+            await host.client.generate(model=model, prompt='', keep_alive=self.keep_alive())
+            if model not in host.models:
+                host.models.add(model)
+                logger.info(f"Warmed {model} on {host.address}")
+        except Exception as e:
+            logger.warning(f"Failed to warm {model} on {host.address}: {e}")
+
+    async def _warm_all(self, refresh=False):
+        """
+        Load warm models that are not resident on any healthy host.
+
+        Args:
+            refresh (bool): Also touch resident models so their keep_alive starts over.
+        """
+        for model in self._warm_models:
+            if refresh or not any(host.healthy and model in host.models for host in self._hosts):
+                await self._warm(model)
+
+    async def _run(self):
+        await self._check_all()
+        await self._warm_all()
+        while True:
+            await asyncio.sleep(self._health_interval)
+            await self._check_all()
+            if self.is_active():
+                await self._warm_all(refresh=True)
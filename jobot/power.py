@@ -0,0 +1,289 @@
+# power.py
+import asyncio
+import datetime
+import logging
+import time
+import numpy as np
+
+# Initialize logger
+logger = logging.getLogger("bot")
+
+HOURS_PER_WEEK = 7 * 24
+
+
+def hour_of_week(timestamp):
+    """
+    Index of the local hour of the week, 0 is Monday 00:00.
+
+    Args:
+        timestamp (float): Unix time.
+
+    Returns:
+        int: Value between 0 and 167.
+    """
+    moment = datetime.datetime.fromtimestamp(timestamp)
+    return moment.weekday() * 24 + moment.hour
+
+
+class _Notifier:
+    """Context-like object handed to the server functions, forwards messages to a channel and the log."""
+    def __init__(self, bot, channel_id):
+        self._bot = bot
+        self.channel_id = channel_id
+
+    async def send(self, content=None, **kwargs):
+        logger.info(f"Power policy: {content}")
+        channel = self._bot.get_channel(self.channel_id) if self._bot and self.channel_id else None
+        if channel is not None:
+            try:
+                await channel.send(content, **kwargs)
+            except Exception as e:
+                logger.warning(f"Failed to send power notice: {e}")
+
+
+class PowerPolicy:
+    """
+    Starts and stops the server VM based on its player history.
+
+    The VM is stopped once nobody has been online for the idle timeout, and started
+    ahead of hours of the week that were busy over the last few weeks so players do
+    not wait for it to boot. Manual starts get a grace period before the idle timer
+    can stop them, and a manual stop holds off pre-starting for a while.
+    """
+    def __init__(self, series, start, stop, idle_timeout=1800, grace=900, lead=900, threshold=0.5,
+                 history=28 * 86400, min_samples=4, hold=7200, interval=60, stale=300, channel_id=None):
+        """
+        Args:
+            series (TimeSeries): Telemetry with 'vm' and 'players' metrics.
+            start (callable): Coroutine function starting the server, takes a context with send.
+            stop (callable): Coroutine function stopping the server, takes a context with send.
+            idle_timeout (float): Seconds without players before stopping, 0 disables stopping.
+            grace (float): Seconds after a start during which the VM is never stopped.
+            lead (float): Seconds ahead of a busy hour to start the VM, 0 disables pre-starting.
+            threshold (float): Average player count from which an hour counts as busy.
+            history (float): Seconds of history the weekly profile is built from.
+            min_samples (int): Samples an hour needs before it is trusted.
+            hold (float): Seconds after a manual stop, or a failed start, before pre-starting again.
+            interval (float): Seconds between checks.
+            stale (float): Samples older than this many seconds are not acted on.
+            channel_id (int): Channel notified about automatic starts and stops.
+        """
+        self._series = series
+        self._start = start
+        self._stop = stop
+        self.idle_timeout = idle_timeout
+        self.grace = grace
+        self.lead = lead
+        self.threshold = threshold
+        self._history = history
+        self._min_samples = min_samples
+        self._hold = hold
+        self._interval = interval
+        self._stale = stale
+        self._channel_id = channel_id
+        self._notifier = None
+        self._task = None
+        self._profile = None
+        self._profile_time = 0
+        self.idle_since = None
+        self._last_start = 0
+        self._last_stop = 0
+        self._held_until = 0
+
+    @property
+    def enabled(self):
+        return bool(self.idle_timeout or self.lead)
+
+    @property
+    def channel_id(self):
+        """Channel notified about automatic starts and stops, None for none."""
+        return self._channel_id
+
+    @channel_id.setter
+    def channel_id(self, value):
+        self._channel_id = value
+        if self._notifier is not None:
+            self._notifier.channel_id = value
+
+    def bind(self, start, stop):
+        """Replace the start and stop actions, used when the module defining them is reloaded."""
+        self._start = start
+        self._stop = stop
+
+    def start(self, bot=None):
+        """
+        Start checking in the background.
+
+        Args:
+            bot (commands.Bot): Bot used to look up the notification channel.
+        """
+        if self._task is None and self.enabled:
+            self._notifier = _Notifier(bot, self._channel_id)
+            self._task = asyncio.create_task(self._run())
+            logger.info(f"Power policy started (idle {self.idle_timeout}s, lead {self.lead}s)")
+
+    def stop(self):
+        """Stop checking, start picks up again with the current settings."""
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+            logger.info("Power policy stopped")
+
+    async def close(self):
+        """Stop checking."""
+        self.stop()
+
+    def note_manual(self, action, now=None):
+        """
+        Record a start or stop done by a user.
+
+        Args:
+            action (str): 'start' or 'stop'.
+            now (float): Time of the action, defaults to now.
+        """
+        now = time.time() if now is None else now
+        if action == 'start':
+            self._last_start = now
+            self.idle_since = None
+        elif action == 'stop':
+            self._last_stop = now
+            self._held_until = now + self._hold
+
+    def profile(self, now=None):
+        """
+        Average player count per hour of the week.
+
+        Args:
+            now (float): End of the history window, defaults to now.
+
+        Returns:
+            ndarray: 168 averages, NaN for hours without enough samples.
+        """
+        now = time.time() if now is None else now
+        if self._profile is not None and now - self._profile_time < 3600:
+            return self._profile
+        times, values = self._series.query(self._history, now)
+        players = values['players']
+        known = ~np.isnan(players)
+        sums = np.zeros(HOURS_PER_WEEK)
+        counts = np.zeros(HOURS_PER_WEEK)
+        if known.any():
+            hours = np.array([hour_of_week(t) for t in times[known]])
+            np.add.at(sums, hours, players[known])
+            np.add.at(counts, hours, 1)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            self._profile = np.where(counts >= self._min_samples, sums / counts, np.nan)
+        self._profile_time = now
+        return self._profile
+
+    def is_busy(self, timestamp):
+        """
+        Check whether an hour was busy in the past weeks.
+
+        Args:
+            timestamp (float): Unix time within the hour.
+
+        Returns:
+            bool: True when the average player count reaches the threshold.
+        """
+        expected = self.profile()[hour_of_week(timestamp)]
+        return not np.isnan(expected) and expected >= self.threshold
+
+    def next_busy(self, now=None):
+        """
+        Find the next busy hour within a week.
+
+        Args:
+            now (float): Start of the search, defaults to now.
+
+        Returns:
+            float: Unix time of the start of the next busy hour, None when no hour is busy.
+        """
+        now = time.time() if now is None else now
+        hour = now - now % 3600
+        for step in range(HOURS_PER_WEEK):
+            candidate = hour + step * 3600
+            if self.is_busy(candidate):
+                return max(candidate, now)
+        return None
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self._interval)
+            try:
+                await self.check()
+            except Exception as e:
+                logger.warning(f"Power policy check failed: {e}")
+
+    async def check(self, now=None):
+        """
+        Look at the latest sample and start or stop the VM if needed.
+
+        Args:
+            now (float): Current time, defaults to now.
+
+        Returns:
+            str: 'start', 'stop' or None when nothing was done.
+        """
+        now = time.time() if now is None else now
+        if self._series.last_sample is None:
+            return None
+        timestamp, values = self._series.last_sample
+        if now - timestamp > self._stale or np.isnan(values['vm']):
+            return None
+
+        if values['vm']:
+            # A running VM with the server down or starting counts as idle too
+            if values['players'] > 0:
+                self.idle_since = None
+            elif self.idle_since is None:
+                self.idle_since = timestamp
+            if not self.idle_timeout or self.idle_since is None or now - self.idle_since < self.idle_timeout:
+                return None
+            if now - self._last_start < self.grace or self.is_busy(now):
+                return None
+            minutes = int((now - self.idle_since) // 60)
+            await self._notifier.send(f"No players for {minutes} min, stopping the server.")
+            await self._stop(self._notifier)
+            self.idle_since = None
+            self._last_stop = now
+            return 'stop'
+
+        self.idle_since = None
+        if not self.lead or now < self._held_until:
+            return None
+        if not (self.is_busy(now) or self.is_busy(now + self.lead)):
+            return None
+        await self._notifier.send("Players are usually online around now, starting the server.")
+        self._last_start = now
+        # Do not try again for a while if the start does not take
+        self._held_until = now + self._hold
+        await self._start(self._notifier)
+        return 'start'
+
+    def describe(self, now=None):
+        """
+        Summarize the policy state for users.
+
+        Args:
+            now (float): Current time, defaults to now.
+
+        Returns:
+            str: Human readable status.
+        """
+        now = time.time() if now is None else now
+        if not self.enabled:
+            return "Automatic power management is off."
+        lines = []
+        if self.idle_timeout:
+            lines.append(f"Stops after {int(self.idle_timeout // 60)} min without players.")
+            if self.idle_since is not None:
+                lines.append(f"Idle for {int((now - self.idle_since) // 60)} min.")
+        if self.lead:
+            busy = self.next_busy(now)
+            if busy is None:
+                lines.append("No busy hours learned yet.")
+            else:
+                when = datetime.datetime.fromtimestamp(busy).strftime('%a %H:%M')
+                lines.append(f"Next busy hour: {when}, pre-starts {int(self.lead // 60)} min ahead.")
+        return '\n'.join(lines)
@@ -0,0 +1,530 @@
+# rag.py
+import asyncio
+import datetime
+import json
+import logging
+import os
+import sqlite3
+import threading
+import numpy as np
+
+# Initialize logger
+logger = logging.getLogger("bot")
+
+# Rough token estimate used for the prompt budget
+CHARS_PER_TOKEN = 4
+
+# Longest message text that is embedded and stored
+MAX_MESSAGE_CHARS = 2000
+
+
+def _normalize(vectors):
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+def _nearest(vectors, centroids, chunk=8192):
+    """Index of the closest centroid for every vector, in chunks to bound memory."""
+    labels = np.empty(len(vectors), dtype=np.int32)
+    for start in range(0, len(vectors), chunk):
+        block = np.asarray(vectors[start:start + chunk], dtype=np.float32)
+        labels[start:start + chunk] = np.argmax(block @ centroids.T, axis=1)
+    return labels
+
+
+def kmeans(vectors, clusters, iterations=10, seed=0):
+    """
+    Spherical k-means, centroids are kept at unit length so a dot product ranks them.
+
+    Args:
+        vectors (ndarray): Unit length float32 vectors, one per row.
+        clusters (int): Number of centroids.
+        iterations (int): Lloyd iterations.
+        seed (int): Random seed for the initial centroids.
+
+    Returns:
+        ndarray: (clusters, dimensions) centroids.
+    """
+    generator = np.random.default_rng(seed)
+    centroids = vectors[generator.choice(len(vectors), clusters, replace=False)].copy()
+    for _ in range(iterations):
+        labels = _nearest(vectors, centroids)
+        order = np.argsort(labels, kind='stable')
+        counts = np.bincount(labels, minlength=clusters)
+        used = np.flatnonzero(counts)
+        sums = np.add.reduceat(vectors[order], np.r_[0, np.cumsum(counts[used])[:-1]], axis=0)
+        centroids[used] = _normalize(sums)
+        # Empty clusters restart from a random vector
+        empty = np.flatnonzero(counts == 0)
+        if len(empty):
+            centroids[empty] = vectors[generator.choice(len(vectors), len(empty))]
+    return centroids
+
+
+class MessageIndex:
+    """
+    Vector index of the messages of one guild.
+
+    Embeddings are stored as unit length float32 rows in a memory-mapped file that grows
+    by doubling, message text and per-channel checkpoints live in SQLite, both keyed by
+    row number. Once `train_size` messages are stored, spherical k-means splits the rows
+    into about 2*sqrt(n) inverted lists and a query only scores the rows of the `nprobe`
+    lists nearest to it, which keeps searches in milliseconds at millions of messages.
+    The lists are retrained whenever the index has grown fourfold.
+
+    Writes must not run concurrently, searches may run alongside them from other threads.
+    """
+    def __init__(self, path, nprobe=16, train_size=4096):
+        """
+        Args:
+            path (str): Directory holding the index files, created if missing.
+            nprobe (int): Inverted lists scored per query.
+            train_size (int): Messages needed before the inverted lists are built.
+        """
+        os.makedirs(path, exist_ok=True)
+        self.path = path
+        self.nprobe = nprobe
+        self.train_size = train_size
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(os.path.join(path, 'messages.db'), check_same_thread=False)
+        self._db.executescript("""
+            CREATE TABLE IF NOT EXISTS messages (
+                row INTEGER PRIMARY KEY, message_id INTEGER UNIQUE, channel_id INTEGER,
+                channel TEXT, author TEXT, created_at REAL, content TEXT);
+            CREATE TABLE IF NOT EXISTS channels (
+                channel_id INTEGER PRIMARY KEY, last_message_id INTEGER, complete INTEGER DEFAULT 0);
+        """)
+        self.count = self._db.execute("SELECT COALESCE(MAX(row) + 1, 0) FROM messages").fetchone()[0]
+        meta = self._read_meta()
+        self.dimensions = meta.get('dimensions')
+        self._trained = meta.get('trained', 0)
+        self._vectors = self._labels = None
+        self._capacity = 0
+        self._centroids = None
+        self._lists = None  # (rows ordered by list, list start offsets)
+        self._pending = []  # (rows, labels) added since the lists were last built
+        if self.dimensions:
+            self._grow(max(self.count, 1024))
+            centroids = os.path.join(path, 'centroids.npy')
+            if self._trained and os.path.exists(centroids):
+                self._centroids = np.load(centroids)
+                self._build_lists()
+
+    def _read_meta(self):
+        try:
+            with open(os.path.join(self.path, 'index.json'), encoding='utf-8') as file:
+                return json.load(file)
+        except FileNotFoundError:
+            return {}
+
+    def _write_meta(self):
+        with open(os.path.join(self.path, 'index.json'), 'w', encoding='utf-8') as file:
+            json.dump({'dimensions': self.dimensions, 'trained': self._trained}, file)
+
+    def _grow(self, rows):
+        """Make room for at least `rows` vectors, doubling the files."""
+        capacity = max(self._capacity, 1024)
+        while capacity < rows:
+            capacity *= 2
+        if capacity == self._capacity:
+            return
+        files = []
+        for name, dtype, width in (('vectors.f32', np.float32, self.dimensions), ('labels.i32', np.int32, 1)):
+            file_path = os.path.join(self.path, name)
+            size = capacity * width * np.dtype(dtype).itemsize
+            with open(file_path, 'ab') as file:
+                if file.tell() < size:
+                    file.truncate(size)
+            files.append(np.memmap(file_path, dtype=dtype, mode='r+', shape=(capacity, width)))
+        # Searches holding the old maps keep working, the old size is still mapped
+        self._vectors, labels = files
+        self._labels = labels[:, 0]
+        self._capacity = capacity
+
+    def _build_lists(self):
+        labels = np.asarray(self._labels[:self.count])
+        order = np.argsort(labels, kind='stable').astype(np.int64)
+        offsets = np.searchsorted(labels[order], np.arange(len(self._centroids) + 1))
+        self._lists = (order, offsets)
+        self._pending = []
+
+    def _train(self):
+        """Build the inverted lists from a sample of the stored vectors."""
+        clusters = int(min(4096, max(16, 2 * np.sqrt(self.count))))
+        generator = np.random.default_rng(self.count)
+        sample = np.sort(generator.choice(self.count, min(self.count, clusters * 64), replace=False))
+        centroids = kmeans(np.asarray(self._vectors[sample]), clusters)
+        labels = _nearest(self._vectors[:self.count], centroids)
+        with self._lock:
+            self._labels[:self.count] = labels
+            self._centroids = centroids
+            self._trained = self.count
+            self._build_lists()
+        np.save(os.path.join(self.path, 'centroids.npy'), centroids)
+        self._write_meta()
+        logger.info(f"Trained {clusters} inverted lists over {self.count} messages in {self.path}")
+
+    def known(self, message_ids):
+        """Subset of message IDs that are already stored."""
+        if not message_ids:
+            return set()
+        marks = ','.join('?' * len(message_ids))
+        with self._lock:
+            rows = self._db.execute(f"SELECT message_id FROM messages WHERE message_id IN ({marks})", list(message_ids))
+            return {row[0] for row in rows}
+
+    def add(self, records, embeddings, checkpoints=None):
+        """
+        Store embedded messages and advance channel checkpoints in one transaction.
+
+        Args:
+            records (list): (message_id, channel_id, channel name, author, created_at, content) tuples.
+            embeddings (list): One vector per record.
+            checkpoints (dict): Last indexed message ID by channel ID.
+        """
+        if not records:
+            self._save_checkpoints(checkpoints)
+            return
+        vectors = _normalize(embeddings)
+        if self.dimensions is None:
+            self.dimensions = vectors.shape[1]
+            self._write_meta()
+        elif vectors.shape[1] != self.dimensions:
+            raise ValueError(f"Embeddings have {vectors.shape[1]} dimensions, the index has {self.dimensions}. "
+                             f"Delete {self.path} to rebuild it with the new model.")
+        start = self.count
+        self._grow(start + len(vectors))
+        rows = np.arange(start, start + len(vectors))
+        labels = _nearest(vectors, self._centroids) if self._centroids is not None else np.full(len(vectors), -1, np.int32)
+        self._vectors[rows] = vectors
+        self._labels[rows] = labels
+        self._vectors.flush()
+        self._labels.flush()
+        with self._lock:
+            with self._db:
+                self._db.executemany(
+                    "INSERT INTO messages VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    [(int(row), *record) for row, record in zip(rows, records)],
+                )
+                self._advance(checkpoints)
+            self.count = start + len(vectors)
+            if self._centroids is not None:
+                self._pending.append((rows, labels))
+                if sum(len(pending) for pending, _ in self._pending) > 65536:
+                    self._build_lists()
+        if self.count >= self.train_size and self.count >= 4 * self._trained:
+            self._train()
+
+    def _advance(self, checkpoints):
+        for channel_id, message_id in (checkpoints or {}).items():
+            self._db.execute(
+                "INSERT INTO channels (channel_id, last_message_id) VALUES (?, ?) "
+                "ON CONFLICT(channel_id) DO UPDATE SET last_message_id = MAX(COALESCE(last_message_id, 0), excluded.last_message_id)",
+                (channel_id, message_id),
+            )
+
+    def _save_checkpoints(self, checkpoints):
+        with self._lock, self._db:
+            self._advance(checkpoints)
+
+    def checkpoint(self, channel_id):
+        """
+        Args:
+            channel_id (int): Channel ID.
+
+        Returns:
+            tuple: (last indexed message ID or None, whether the backfill finished).
+        """
+        with self._lock:
+            row = self._db.execute("SELECT last_message_id, complete FROM channels WHERE channel_id = ?",
+                                   (channel_id,)).fetchone()
+        return (row[0], bool(row[1])) if row else (None, False)
+
+    def mark_complete(self, channel_id):
+        with self._lock, self._db:
+            self._db.execute("INSERT INTO channels (channel_id, complete) VALUES (?, 1) "
+                             "ON CONFLICT(channel_id) DO UPDATE SET complete = 1", (channel_id,))
+
+    def forget(self, message_ids):
+        """Drop deleted messages, their vectors stay behind but are never returned."""
+        marks = ','.join('?' * len(message_ids))
+        with self._lock, self._db:
+            self._db.execute(f"DELETE FROM messages WHERE message_id IN ({marks})", list(message_ids))
+
+    def search(self, vector, k=8, channel_ids=None):
+        """
+        Find the stored messages closest to a query embedding.
+
+        Args:
+            vector (list): Query embedding.
+            k (int): Number of results.
+            channel_ids (set): Only return messages from these channels, None for any channel.
+
+        Returns:
+            list: (score, channel ID, channel name, author, created_at, content) tuples, best first.
+        """
+        query = _normalize(vector)
+        with self._lock:
+            count, vectors = self.count, self._vectors
+            centroids, lists, pending = self._centroids, self._lists, list(self._pending)
+        if not count or query.shape[0] != self.dimensions:
+            return []
+        if centroids is None:
+            candidates = np.arange(count)
+        else:
+            probe = np.argsort(centroids @ query)[-self.nprobe:]
+            order, offsets = lists
+            parts = [order[offsets[i]:offsets[i + 1]] for i in probe]
+            parts += [rows[np.isin(labels, probe)] for rows, labels in pending]
+            candidates = np.sort(np.concatenate(parts))
+        if not len(candidates):
+            return []
+        scores = vectors[candidates] @ query
+        # Ask for extra rows, some may belong to deleted messages or to channels that are
+        # filtered out, and widen the net while too few are left
+        take = min(len(candidates), k * 2)
+        while True:
+            best = np.argpartition(scores, -take)[-take:]
+            ranked = {int(candidates[i]): float(scores[i]) for i in best}
+            marks = ','.join('?' * len(ranked))
+            with self._lock:
+                rows = self._db.execute(f"SELECT row, channel_id, channel, author, created_at, content FROM messages "
+                                        f"WHERE row IN ({marks})", list(ranked)).fetchall()
+            if channel_ids is not None:
+                rows = [row for row in rows if row[1] in channel_ids]
+            if len(rows) >= k or take == len(candidates) or take >= k * 512:
+                break
+            take = min(len(candidates), take * 8)
+        results = sorted(((ranked[row], *rest) for row, *rest in rows), reverse=True)
+        return results[:k]
+
+    def stats(self):
+        """Message, channel and inverted list counts."""
+        with self._lock:
+            channels = self._db.execute("SELECT COUNT(*), COALESCE(SUM(complete), 0) FROM channels").fetchone()
+            messages = self._db.execute("SELECT COUNT(*) FROM messages").fetchone()[0]
+        return {
+            'messages': messages, 'rows': self.count, 'channels': channels[0], 'complete': channels[1],
+            'lists': 0 if self._centroids is None else len(self._centroids), 'dimensions': self.dimensions,
+        }
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+def _record(message):
+    content = message.clean_content.strip()[:MAX_MESSAGE_CHARS]
+    return (message.id, message.channel.id, getattr(message.channel, 'name', ''), str(message.author),
+            message.created_at.timestamp(), content)
+
+
+def _embed_text(record):
+    return f"{record[3]}: {record[5]}"
+
+
+def format_context(results, token_budget):
+    """
+    Fit retrieved messages into a token budget, best matches first, shown oldest first.
+
+    Args:
+        results (list): Search results, best first.
+        token_budget (int): Approximate number of tokens to use.
+
+    Returns:
+        str: One message per line, empty when nothing fits.
+    """
+    remaining = token_budget * CHARS_PER_TOKEN
+    chosen = []
+    for score, channel_id, channel, author, created_at, content in results:
+        date = datetime.datetime.fromtimestamp(created_at).strftime('%Y-%m-%d')
+        line = f"[{date} #{channel}] {author}: {content}"
+        if len(line) > remaining:
+            continue
+        remaining -= len(line) + 1
+        chosen.append((created_at, line))
+    return '\n'.join(line for _, line in sorted(chosen))
+
+
+class Retriever:
+    """
+    Keeps a MessageIndex per guild up to date and retrieves context for prompts.
+
+    Channels are backfilled from their history in batches, resuming from the last
+    indexed message. Once a channel's backfill has finished, new messages are buffered
+    and embedded in batches every `flush_interval` seconds.
+    """
+    def __init__(self, path, embed, batch_size=64, top_k=8, token_budget=1024, nprobe=16, flush_interval=30):
+        """
+        Args:
+            path (str): Directory holding one index directory per guild.
+            embed (callable): Coroutine function turning a list of texts into a list of vectors.
+            batch_size (int): Messages embedded per request.
+            top_k (int): Messages retrieved per prompt.
+            token_budget (int): Approximate tokens of context added to a prompt.
+            nprobe (int): Inverted lists scored per query.
+            flush_interval (float): Seconds between embedding batches of new messages.
+        """
+        self.path = path
+        self._embed = embed
+        self.batch_size = batch_size
+        self.top_k = top_k
+        self.token_budget = token_budget
+        self._nprobe = nprobe
+        self._flush_interval = flush_interval
+        self._indexes = {}
+        self._writers = {}
+        self._buffer = {}
+        self._live = {}
+        self._task = None
+
+    def bind(self, embed):
+        """Replace the embedding function, used when the module defining it is reloaded."""
+        self._embed = embed
+
+    @property
+    def nprobe(self):
+        """Inverted lists scored per query, setting it also applies to the open indexes."""
+        return self._nprobe
+
+    @nprobe.setter
+    def nprobe(self, value):
+        self._nprobe = value
+        for index in self._indexes.values():
+            index.nprobe = value
+
+    def has_index(self, guild_id):
+        return guild_id in self._indexes or os.path.isdir(os.path.join(self.path, str(guild_id)))
+
+    def index(self, guild_id):
+        """MessageIndex of a guild, opened on first use."""
+        if guild_id not in self._indexes:
+            self._indexes[guild_id] = MessageIndex(os.path.join(self.path, str(guild_id)), nprobe=self.nprobe)
+            self._writers[guild_id] = asyncio.Lock()
+        return self._indexes[guild_id]
+
+    def start(self):
+        """Start flushing new messages in the background."""
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    def stop(self):
+        """Stop flushing, buffered messages are kept until started again."""
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def close(self):
+        """Embed the buffered messages and close the indexes."""
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+            await self._flush_all()
+        for index in self._indexes.values():
+            index.close()
+        self._indexes.clear()
+
+    async def _store(self, guild_id, records, checkpoints=None):
+        """Embed and store records of one guild, skipping messages already indexed."""
+        index = self.index(guild_id)
+        async with self._writers[guild_id]:
+            known = await asyncio.to_thread(index.known, [record[0] for record in records])
+            records = [record for record in records if record[0] not in known]
+            embeddings = await self._embed([_embed_text(record) for record in records]) if records else []
+            await asyncio.to_thread(index.add, records, embeddings, checkpoints)
+        return len(records)
+
+    async def backfill(self, channel, progress=None):
+        """
+        Index a channel's history, resuming after the last indexed message.
+
+        Args:
+            channel (discord.TextChannel): Channel to index.
+            progress (callable): Coroutine function called with the running count after each batch.
+
+        Returns:
+            int: Number of messages added.
+        """
+        import discord
+        index = self.index(channel.guild.id)
+        last, _ = index.checkpoint(channel.id)
+        after = discord.Object(id=last) if last else None
+        batch = []
+        added = 0
+        async for message in channel.history(limit=None, after=after, oldest_first=True):
+            if message.author.bot or not message.clean_content.strip():
+                continue
+            batch.append(_record(message))
+            if len(batch) >= self.batch_size:
+                added += await self._store(channel.guild.id, batch, {channel.id: batch[-1][0]})
+                batch = []
+                if progress is not None:
+                    await progress(added)
+        if batch:
+            added += await self._store(channel.guild.id, batch, {channel.id: batch[-1][0]})
+        index.mark_complete(channel.id)
+        self._live[channel.id] = True
+        return added
+
+    def observe(self, message):
+        """
+        Buffer a new message of a channel whose backfill has finished.
+
+        Args:
+            message (discord.Message): Incoming message.
+        """
+        if message.guild is None or message.author.bot or not self.has_index(message.guild.id):
+            return
+        if message.channel.id not in self._live:
+            self._live[message.channel.id] = self.index(message.guild.id).checkpoint(message.channel.id)[1]
+        if self._live[message.channel.id] and message.clean_content.strip():
+            self._buffer.setdefault(message.guild.id, []).append(_record(message))
+
+    async def forget(self, guild_id, message_ids):
+        """Remove deleted messages from a guild's index."""
+        if self.has_index(guild_id):
+            await asyncio.to_thread(self.index(guild_id).forget, list(message_ids))
+
+    async def _flush_all(self):
+        buffer, self._buffer = self._buffer, {}
+        for guild_id, records in buffer.items():
+            checkpoints = {}
+            for record in records:
+                checkpoints[record[1]] = max(checkpoints.get(record[1], 0), record[0])
+            for start in range(0, len(records), self.batch_size):
+                try:
+                    await self._store(guild_id, records[start:start + self.batch_size],
+                                      checkpoints if start + self.batch_size >= len(records) else None)
+                except Exception as e:
+                    logger.warning(f"Failed to index new messages of guild {guild_id}, retrying next flush: {e}")
+                    # Put the rest back ahead of messages that arrived meanwhile
+                    self._buffer[guild_id] = records[start:] + self._buffer.get(guild_id, [])
+                    break
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self._flush_interval)
+            await self._flush_all()
+
+    async def context(self, guild_id, prompt, channel_ids=None):
+        """
+        Retrieve guild messages relevant to a prompt.
+
+        Args:
+            guild_id (int): Guild the prompt was sent in.
+            prompt (str): User prompt.
+            channel_ids (set): Channels the asker can read, messages from other channels are
+                               never returned. None allows every channel.
+
+        Returns:
+            str: Relevant messages within the token budget, empty when the guild has no index.
+        """
+        if not self.has_index(guild_id) or channel_ids is not None and not channel_ids:
+            return ''
+        index = self.index(guild_id)
+        if not index.count:
+            return ''
+        vector = (await self._embed([prompt]))[0]
+        results = await asyncio.to_thread(index.search, vector, self.top_k, channel_ids)
+        return format_context(results, self.token_budget)
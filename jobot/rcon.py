@@ -0,0 +1,98 @@
+# rcon.py
+import select
+import socket
+import struct
+
+_LOGIN = 3
+_COMMAND = 2
+
+
+class RconError(Exception):
+    """The server rejected the login or sent a malformed packet."""
+
+
+class RconClient:
+    """
+    Minimal Minecraft RCON client.
+
+    Uses socket timeouts for its deadlines, unlike mcrcon which relies on SIGALRM and
+    therefore only works on the main thread. Blocking, meant to run in a worker thread.
+    """
+    def __init__(self, host, password, port=25575, timeout=5):
+        """
+        Args:
+            host (str): Server address.
+            password (str): RCON password.
+            port (int): RCON port.
+            timeout (float): Connect and read deadline in seconds.
+        """
+        self.host = host
+        self.password = password
+        self.port = port
+        self.timeout = timeout
+        self._socket = None
+
+    def __enter__(self):
+        self.connect()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.disconnect()
+
+    def connect(self):
+        """Connect and log in."""
+        self._socket = socket.create_connection((self.host, self.port), timeout=self.timeout)
+        try:
+            self._send(_LOGIN, self.password)
+        except Exception:
+            self.disconnect()
+            raise
+
+    def disconnect(self):
+        if self._socket is not None:
+            self._socket.close()
+            self._socket = None
+
+    def _read(self, length):
+        data = b""
+        while len(data) < length:
+            chunk = self._socket.recv(length - len(data))
+            if not chunk:
+                raise ConnectionError("RCON connection closed")
+            data += chunk
+        return data
+
+    def _send(self, kind, text):
+        payload = struct.pack("<ii", 0, kind) + text.encode("utf8") + b"\x00\x00"
+        self._socket.sendall(struct.pack("<i", len(payload)) + payload)
+        response = ""
+        first = True
+        while True:
+            header = self._socket.recv(4, socket.MSG_PEEK)
+            if not header and not first:
+                # The server closed the connection after its answer
+                return response
+            first = False
+            (length,) = struct.unpack("<i", self._read(4))
+            packet = self._read(length)
+            request_id, _ = struct.unpack("<ii", packet[:8])
+            if packet[-2:] != b"\x00\x00":
+                raise RconError("Incorrect padding")
+            if request_id == -1:
+                raise RconError("Login failed")
+            response += packet[8:-2].decode("utf8")
+            # Long responses are split over several packets
+            if not select.select([self._socket], [], [], 0)[0]:
+                return response
+
+    def command(self, command):
+        """
+        Run a console command.
+
+        Args:
+            command (str): Command, with or without the leading slash.
+
+        Returns:
+            str: Server response.
+        """
+        return self._send(_COMMAND, command)
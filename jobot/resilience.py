@@ -0,0 +1,232 @@
+# resilience.py
+import asyncio
+import logging
+import time
+from jobot.cluster import get_store
+
+# Initialize logger
+logger = logging.getLogger("bot")
+
+# Defaults for every breaker, changed with configure
+FAILURE_THRESHOLD = 3
+RESET_TIMEOUT = 30
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half-open'
+
+
+class BackendUnavailable(Exception):
+    """Raised without calling the backend while its breaker is open."""
+    def __init__(self, name, retry_in, last_error):
+        self.name = name
+        self.retry_in = retry_in
+        self.last_error = last_error
+        super().__init__(f"{name} is down ({last_error}), retrying in {int(retry_in) + 1}s")
+
+
+class CircuitBreaker:
+    """
+    Fails fast once a backend keeps failing.
+
+    Calls go through while the breaker is closed. After `failure_threshold` failures in
+    a row it opens and every call raises BackendUnavailable straight away, so commands
+    answer at once instead of piling up behind a dead host. After `reset_timeout` one
+    call is let through as a probe (half-open), its outcome closes or reopens the breaker.
+
+    An open breaker is also recorded in the cluster store, so the other shard processes
+    back off from the same backend until the probe of the process that tripped it succeeds.
+    """
+    def __init__(self, name, failure_threshold=None, reset_timeout=None, timeout=None,
+                 failures=(Exception,), ignore=()):
+        """
+        Args:
+            name (str): Backend name shown to users.
+            failure_threshold (int): Failures in a row that open the breaker.
+            reset_timeout (float): Seconds the breaker stays open before probing.
+            timeout (float): Deadline for each call in seconds, None for no deadline.
+            failures (tuple): Exception types that count as a backend failure.
+            ignore (tuple): Exception types that never count, such as "not found" answers.
+        """
+        self.name = name
+        # Breakers without their own values follow configure
+        self._own_threshold = bool(failure_threshold)
+        self._own_reset = bool(reset_timeout)
+        self.failure_threshold = failure_threshold or FAILURE_THRESHOLD
+        self.reset_timeout = reset_timeout or RESET_TIMEOUT
+        self.timeout = timeout
+        self._failure_types = failures
+        self._ignore_types = ignore
+        self.state = CLOSED
+        self.consecutive_failures = 0
+        self.last_error = None
+        self.opened_at = 0
+        self._probing = False
+        # Counters for metrics
+        self.calls = 0
+        self.failures = 0
+        self.rejected = 0
+        self.trips = 0
+
+    def retry_in(self, now=None):
+        """Seconds until the next probe is allowed, 0 when calls go through."""
+        if self.state != OPEN:
+            return 0
+        now = time.monotonic() if now is None else now
+        return max(0, self.opened_at + self.reset_timeout - now)
+
+    @property
+    def _key(self):
+        return f'breaker:{self.name}'
+
+    def _remote(self):
+        """
+        Breaker opened by another shard process.
+
+        Returns:
+            tuple: (seconds until it may be probed, last error), (0, None) when there is none.
+        """
+        entry = get_store().state.get(self._key)
+        if entry is None:
+            return 0, None
+        until, error = entry
+        return max(0, until - time.time()), error
+
+    def _admit(self):
+        """Decide whether a call may go through, switching to half-open when the timeout is over."""
+        if self.state == OPEN and self.retry_in() == 0:
+            self.state = HALF_OPEN
+            logger.info(f"{self.name} breaker half-open, probing")
+        if self.state == CLOSED:
+            return True
+        if self.state == HALF_OPEN and not self._probing:
+            self._probing = True
+            return True
+        return False
+
+    def _success(self):
+        if self.state != CLOSED:
+            logger.info(f"{self.name} breaker closed, backend is back")
+            get_store().state.pop(self._key, None)
+        self.state = CLOSED
+        self.consecutive_failures = 0
+        self._probing = False
+
+    def _failure(self, error):
+        self.failures += 1
+        self.consecutive_failures += 1
+        self.last_error = str(error) or type(error).__name__
+        self._probing = False
+        if self.state == HALF_OPEN or self.consecutive_failures >= self.failure_threshold:
+            if self.state != OPEN:
+                self.trips += 1
+                logger.warning(f"{self.name} breaker open after {self.consecutive_failures} failures: {self.last_error}")
+            self.state = OPEN
+            self.opened_at = time.monotonic()
+            get_store().state[self._key] = (time.time() + self.reset_timeout, self.last_error)
+
+    async def call(self, func, *args, **kwargs):
+        """
+        Call a coroutine function through the breaker.
+
+        Args:
+            func (callable): Coroutine function, for blocking functions pass asyncio.to_thread
+                             and the function as the first argument.
+            args: Positional arguments for func.
+            kwargs: Keyword arguments for func.
+
+        Returns:
+            Any: Return value of func.
+
+        Raises:
+            BackendUnavailable: The breaker is open.
+            TimeoutError: The call took longer than the deadline.
+        """
+        if not self._admit():
+            self.rejected += 1
+            raise BackendUnavailable(self.name, self.retry_in(), self.last_error)
+        if self.state == CLOSED:
+            retry_in, error = self._remote()
+            if retry_in:
+                self.rejected += 1
+                raise BackendUnavailable(self.name, retry_in, error)
+        self.calls += 1
+        try:
+            async with asyncio.timeout(self.timeout):
+                result = await func(*args, **kwargs)
+        except asyncio.CancelledError:
+            self._probing = False
+            raise
+        except self._ignore_types:
+            self._success()
+            raise
+        except self._failure_types as e:
+            self._failure(e)
+            raise
+        self._success()
+        return result
+
+    def snapshot(self):
+        """
+        Current state and counters.
+
+        Returns:
+            dict: State, retry delay, last error and call counters.
+        """
+        return {
+            'state': self.state,
+            'retry_in': round(self.retry_in(), 1),
+            'last_error': self.last_error,
+            'calls': self.calls,
+            'failures': self.failures,
+            'rejected': self.rejected,
+            'trips': self.trips,
+        }
+
+
+# Breakers by backend name
+_breakers = {}
+
+
+def breaker(name, **kwargs):
+    """
+    Get the breaker of a backend, creating it on first use.
+
+    Args:
+        name (str): Backend name.
+        kwargs: CircuitBreaker arguments, only used when the breaker is created.
+
+    Returns:
+        CircuitBreaker: Shared breaker for the backend.
+    """
+    if name not in _breakers:
+        _breakers[name] = CircuitBreaker(name, **kwargs)
+    return _breakers[name]
+
+
+def configure(failure_threshold, reset_timeout):
+    """
+    Change the defaults, for new breakers and for existing ones created without their own values.
+
+    Args:
+        failure_threshold (int): Failures in a row that open a breaker.
+        reset_timeout (float): Seconds a breaker stays open before probing.
+    """
+    global FAILURE_THRESHOLD, RESET_TIMEOUT
+    FAILURE_THRESHOLD = failure_threshold
+    RESET_TIMEOUT = reset_timeout
+    for breaker in _breakers.values():
+        if not breaker._own_threshold:
+            breaker.failure_threshold = failure_threshold
+        if not breaker._own_reset:
+            breaker.reset_timeout = reset_timeout
+
+
+def snapshot():
+    """
+    State of every breaker.
+
+    Returns:
+        dict: Breaker snapshots by backend name.
+    """
+    return {name: breaker.snapshot() for name, breaker in _breakers.items()}
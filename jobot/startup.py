@@ -0,0 +1,76 @@
+# startup.py
+import logging
+import os
+import time
+
+# Initialize logger
+logger = logging.getLogger("bot")
+
+
+def process_started():
+    """
+    When this process started, on the perf_counter clock.
+
+    Read from /proc so the time the interpreter spends before the first import is counted.
+
+    Returns:
+        float: perf_counter value at process start, None when the system does not tell.
+    """
+    try:
+        with open('/proc/self/stat') as file:
+            # The command name may contain spaces, fields are counted after it
+            fields = file.read().rsplit(')', 1)[1].split()
+        with open('/proc/uptime') as file:
+            uptime = float(file.read().split()[0])
+        started = int(fields[19]) / os.sysconf('SC_CLK_TCK')
+    except (OSError, ValueError, IndexError):
+        return None
+    return time.perf_counter() - (uptime - started)
+
+
+class StartupTimer:
+    """
+    Records how long each startup phase takes, from process start to ready.
+    """
+    def __init__(self, origin=None):
+        """
+        Args:
+            origin (float): perf_counter value startup is measured from, defaults to the
+                            process start or now when that is unknown.
+        """
+        if origin is None:
+            origin = process_started()
+        self._origin = origin if origin is not None else time.perf_counter()
+        self._marks = []
+        self._reported = False
+
+    def mark(self, phase):
+        """
+        Record the end of a startup phase.
+
+        Args:
+            phase (str): Name of the phase that just finished.
+        """
+        self._marks.append((phase, time.perf_counter()))
+
+    def elapsed(self):
+        """Seconds since the origin."""
+        return time.perf_counter() - self._origin
+
+    def report(self):
+        """
+        Log the time spent in each phase, only the first call logs.
+
+        Returns:
+            str: Report text.
+        """
+        previous = self._origin
+        phases = []
+        for phase, at in self._marks:
+            phases.append(f"{phase} {(at - previous) * 1000:.0f} ms")
+            previous = at
+        text = f"Startup timing: {', '.join(phases)} (total {(previous - self._origin):.2f}s)"
+        if not self._reported:
+            self._reported = True
+            logger.info(text)
+        return text
@@ -0,0 +1,59 @@
+# state.py
+import inspect
+import logging
+
+# Initialize logger
+logger = logging.getLogger("bot")
+
+# Long-lived objects by name, in creation order
+_objects = {}
+
+
+def shared(name, factory):
+    """
+    Get a long-lived object, creating it on first use.
+
+    Command modules are extensions that get imported again on reload, anything they
+    build at import time would be built again. Routers, collectors, caches and other
+    objects holding connections or warm state are kept here instead, so a reloaded
+    module picks up the running instance.
+
+    Args:
+        name (str): Unique name of the object.
+        factory (callable): Creates the object, only called the first time.
+
+    Returns:
+        object: The shared object.
+    """
+    if name not in _objects:
+        _objects[name] = factory()
+    return _objects[name]
+
+
+def get(name, default=None):
+    """
+    Get a shared object without creating it.
+
+    Args:
+        name (str): Name the object was shared under.
+        default (object): Returned when there is no such object.
+
+    Returns:
+        object: The shared object or default.
+    """
+    return _objects.get(name, default)
+
+
+async def close():
+    """Close every shared object that has a close method, newest first."""
+    for name, value in reversed(list(_objects.items())):
+        closer = getattr(value, 'close', None)
+        if closer is None:
+            continue
+        try:
+            result = closer()
+            if inspect.isawaitable(result):
+                await result
+        except Exception as e:
+            logger.error(f"Failed to close {name}: {e}")
+    _objects.clear()
@@ -0,0 +1,265 @@
+# telemetry.py
+import asyncio
+import datetime
+import io
+import logging
+import os
+import time
+import numpy as np
+
+# Initialize logger
+logger = logging.getLogger("bot")
+
+METRICS = ('vm', 'online', 'players', 'latency', 'cpu', 'mem')
+
+
+class _Tier:
+    """Fixed size ring buffer of timestamps and metric values."""
+    def __init__(self, step, capacity):
+        """
+        Args:
+            step (float): Seconds per point, 0 keeps samples as they come.
+            capacity (int): Number of points kept.
+        """
+        self.step = step
+        self.capacity = capacity
+        self.times = np.full(capacity, np.nan)
+        self.values = np.full((capacity, len(METRICS)), np.nan)
+        self.index = 0
+        self.size = 0
+        # Running sums for the bucket currently being filled
+        self.bucket = None
+        self.sums = np.zeros(len(METRICS))
+        self.counts = np.zeros(len(METRICS))
+
+    def append(self, timestamp, row):
+        self.times[self.index] = timestamp
+        self.values[self.index] = row
+        self.index = (self.index + 1) % self.capacity
+        self.size = min(self.size + 1, self.capacity)
+
+    def ordered(self):
+        """Timestamps and values, oldest first."""
+        if self.size < self.capacity:
+            return self.times[:self.size], self.values[:self.size]
+        order = np.r_[self.index:self.capacity, 0:self.index]
+        return self.times[order], self.values[order]
+
+
+class TimeSeries:
+    """
+    Multi-resolution time series kept in memory.
+
+    Samples go into a raw tier, each older tier stores averages over a longer step.
+    Every tier is a fixed size ring buffer so memory use stays constant, and a query
+    reads from the finest tier that still covers the requested window.
+    """
+    def __init__(self, tiers=((0, 2880), (300, 2016), (1800, 1440))):
+        """
+        Args:
+            tiers (tuple): (step seconds, capacity) per tier, finest first. The defaults
+                           keep a day of 30s samples, a week at 5 min and a month at 30 min.
+        """
+        self._tiers = [_Tier(step, capacity) for step, capacity in tiers]
+        self.motd = None
+        self.last_sample = None
+
+    def add(self, timestamp=None, **values):
+        """
+        Record a sample.
+
+        Args:
+            timestamp (float): Unix time of the sample, defaults to now.
+            values (float): Metric values by name, missing metrics are stored as NaN.
+        """
+        timestamp = time.time() if timestamp is None else timestamp
+        row = np.array([values.get(name, np.nan) for name in METRICS], dtype=float)
+        self._tiers[0].append(timestamp, row)
+        self.last_sample = (timestamp, dict(zip(METRICS, row)))
+        for tier in self._tiers[1:]:
+            bucket = timestamp // tier.step
+            if tier.bucket is not None and bucket != tier.bucket:
+                # Close the previous bucket and store its average
+                with np.errstate(invalid='ignore', divide='ignore'):
+                    average = np.where(tier.counts > 0, tier.sums / tier.counts, np.nan)
+                tier.append(tier.bucket * tier.step, average)
+                tier.sums[:] = 0
+                tier.counts[:] = 0
+            tier.bucket = bucket
+            present = ~np.isnan(row)
+            tier.sums[present] += row[present]
+            tier.counts[present] += 1
+
+    def save(self, path):
+        """
+        Write the series to a .npz file so history survives restarts.
+
+        The file is written next to the old one and swapped in, a crash while saving
+        leaves the previous history in place.
+
+        Args:
+            path (str): File path.
+        """
+        arrays = {'motd': np.array(self.motd or '')}
+        for i, tier in enumerate(self._tiers):
+            arrays[f'times{i}'] = tier.times
+            arrays[f'values{i}'] = tier.values
+            arrays[f'state{i}'] = np.array([tier.index, tier.size, np.nan if tier.bucket is None else tier.bucket])
+            arrays[f'sums{i}'] = tier.sums
+            arrays[f'counts{i}'] = tier.counts
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        partial = f"{path}.partial"
+        with open(partial, 'wb') as file:
+            np.savez(file, **arrays)
+        os.replace(partial, path)
+
+    def load(self, path):
+        """
+        Restore a series written by save, tiers that do not match the current layout are skipped.
+
+        Args:
+            path (str): File path.
+        """
+        with np.load(path) as data:
+            self.motd = str(data['motd']) or None
+            for i, tier in enumerate(self._tiers):
+                if f'times{i}' not in data or data[f'values{i}'].shape != tier.values.shape:
+                    continue
+                tier.times[:] = data[f'times{i}']
+                tier.values[:] = data[f'values{i}']
+                index, size, bucket = data[f'state{i}']
+                tier.index, tier.size = int(index), int(size)
+                tier.bucket = None if np.isnan(bucket) else bucket
+                tier.sums[:] = data[f'sums{i}']
+                tier.counts[:] = data[f'counts{i}']
+
+    def query(self, window, now=None):
+        """
+        Get the samples of the last `window` seconds.
+
+        Args:
+            window (float): Length of the window in seconds.
+            now (float): End of the window, defaults to now.
+
+        Returns:
+            tuple: (timestamps, {metric: values}) as numpy arrays, oldest first.
+        """
+        now = time.time() if now is None else now
+        since = now - window
+        chosen = self._tiers[-1]
+        for tier in self._tiers:
+            times, _ = tier.ordered()
+            if tier.size and (tier.size < tier.capacity or times[0] <= since):
+                chosen = tier
+                break
+        times, values = chosen.ordered()
+        mask = times >= since
+        return times[mask], {name: values[mask, i] for i, name in enumerate(METRICS)}
+
+
+def render_chart(times, values, title):
+    """
+    Draw player count, latency and VM load as a PNG.
+
+    Args:
+        times (ndarray): Unix timestamps.
+        values (dict): Metric arrays by name.
+        title (str): Chart title.
+
+    Returns:
+        bytes: PNG image.
+    """
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+    import matplotlib.dates as mdates
+
+    dates = [datetime.datetime.fromtimestamp(t) for t in times]
+    figure, (players, latency, load) = plt.subplots(3, 1, figsize=(8, 7), sharex=True)
+    figure.suptitle(title)
+    players.step(dates, values['players'], where='post', color='#33d17a')
+    players.set_ylabel('Players')
+    latency.plot(dates, values['latency'], color='#3584e4')
+    latency.set_ylabel('Latency (ms)')
+    load.plot(dates, values['cpu'], label='CPU', color='#f6d32d')
+    load.plot(dates, values['mem'], label='RAM', color='#f66151')
+    load.set_ylabel('VM load (%)')
+    load.set_ylim(0, 100)
+    load.legend(loc='upper left')
+    load.xaxis.set_major_formatter(mdates.DateFormatter('%m-%d %H:%M'))
+    figure.autofmt_xdate()
+    buffer = io.BytesIO()
+    figure.savefig(buffer, format='png', dpi=100)
+    plt.close(figure)
+    return buffer.getvalue()
+
+
+class TelemetryCollector:
+    """
+    Samples the server on an interval into a TimeSeries.
+    """
+    def __init__(self, sample, series=None, interval=30, path=None, save_every=20):
+        """
+        Args:
+            sample (callable): Coroutine function returning (metrics dict, motd).
+            series (TimeSeries): Where samples are stored.
+            interval (float): Seconds between samples.
+            path (str): .npz file the series is loaded from on start and saved to.
+            save_every (int): Samples between saves, 0 only saves on close.
+        """
+        self._sample = sample
+        self.series = series or TimeSeries()
+        self.interval = interval
+        self.save_every = save_every
+        self._path = path
+        self._task = None
+        self._unsaved = 0
+        self._saving = None
+
+    def bind(self, sample):
+        """Replace the sample function, used when the module defining it is reloaded."""
+        self._sample = sample
+
+    def start(self):
+        """Start sampling in the background."""
+        if self._task is None:
+            if self._path and os.path.exists(self._path):
+                try:
+                    self.series.load(self._path)
+                except Exception as e:
+                    logger.warning(f"Failed to load telemetry history: {e}")
+            self._task = asyncio.create_task(self._run())
+
+    async def close(self):
+        """Stop sampling and save the history."""
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+            await self._save()
+
+    async def _save(self):
+        """Write the series in a thread, samples are only added between saves."""
+        if not self._path:
+            return
+        # A save cancelled with the sampling task keeps running, wait for it instead of writing twice
+        if self._saving is None or self._saving.done():
+            self._saving = asyncio.ensure_future(asyncio.to_thread(self.series.save, self._path))
+        try:
+            await asyncio.shield(self._saving)
+            self._unsaved = 0
+        except Exception as e:
+            logger.warning(f"Failed to save telemetry history: {e}")
+
+    async def _run(self):
+        while True:
+            try:
+                metrics, motd = await self._sample()
+                self.series.add(**metrics)
+                if motd is not None:
+                    self.series.motd = motd
+                self._unsaved += 1
+            except Exception as e:
+                logger.warning(f"Telemetry sample failed: {e}")
+            if self.save_every and self._unsaved >= self.save_every:
+                await self._save()
+            await asyncio.sleep(self.interval)
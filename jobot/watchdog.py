@@ -0,0 +1,188 @@
+# watchdog.py
+import asyncio
+import collections
+import logging
+import sys
+import threading
+import time
+import traceback
+
+# Initialize logger
+logger = logging.getLogger("bot")
+
+
+def _find_command(frame):
+    """
+    Walk up a stack looking for a command context.
+
+    Args:
+        frame (frame): Innermost frame of the stalled thread.
+
+    Returns:
+        tuple: (command name, author) or (None, None) if no command is running.
+    """
+    while frame is not None:
+        ctx = frame.f_locals.get('ctx')
+        if ctx is not None and hasattr(ctx, 'command') and hasattr(ctx, 'author'):
+            name = ctx.command.qualified_name if ctx.command else None
+            return name, ctx.author
+        frame = frame.f_back
+    return None, None
+
+
+class LoopWatchdog:
+    """
+    Measures event loop latency and reports stalls.
+
+    A heartbeat task on the loop records when it last ran, and a sampling thread
+    checks that timestamp. When the loop has not ticked for longer than the threshold
+    the sampling thread grabs the loop thread's stack, so the blocking call is
+    visible in the log together with the command and user that triggered it.
+    """
+    def __init__(self, threshold=0.5, interval=0.1, history=600):
+        """
+        Initialize the watchdog.
+
+        Args:
+            threshold (float): Seconds without a heartbeat before a stall is reported.
+            interval (float): Seconds between heartbeats and between checks.
+            history (int): Number of recent lag samples to keep.
+        """
+        self._threshold = threshold
+        self._interval = interval
+        self._lags = collections.deque(maxlen=history)
+        self._last_beat = time.monotonic()
+        self._reported_beat = None
+        self._thread_id = None
+        self._task = None
+        self._thread = None
+        self._stop = threading.Event()
+        self.max_lag = 0.0
+        self.stalls = 0
+
+    @property
+    def lags(self):
+        """Recent loop lag samples in seconds."""
+        return list(self._lags)
+
+    @property
+    def thread_id(self):
+        """Thread identifier of the watched event loop."""
+        return self._thread_id
+
+    def start(self):
+        """Start watching the running loop. Must be called from the loop thread."""
+        if self._task is not None:
+            return
+        self._thread_id = threading.get_ident()
+        self._last_beat = time.monotonic()
+        self._stop.clear()
+        self._task = asyncio.get_running_loop().create_task(self._heartbeat())
+        self._thread = threading.Thread(target=self._watch, name="loop-watchdog", daemon=True)
+        self._thread.start()
+        logger.info(f"Loop watchdog started (threshold {self._threshold}s)")
+
+    def stop(self):
+        """Stop the heartbeat task and the sampling thread."""
+        self._stop.set()
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        if self._thread is not None:
+            self._thread.join(timeout=1)
+            self._thread = None
+
+    async def _heartbeat(self):
+        """Sleep for one interval at a time and record how late each wake-up was."""
+        while True:
+            start = time.monotonic()
+            await asyncio.sleep(self._interval)
+            now = time.monotonic()
+            lag = max(0.0, now - start - self._interval)
+            self._lags.append(lag)
+            self.max_lag = max(self.max_lag, lag)
+            self._last_beat = now
+
+    def _watch(self):
+        """Sampling thread body, reports each stall once."""
+        while not self._stop.wait(self._interval):
+            beat = self._last_beat
+            stalled = time.monotonic() - beat
+            if stalled < self._threshold or self._reported_beat == beat:
+                continue
+            self._reported_beat = beat
+            self.stalls += 1
+            frame = sys._current_frames().get(self._thread_id)
+            if frame is None:
+                continue
+            command, user = _find_command(frame)
+            stack = ''.join(traceback.format_stack(frame))
+            logger.warning(
+                f"Event loop stalled for {stalled:.2f}s "
+                f"(command: {command or 'none'}, user: {user or 'none'})\n{stack}"
+            )
+
+
+def sample_stacks(thread_id, seconds, interval=0.005):
+    """
+    Sample the stack of a thread at a fixed rate.
+
+    Args:
+        thread_id (int): Thread to sample.
+        seconds (float): Length of the sampling session.
+        interval (float): Seconds between samples.
+
+    Returns:
+        tuple: (Counter of stacks, number of samples). Each stack is a tuple of
+               (filename, line number, function name), outermost first.
+    """
+    stacks = collections.Counter()
+    samples = 0
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        frame = sys._current_frames().get(thread_id)
+        if frame is not None:
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append((code.co_filename, frame.f_lineno, code.co_name))
+                frame = frame.f_back
+            stacks[tuple(reversed(stack))] += 1
+            samples += 1
+        time.sleep(interval)
+    return stacks, samples
+
+
+def render_profile(stacks, samples, top=30):
+    """
+    Format sampled stacks as a text report.
+
+    The report lists the hottest functions by self and cumulative samples, followed by
+    the collapsed stacks, which can be fed to flamegraph tools as-is.
+
+    Args:
+        stacks (Counter): Stacks as returned by sample_stacks.
+        samples (int): Total number of samples.
+        top (int): Number of functions to list in each table.
+
+    Returns:
+        str: Report text.
+    """
+    own = collections.Counter()
+    total = collections.Counter()
+    for stack, count in stacks.items():
+        frames = [f"{name} ({filename}:{lineno})" for filename, lineno, name in stack]
+        own[frames[-1]] += count
+        for frame in set(frames):
+            total[frame] += count
+
+    lines = [f"Samples: {samples}", "", "Self samples:"]
+    for frame, count in own.most_common(top):
+        lines.append(f"{count:>8} {count / max(samples, 1):>7.1%}  {frame}")
+    lines += ["", "Cumulative samples:"]
+    for frame, count in total.most_common(top):
+        lines.append(f"{count:>8} {count / max(samples, 1):>7.1%}  {frame}")
+    lines += ["", "Collapsed stacks:"]
+    for stack, count in stacks.most_common():
+        lines.append(f"{';'.join(name for _, _, name in stack)} {count}")
+    return '\n'.join(lines)
@@ -1,72 +1,241 @@
 # main.py
+import asyncio
+import signal
+import time
+import aiohttp
 import discord
 from discord.ext import commands
 import settings
-from jobot.commands.llm import llm_commands
-from jobot.commands.misc import misc_commands
-from jobot.commands.minecraft import mc_commands
+from jobot import state
+from jobot.config import ConfigWatcher
+from jobot.watchdog import LoopWatchdog
+from jobot.cluster import JobServer, run_cluster
+from jobot.compute import compute
+from jobot.startup import StartupTimer
 
 # Initialize logger
 logger = settings.logging.getLogger("bot")
 
+# Startup phases are measured from process start
+startup = StartupTimer()
+startup.mark("imports")
+
+# Command modules, loaded as extensions so $reload can swap them while connected
+EXTENSIONS = (
+    'jobot.commands.llm',
+    'jobot.commands.misc',
+    'jobot.commands.minecraft',
+    'jobot.commands.admin',
+    'jobot.commands.slash',
+)
+
+# Errors that retrying will not fix
+_FATAL_ERRORS = (discord.LoginFailure, discord.PrivilegedIntentsRequired)
+
 class DiscordBot:
     """
     Main class containing discord bot
     """
-    def __init__(self):
+    def __init__(self, shard_ids=None, shard_count=None):
         """
         Initialize the Discord bot with settings.
 
+        An AutoShardedBot is used when sharding is enabled in settings or shard IDs are
+        given, otherwise a plain Bot.
+
+        Args:
+            shard_ids (list): Shards this process runs, None for all of them.
+            shard_count (int): Total number of shards, None lets Discord decide.
+
         Attributes:
             _bot (command.Bot): Command handling bot object.
+            is_primary (bool): Whether this process runs shard 0 and owns cluster-wide background work.
+            _watchdog (LoopWatchdog): Event loop stall detector, None unless enabled.
+            _config (ConfigWatcher): Applies the config file on top of the environment.
+            _sync_task (Task): App command sync started by the setup hook.
         """
+        # Config file values have to be in place before the command modules read them
+        self._config = state.shared('config', lambda: ConfigWatcher(settings.CONFIG_FILE, settings, settings.CONFIG_POLL))
+        self._config.apply()
         intents = discord.Intents.default()
         intents.members = True
-        intents.message_content = True
+        if settings.PREFIX_COMMANDS or settings.RAG_ENABLED:
+            # Prefix commands and the retrieval index both read message text
+            intents.message_content = True
+        else:
+            # Slash commands only, skip the message events of every guild
+            intents.messages = False
         self._prefix = "$"
-        self._bot = commands.Bot(command_prefix=self._prefix, intents=intents)
+        if settings.SHARDING or shard_ids is not None:
+            self._bot = commands.AutoShardedBot(
+                command_prefix=self._prefix,
+                intents=intents,
+                shard_ids=shard_ids,
+                shard_count=shard_count or settings.SHARD_COUNT or None,
+            )
+        else:
+            self._bot = commands.Bot(command_prefix=self._prefix, intents=intents)
+        self.is_primary = shard_ids is None or 0 in shard_ids
+        # Extensions start cluster-wide background work only on the primary
+        self._bot.is_primary = self.is_primary
+        self._bot.setup_hook = self._setup_hook
+        self._sync_task = None
+        self._watchdog = LoopWatchdog(settings.LOOP_STALL_THRESHOLD) if settings.LOOP_WATCHDOG else None
         self._register_events()
-        self._register_commands()
+
+    async def _setup_hook(self):
+        """Start background services once the event loop is running"""
+        # login() awaits this hook once the token and application info are fetched
+        startup.mark("login")
+        if self._watchdog:
+            self._watchdog.start()
+        compute.configure(settings.COMPUTE_WORKERS, settings.COMPUTE_INLINE_BYTES)
+        compute.start()
+        self._config.start()
+        await self._load_extensions()
+        startup.mark("commands")
+        if self.is_primary:
+            # Jobs queued by the other shard processes run here
+            state.shared('cluster_jobs', JobServer).start()
+        if self.is_primary and settings.SYNC_APP_COMMANDS:
+            # Keep a reference, the event loop only holds a weak one
+            self._sync_task = asyncio.create_task(self._sync_app_commands())
+        startup.mark("setup")
+
+    async def _sync_app_commands(self):
+        """Publish the slash commands to Discord"""
+        try:
+            if settings.APP_COMMAND_GUILD:
+                guild = discord.Object(id=settings.APP_COMMAND_GUILD)
+                self._bot.tree.copy_global_to(guild=guild)
+                synced = await self._bot.tree.sync(guild=guild)
+            else:
+                synced = await self._bot.tree.sync()
+            logger.info(f"Synced {len(synced)} app commands")
+        except discord.HTTPException as e:
+            logger.error(f"Failed to sync app commands: {e}")
+
+    async def _shutdown(self):
+        """Stop background services and close the bot"""
+        logger.info("Shutting down...")
+        if not self._bot.is_closed():
+            await self._bot.close()
+        if self._watchdog:
+            self._watchdog.stop()
+        # Routers, collectors and indexes kept across reloads, newest first
+        await state.close()
+        await asyncio.to_thread(compute.shutdown)
 
     def _register_events(self):
         """Event logger"""
         @self._bot.event
         async def on_ready():
-            logger.info(f"User: {self._bot.user} (ID: {self._bot.user.id})")
+            logger.info(f"User: {self._bot.user} (ID: {self._bot.user.id}, shards: {getattr(self._bot, 'shard_ids', None) or 'all'})")
+            startup.mark("ready")
+            startup.report()
             await self._bot.change_presence(
                 activity=discord.Activity(type=discord.ActivityType.playing, name=f'{self._prefix}help')
             )
 
-    def _register_commands(self):
-        """Register avaliable commands"""
-        llm_commands(self._bot)
-        misc_commands(self._bot)
-        mc_commands(self._bot)
+    async def _load_extensions(self):
+        """Load the command modules, a broken module leaves the others working"""
+        for extension in EXTENSIONS:
+            if extension in self._bot.extensions:
+                continue
+            try:
+                await self._bot.load_extension(extension)
+            except commands.ExtensionError as e:
+                logger.error(f"Failed to load {extension}: {e.__cause__ or e}")
+
+    def run(self, max_retries=30):
+        """
+        Run Discord bot using token from settings until it is stopped.
+
+        Args:
+            max_retries (int): Maximum number of consecutive failures before giving up.
+        """
+        try:
+            asyncio.run(self._supervise(max_retries))
+        except KeyboardInterrupt:
+            pass
 
-    def run(self, max_retries=30, delay=30):
+    async def _supervise(self, max_retries):
         """
-        Run Discord bot using token from settings, with retry on failure.
+        Log in and keep the gateway connection up, with exponential backoff and jitter.
+
+        Gateway drops are resumed by discord.py's own reconnect loop, this only handles
+        errors that escape it. The bot object is reused between attempts, so commands,
+        caches and pools survive a reconnect.
 
         Args:
-            max_retries (int): Maximum number of retries before giving up.
-            delay (int): Delay between retries in seconds.
+            max_retries (int): Maximum number of consecutive failures before giving up.
         """
+        stopping = asyncio.Event()
+
+        def stop():
+            stopping.set()
+            asyncio.ensure_future(self._bot.close())
+
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(sig, stop)
+
+        backoff = discord.backoff.ExponentialBackoff()
         attempt = 0
-        while attempt < max_retries:
-            try:
-                logger.info("Starting Discord bot...")
-                self._bot.run(settings.DISCORD_API_TOKEN, root_logger=True)
-            except discord.DiscordException as e:
-                attempt += 1
-                logger.error(f"Failed to connect to Discord (Attempt {attempt}/{max_retries}): {e}")
-                if attempt < max_retries:
-                    logger.info(f"Retrying in {delay} seconds...")
-                    time.sleep(delay)
-                else:
-                    logger.error("Max retries reached. Exiting.")
-                    break
+        try:
+            async with self._bot:
+                while not stopping.is_set():
+                    connected_at = time.monotonic()
+                    try:
+                        # The library closes the bot on some errors, reopen it in place
+                        if self._bot.is_closed():
+                            self._bot.clear()
+                        logger.info("Starting Discord bot...")
+                        if self._bot.user is None:
+                            await self._bot.login(settings.DISCORD_API_TOKEN)
+                        await self._bot.connect(reconnect=True)
+                        break
+                    except _FATAL_ERRORS as e:
+                        logger.error(f"Cannot connect to Discord: {e}")
+                        break
+                    except (discord.DiscordException, aiohttp.ClientError, OSError, asyncio.TimeoutError) as e:
+                        # A long healthy run starts the count over
+                        if time.monotonic() - connected_at > 300:
+                            attempt = 0
+                        attempt += 1
+                        logger.error(f"Failed to connect to Discord (Attempt {attempt}/{max_retries}): {e}")
+                        if attempt >= max_retries:
+                            logger.error("Max retries reached. Exiting.")
+                            break
+                        delay = backoff.delay()
+                        logger.info(f"Retrying in {delay:.1f} seconds...")
+                        try:
+                            await asyncio.wait_for(stopping.wait(), timeout=delay)
+                        except asyncio.TimeoutError:
+                            pass
+        finally:
+            await self._shutdown()
+
+def run_shard_cluster(cluster_id, shard_ids, shard_count):
+    """
+    Entry point of a shard process started by the cluster coordinator.
+
+    Args:
+        cluster_id (int): Index of this process.
+        shard_ids (list): Shards this process runs.
+        shard_count (int): Total number of shards.
+    """
+    settings.configure_logging()
+    logger.info(f"Cluster {cluster_id} running shards {shard_ids} of {shard_count}")
+    bot = DiscordBot(shard_ids=shard_ids, shard_count=shard_count)
+    bot.run()
 
 def main():
+    settings.configure_logging()
+    if settings.SHARD_PROCESSES > 1:
+        run_cluster(run_shard_cluster, settings.SHARD_PROCESSES, settings.SHARD_COUNT or None,
+                    token=settings.DISCORD_API_TOKEN)
+        return
     bot = DiscordBot()
     bot.run()
 
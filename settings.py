@@ -1,7 +1,9 @@
+import atexit
 import os
 import logging
 from logging.config import dictConfig
 from dotenv import load_dotenv
+from jobot.logs import start_listeners
 
 # import from .env
 load_dotenv()
@@ -9,7 +11,101 @@ DISCORD_API_TOKEN = os.getenv('DISCORD_TOKEN')
 LLM_ADDRESS = os.getenv('LLM_ADDRESS')
 IMG_ADDRESS = os.getenv('IMG_ADDRESS')
 
+# Ollama routing, LLM_ADDRESSES is a comma separated list and falls back to LLM_ADDRESS
+LLM_ADDRESSES = [address.strip() for address in os.getenv('LLM_ADDRESSES', LLM_ADDRESS or '').split(',') if address.strip()]
+LLM_CHAT_MODEL = os.getenv('LLM_CHAT_MODEL', 'discord-bot:latest')
+LLM_VISION_MODEL = os.getenv('LLM_VISION_MODEL', 'llava:13b')
+LLM_WARM_MODELS = [model.strip() for model in os.getenv('LLM_WARM_MODELS', LLM_CHAT_MODEL).split(',') if model.strip()]
+LLM_ACTIVE_HOURS = os.getenv('LLM_ACTIVE_HOURS', '')  # e.g. 8-23, empty disables keep-warm
+LLM_ACTIVE_KEEP_ALIVE = os.getenv('LLM_ACTIVE_KEEP_ALIVE', '1h')
+LLM_HEALTH_INTERVAL = float(os.getenv('LLM_HEALTH_INTERVAL', '30'))
+
+# backend deadlines in seconds, generation can legitimately take a while
+LLM_CONNECT_TIMEOUT = float(os.getenv('LLM_CONNECT_TIMEOUT', '5'))
+LLM_TIMEOUT = float(os.getenv('LLM_TIMEOUT', '120'))
+IMG_TIMEOUT = float(os.getenv('IMG_TIMEOUT', '180'))
+# circuit breakers, failures in a row before a backend counts as down and seconds before probing it again
+BREAKER_FAILURES = int(os.getenv('BREAKER_FAILURES', '3'))
+BREAKER_RESET = float(os.getenv('BREAKER_RESET', '30'))
+
+# retrieval of guild messages for $chat, channels are indexed with $index
+RAG_ENABLED = os.getenv('RAG_ENABLED', 'false').lower() in ('1', 'true', 'yes')
+RAG_EMBED_MODEL = os.getenv('RAG_EMBED_MODEL', 'nomic-embed-text')
+RAG_DIR = os.getenv('RAG_DIR', 'data/rag')
+RAG_TOP_K = int(os.getenv('RAG_TOP_K', '8'))
+RAG_TOKEN_BUDGET = int(os.getenv('RAG_TOKEN_BUDGET', '1024'))
+RAG_BATCH_SIZE = int(os.getenv('RAG_BATCH_SIZE', '64'))
+RAG_NPROBE = int(os.getenv('RAG_NPROBE', '16'))
+RAG_FLUSH_INTERVAL = float(os.getenv('RAG_FLUSH_INTERVAL', '30'))
+
+# Minecraft server, Proxmox VM and SSH access
+PROXMOX_ADDRESS = os.getenv('PROXMOX_ADDRESS')
+PROXMOX_USER = os.getenv('PROXMOX_USER')
+PROXMOX_PASSWORD = os.getenv('PROXMOX_PASSWORD')
+PROXMOX_NODE = os.getenv('PROXMOX_NODE', 'pve1')
+PROXMOX_VMID = os.getenv('PROXMOX_VMID', '105')
+SSH_HOST = os.getenv('SSH_HOST')
+SSH_USER = os.getenv('SSH_USER')
+SSHK = os.getenv('SSHK')
+MINECRAFT_ADDRESS = os.getenv('MINECRAFT_ADDRESS')
+MINECRAFT_PORT = int(os.getenv('MINECRAFT_PORT', '25565'))
+MC_RCON_PASSWORD = os.getenv('MC_RCON_PASSWORD')
+MC_RCON_PORT = int(os.getenv('MC_RCON_PORT', '25575'))
+MC_SERVER_HOME = os.getenv('MC_SERVER_HOME', '/home/appleboblin')
+MC_START_SCRIPT = os.getenv('MC_START_SCRIPT', '')  # empty uses start-screen in MC_SERVER_HOME
+MC_WORLD_SNAPSHOTS = int(os.getenv('MC_WORLD_SNAPSHOTS', '3'))
+MC_LOG_PATH = os.getenv('MC_LOG_PATH', '')  # empty follows the most recently used modpack directory
+MC_LOG_FILE = os.getenv('MC_LOG_FILE', '')  # local file to follow instead, for testing
+
+# Minecraft backend deadlines in seconds
+PROXMOX_TIMEOUT = float(os.getenv('PROXMOX_TIMEOUT', '10'))
+SSH_TIMEOUT = float(os.getenv('SSH_TIMEOUT', '10'))
+RCON_TIMEOUT = float(os.getenv('RCON_TIMEOUT', '5'))
+MC_STATUS_TIMEOUT = float(os.getenv('MC_STATUS_TIMEOUT', '5'))
+
+# Minecraft telemetry, history is kept in MC_TELEMETRY_FILE between restarts
+MC_TELEMETRY_INTERVAL = float(os.getenv('MC_TELEMETRY_INTERVAL', '30'))
+MC_TELEMETRY_FILE = os.getenv('MC_TELEMETRY_FILE', 'data/telemetry.npz')
+MC_TELEMETRY_SAVE_EVERY = int(os.getenv('MC_TELEMETRY_SAVE_EVERY', '20'))  # samples between saves, 0 saves on shutdown only
+# Automatic power management, minutes, 0 disables
+MC_IDLE_SHUTDOWN = float(os.getenv('MC_IDLE_SHUTDOWN', '0'))
+MC_START_GRACE = float(os.getenv('MC_START_GRACE', '15'))
+MC_PRESTART_LEAD = float(os.getenv('MC_PRESTART_LEAD', '0'))
+# Average player count from which an hour of the week counts as busy
+MC_PRESTART_PLAYERS = float(os.getenv('MC_PRESTART_PLAYERS', '0.5'))
+MC_POWER_CHANNEL = int(os.getenv('MC_POWER_CHANNEL', '0') or '0')
+
+# live configuration, a TOML file of setting names applied on top of the environment
+CONFIG_FILE = os.getenv('CONFIG_FILE', 'config.toml')
+CONFIG_POLL = float(os.getenv('CONFIG_POLL', '5'))
+
+# event loop watchdog, opt-in
+LOOP_WATCHDOG = os.getenv('LOOP_WATCHDOG', 'false').lower() in ('1', 'true', 'yes')
+LOOP_STALL_THRESHOLD = float(os.getenv('LOOP_STALL_THRESHOLD', '0.5'))
+
+# slash commands, without prefix commands the bot no longer receives message events
+PREFIX_COMMANDS = os.getenv('PREFIX_COMMANDS', 'true').lower() in ('1', 'true', 'yes')
+SYNC_APP_COMMANDS = os.getenv('SYNC_APP_COMMANDS', 'false').lower() in ('1', 'true', 'yes')
+APP_COMMAND_GUILD = int(os.getenv('APP_COMMAND_GUILD', '0'))  # sync to one guild instantly, 0 syncs globally
+
+# sharding, SHARD_COUNT 0 lets Discord recommend a count
+SHARDING = os.getenv('SHARDING', 'false').lower() in ('1', 'true', 'yes')
+SHARD_COUNT = int(os.getenv('SHARD_COUNT', '0'))
+SHARD_PROCESSES = int(os.getenv('SHARD_PROCESSES', '1'))
+
+# process pool for CPU-bound work, 0 workers uses the CPU count
+COMPUTE_WORKERS = int(os.getenv('COMPUTE_WORKERS', '0'))
+COMPUTE_INLINE_BYTES = int(os.getenv('COMPUTE_INLINE_BYTES', str(64 * 1024)))
+
 # logging
+LOG_FILE = os.getenv('LOG_FILE', 'logs/infos.log')
+LOG_FORMAT = os.getenv('LOG_FORMAT', 'text')  # 'text' or 'json'
+LOG_MAX_BYTES = int(os.getenv('LOG_MAX_BYTES', str(10 * 1024 * 1024)))
+LOG_ROTATE_WHEN = os.getenv('LOG_ROTATE_WHEN', 'midnight')
+LOG_BACKUP_COUNT = int(os.getenv('LOG_BACKUP_COUNT', '7'))
+LOG_RATE_LIMIT = float(os.getenv('LOG_RATE_LIMIT', '2'))  # records/s per call site for chatty loggers
+
+# Loggers only hand records to a queue, a background thread does the formatting and I/O
 LOGGING_CONFIG = {
     "version": 1,
     "disabled_existing_loggers": False,
@@ -18,6 +114,14 @@ LOGGING_CONFIG = {
             "format": "%(levelname)-10s - %(asctime)s - %(module)-15s : %(message)s"
         },
         "standard": {"format": "%(levelname)-10s - %(name)-15s : %(message)s"},
+        "json": {"()": "jobot.logs.JsonFormatter"},
+    },
+    "filters": {
+        "ratelimit": {
+            "()": "jobot.logs.RateLimitFilter",
+            "rate": LOG_RATE_LIMIT,
+            "burst": 10,
+        },
     },
     "handlers": {
         "console": {
@@ -32,20 +136,52 @@ LOGGING_CONFIG = {
         },
         "file": {
             "level": "INFO",
-            "class": "logging.FileHandler",
-            "filename": "logs/infos.log",
-            "mode": "a",
-            "formatter": "verbose",
+            "class": "jobot.logs.RotatingFileHandler",
+            "filename": LOG_FILE,
+            "when": LOG_ROTATE_WHEN,
+            "maxBytes": LOG_MAX_BYTES,
+            "backupCount": LOG_BACKUP_COUNT,
+            "formatter": "json" if LOG_FORMAT == "json" else "verbose",
+        },
+        "bot_queue": {
+            "class": "logging.handlers.QueueHandler",
+            "handlers": ["console", "file"],
+            "listener": "jobot.logs.BatchingQueueListener",
+            "respect_handler_level": True,
+        },
+        "discord_queue": {
+            "class": "logging.handlers.QueueHandler",
+            "handlers": ["console2", "file"],
+            "listener": "jobot.logs.BatchingQueueListener",
+            "respect_handler_level": True,
         },
     },
     "loggers": {
-        "bot": {"handlers": ["console", "file"], "level": "INFO", "propagate": False},
+        "bot": {"handlers": ["bot_queue"], "level": "INFO", "propagate": False},
         "discord": {
-            "handlers": ["console2", "file"],
+            "handlers": ["discord_queue"],
             "level": "INFO",
             "propagate": False,
         },
+        "discord.gateway": {"filters": ["ratelimit"]},
+        "discord.client": {"filters": ["ratelimit"]},
     }
 }
 
-dictConfig(LOGGING_CONFIG)
\ No newline at end of file
+_logging_configured = False
+
+
+def configure_logging():
+    """
+    Apply LOGGING_CONFIG and start the queue listener threads, only the first call does anything.
+
+    Called by the entry points rather than at import time, compute pool workers import
+    the main module again and must not open the log file or start listeners.
+    """
+    global _logging_configured
+    if _logging_configured:
+        return
+    _logging_configured = True
+    dictConfig(LOGGING_CONFIG)
+    for listener in start_listeners("bot_queue", "discord_queue"):
+        atexit.register(listener.stop)
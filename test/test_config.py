@@ -0,0 +1,120 @@
+# test_config.py
+import os
+import types
+import pytest
+from jobot import config
+from jobot.config import ConfigWatcher, _coerce
+
+
+def _settings():
+    return types.SimpleNamespace(
+        LLM_TIMEOUT=120.0, RAG_TOP_K=8, RAG_ENABLED=False, LLM_ADDRESSES=['http://a:11434'],
+        MC_LOG_PATH='', PROXMOX_NODE='pve', DISCORD_API_TOKEN='token',
+    )
+
+
+def _write(path, text):
+    path.write_text(text)
+    # Make sure the change is seen even within the file system's timestamp resolution
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+
+
+def test_coerce_follows_the_current_type():
+    assert _coerce('X', 5, 1.5) == 5.0 and isinstance(_coerce('X', 5, 1.5), float)
+    assert _coerce('X', 2.0, 1) == 2 and isinstance(_coerce('X', 2.0, 1), int)
+    assert _coerce('X', True, False) is True
+    assert _coerce('X', 'a, b,,c', []) == ['a', 'b', 'c']
+    assert _coerce('X', ['a'], []) == ['a']
+    assert _coerce('X', 42, '') == '42'
+    assert _coerce('X', 'value', None) == 'value'
+
+
+@pytest.mark.parametrize('value, current', [(1, False), ('yes', True), (True, 1), ('1', 1), (3, []), ({'a': 1}, '')])
+def test_coerce_rejects_other_types(value, current):
+    with pytest.raises(TypeError):
+        _coerce('X', value, current)
+
+
+def test_apply_sets_values_and_restores_defaults(tmp_path):
+    path = tmp_path / 'config.toml'
+    target = _settings()
+    watcher = ConfigWatcher(str(path), target)
+    # A missing file changes nothing
+    assert watcher.apply() == set()
+
+    _write(path, 'rag_top_k = 4\n[llm]\nllm_timeout = 30\nllm_addresses = "http://b:11434, http://c:11434"\n')
+    assert watcher.apply() == {'RAG_TOP_K', 'LLM_TIMEOUT', 'LLM_ADDRESSES'}
+    assert target.RAG_TOP_K == 4
+    assert target.LLM_TIMEOUT == 30.0
+    assert target.LLM_ADDRESSES == ['http://b:11434', 'http://c:11434']
+    # Unchanged file is not read again
+    assert watcher.apply() == set()
+
+    # Keys that leave the file go back to the value from before
+    _write(path, 'rag_top_k = 4\n')
+    assert watcher.apply() == {'LLM_TIMEOUT', 'LLM_ADDRESSES'}
+    assert target.LLM_TIMEOUT == 120.0
+    assert target.LLM_ADDRESSES == ['http://a:11434']
+
+    path.unlink()
+    assert watcher.apply() == {'RAG_TOP_K'}
+    assert target.RAG_TOP_K == 8
+
+
+def test_apply_ignores_invalid_values(tmp_path):
+    path = tmp_path / 'config.toml'
+    target = _settings()
+    watcher = ConfigWatcher(str(path), target)
+    _write(path, 'discord_api_token = "other"\nunknown_setting = 1\nrag_enabled = "yes"\nproxmox_node = "pve2"\n')
+    assert watcher.apply() == {'PROXMOX_NODE'}
+    assert target.DISCORD_API_TOKEN == 'token'
+    assert target.RAG_ENABLED is False
+    assert not hasattr(target, 'UNKNOWN_SETTING')
+
+    # A broken file keeps the last good values
+    _write(path, 'proxmox_node = \n')
+    assert watcher.apply() == set()
+    assert target.PROXMOX_NODE == 'pve2'
+
+
+def test_hooks_get_the_changed_names(tmp_path, monkeypatch):
+    monkeypatch.setattr(config, '_hooks', {})
+    seen = []
+    config.on_change('first', lambda changed: seen.append(('first', changed)))
+    config.on_change('broken', lambda changed: 1 / 0)
+    # Registering again under the same owner replaces the callback
+    config.on_change('first', lambda changed: seen.append(('again', changed)))
+
+    path = tmp_path / 'config.toml'
+    watcher = ConfigWatcher(str(path), _settings())
+    _write(path, 'rag_top_k = 2\n')
+    watcher.apply()
+    assert seen == [('again', {'RAG_TOP_K'})]
+
+
+def test_startup_only_settings_wait_for_a_restart(tmp_path):
+    path = tmp_path / 'config.toml'
+    target = _settings()
+    target.RAG_DIR = 'data/rag'
+    _write(path, 'rag_dir = "/srv/rag"\n')
+    watcher = ConfigWatcher(str(path), target)
+    # The first load happens before startup and may set it
+    assert watcher.apply() == {'RAG_DIR'}
+    assert target.RAG_DIR == '/srv/rag'
+
+    _write(path, 'rag_dir = "/other"\nrag_top_k = 3\n')
+    assert watcher.apply() == {'RAG_TOP_K'}
+    assert target.RAG_DIR == '/srv/rag'
+
+
+def test_startup_only_settings_added_later_are_ignored(tmp_path):
+    path = tmp_path / 'config.toml'
+    target = _settings()
+    target.RAG_DIR = 'data/rag'
+    watcher = ConfigWatcher(str(path), target)
+    assert watcher.apply() == set()
+
+    _write(path, 'rag_dir = "/srv/rag"\n')
+    assert watcher.apply() == set()
+    assert target.RAG_DIR == 'data/rag'
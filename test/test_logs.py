@@ -0,0 +1,50 @@
+# test_logs.py
+import logging
+import os
+from jobot.logs import RotatingFileHandler
+
+
+def _handler(path, backup_count, max_bytes):
+    handler = RotatingFileHandler(path, when='midnight', backupCount=backup_count, maxBytes=max_bytes)
+    handler.setFormatter(logging.Formatter('%(message)s'))
+    return handler
+
+
+def _emit(handler, message):
+    handler.emit(logging.LogRecord('test', logging.INFO, __file__, 0, message, None, None))
+    handler.flush()
+
+
+def _records(directory):
+    lines = []
+    for name in os.listdir(directory):
+        with open(os.path.join(directory, name), encoding='utf-8') as file:
+            lines += file.read().split()
+    return sorted(int(line.split('-')[1]) for line in lines)
+
+
+def test_size_rollover_keeps_newest_backups(tmp_path):
+    handler = _handler(str(tmp_path / 'x.log'), backup_count=2, max_bytes=100)
+    for i in range(40):
+        _emit(handler, f"record-{i:02d}-" + 'x' * 20)
+    handler.close()
+
+    files = os.listdir(tmp_path)
+    assert len(files) == 3
+    records = _records(tmp_path)
+    # The newest records survive without gaps
+    assert records[-1] == 39
+    assert records == list(range(records[0], 40))
+
+
+def test_counter_not_reused_after_deletion(tmp_path):
+    handler = _handler(str(tmp_path / 'x.log'), backup_count=1, max_bytes=10)
+    for i in range(5):
+        _emit(handler, f"record-{i}-xxxxxxxxxx")
+    handler.close()
+
+    backups = [name for name in os.listdir(tmp_path) if name != 'x.log']
+    assert len(backups) == 1
+    # Three rollovers into the same period, the survivor has the highest counter
+    assert backups[0].endswith('.0003')
+    assert _records(tmp_path) == [3, 4]
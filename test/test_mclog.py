@@ -0,0 +1,81 @@
+# test_mclog.py
+import asyncio
+from jobot.mclog import LogEvent, LogRelay, parse_line
+
+
+def test_parse_join():
+    event = parse_line("[10:00:00] [Server thread/INFO]: Steve joined the game")
+    assert event == LogEvent('join', '10:00:00', 'Steve joined the game')
+
+
+def test_parse_death():
+    event = parse_line("[10:00:00] [Server thread/INFO]: Steve was slain by Zombie")
+    assert event.category == 'death'
+    assert event.text == 'Steve was slain by Zombie'
+
+
+def test_parse_tps():
+    line = ("[10:00:00] [Server thread/WARN]: Can't keep up! Is the server overloaded? "
+            "Running 5012ms or 100 ticks behind")
+    event = parse_line(line)
+    assert event.category == 'tps'
+    assert event.text == 'Server is 5012ms (100 ticks) behind'
+
+
+def test_parse_forge_header():
+    line = "[18Oct2026 10:00:00.123] [Server thread/INFO] [minecraft/MinecraftServer]: Alex left the game"
+    event = parse_line(line)
+    assert event == LogEvent('leave', '18Oct2026 10:00:00.123', 'Alex left the game')
+
+
+def test_parse_ignores_other_lines():
+    assert parse_line("[10:00:00] [Server thread/INFO]: Saving chunks for level 'world'") is None
+    assert parse_line("[10:00:00] [Worker-Main-1/INFO]: Steve joined the game") is None
+    assert parse_line("not a log line") is None
+
+
+def test_batch_drops_least_important_first():
+    relay = LogRelay(source=None, send=None, max_pending=3)
+    relay._push(LogEvent('chat', '1', 'hello'))
+    relay._push(LogEvent('error', '2', 'boom'))
+    relay._push(LogEvent('chat', '3', 'again'))
+    relay._push(LogEvent('join', '4', 'Steve joined the game'))
+    relay._push(LogEvent('death', '5', 'Steve drowned'))
+
+    messages = relay._batch()
+    # Both chat lines went, the rest stays in log order
+    assert messages == ["! boom\n+ Steve joined the game\n☠ Steve drowned\n... 2 events skipped"]
+    assert relay._batch() == []
+
+
+def test_batch_splits_long_messages():
+    relay = LogRelay(source=None, send=None, max_length=30)
+    for i in range(3):
+        relay._push(LogEvent('join', str(i), f'Player{i} joined the game'))
+    messages = relay._batch()
+    assert len(messages) == 3
+    assert all(len(message) <= 30 for message in messages)
+
+
+class _BrokenSource:
+    async def chunks(self):
+        yield ["[10:00:00] [Server thread/INFO]: Steve joined the game"]
+        raise OSError("connection lost")
+
+
+def test_follow_reports_source_errors():
+    sent = []
+
+    async def send(message):
+        sent.append(message)
+
+    async def run():
+        relay = LogRelay(_BrokenSource(), send, interval=60)
+        relay.start()
+        await asyncio.sleep(0.1)
+        return relay.running
+
+    running = asyncio.run(run())
+    assert not running
+    assert sent[0] == "+ Steve joined the game"
+    assert sent[1].startswith("Log stream stopped: connection lost")
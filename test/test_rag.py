@@ -0,0 +1,159 @@
+# test_rag.py
+import asyncio
+import datetime
+import types
+import numpy as np
+from jobot.rag import MessageIndex, Retriever
+
+
+def _clustered(count, dimensions=32, centers=20, seed=0):
+    generator = np.random.default_rng(seed)
+    means = generator.normal(size=(centers, dimensions))
+    labels = generator.integers(centers, size=count)
+    return (means[labels] + generator.normal(scale=0.1, size=(count, dimensions))).astype(np.float32)
+
+
+def _records(count, start=0):
+    return [(start + i, 1, 'general', 'user', float(start + i), f"message {start + i}") for i in range(count)]
+
+
+def _exact(vectors, query):
+    vectors = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+    return int(np.argmax(vectors @ (query / np.linalg.norm(query))))
+
+
+def test_search_before_training_is_exact(tmp_path):
+    vectors = _clustered(200)
+    index = MessageIndex(str(tmp_path), train_size=1000)
+    index.add(_records(200), vectors)
+    assert index.stats()['lists'] == 0
+
+    query = vectors[17] + 0.01
+    results = index.search(query, k=3)
+    assert len(results) == 3
+    assert results[0][-1] == f"message {_exact(vectors, query)}"
+    assert [score for score, *_ in results] == sorted((score for score, *_ in results), reverse=True)
+    index.close()
+
+
+def test_search_uses_inverted_lists(tmp_path):
+    vectors = _clustered(2000)
+    index = MessageIndex(str(tmp_path), nprobe=4, train_size=1000)
+    index.add(_records(2000), vectors)
+    assert index.stats()['lists'] >= 16
+
+    # Rows added after training are found before the lists are rebuilt
+    extra = _clustered(50, seed=1)
+    index.add(_records(50, start=2000), extra)
+    everything = np.vstack([vectors, extra])
+    hits = 0
+    for row in range(0, 2050, 41):
+        query = everything[row]
+        hits += index.search(query, k=1)[0][-1] == f"message {_exact(everything, query)}"
+    assert hits >= 48
+    index.close()
+
+
+def test_search_skips_forgotten_messages(tmp_path):
+    vectors = _clustered(100)
+    index = MessageIndex(str(tmp_path), train_size=1000)
+    index.add(_records(100), vectors)
+    index.forget([5])
+    assert all(result[-1] != "message 5" for result in index.search(vectors[5], k=5))
+    index.close()
+
+
+def test_index_reopens_with_lists(tmp_path):
+    vectors = _clustered(1500)
+    index = MessageIndex(str(tmp_path), train_size=1000)
+    index.add(_records(1500), vectors, checkpoints={1: 1499})
+    lists = index.stats()['lists']
+    index.close()
+
+    index = MessageIndex(str(tmp_path), train_size=1000)
+    assert index.stats()['lists'] == lists
+    assert index.checkpoint(1) == (1499, False)
+    assert index.search(vectors[3], k=1)[0][-1] == f"message {_exact(vectors, vectors[3])}"
+    index.close()
+
+
+def _message(message_id, channel_id, content):
+    return types.SimpleNamespace(
+        id=message_id, clean_content=content, guild=types.SimpleNamespace(id=1),
+        channel=types.SimpleNamespace(id=channel_id, name=f"channel-{channel_id}"),
+        author=types.SimpleNamespace(bot=False), created_at=datetime.datetime.now(),
+    )
+
+
+class _Embedder:
+    """Embeds a text as the vector of the word it contains, fails while `down` is set."""
+    words = ('deploy', 'secret', 'lunch')
+
+    def __init__(self):
+        self.down = False
+
+    async def __call__(self, texts):
+        if self.down:
+            raise ConnectionError("embedding server unreachable")
+        return [[float(word in text) for word in self.words] + [0.01] for text in texts]
+
+
+def test_search_filters_channels(tmp_path):
+    index = MessageIndex(str(tmp_path), train_size=1000)
+    vectors = _clustered(300)
+    records = [(i, 1 + i % 3, 'general', 'user', float(i), f"message {i}") for i in range(300)]
+    index.add(records, vectors)
+
+    results = index.search(vectors[0], k=5, channel_ids={2})
+    assert len(results) == 5
+    assert {result[1] for result in results} == {2}
+    assert index.search(vectors[0], k=5, channel_ids=set()) == []
+    index.close()
+
+
+def test_context_leaves_out_unreadable_channels(tmp_path):
+    async def run():
+        embed = _Embedder()
+        retriever = Retriever(str(tmp_path), embed, top_k=4)
+        index = retriever.index(1)
+        for channel_id in (10, 20):
+            index.mark_complete(channel_id)
+        retriever.observe(_message(1, 10, "the deploy is done"))
+        retriever.observe(_message(2, 20, "the secret deploy key is hunter2"))
+        await retriever._flush_all()
+
+        everything = await retriever.context(1, "secret deploy", None)
+        public = await retriever.context(1, "secret deploy", {10})
+        nothing = await retriever.context(1, "secret deploy", set())
+        await retriever.close()
+        return everything, public, nothing
+
+    everything, public, nothing = asyncio.run(run())
+    assert 'hunter2' in everything
+    assert 'hunter2' not in public and 'the deploy is done' in public
+    assert nothing == ''
+
+
+def test_failed_flush_keeps_messages(tmp_path):
+    async def run():
+        embed = _Embedder()
+        retriever = Retriever(str(tmp_path), embed, batch_size=2)
+        index = retriever.index(1)
+        index.mark_complete(10)
+        for i in range(5):
+            retriever.observe(_message(i + 1, 10, f"lunch {i}"))
+        embed.down = True
+        await retriever._flush_all()
+        assert index.stats()['messages'] == 0
+        retriever.observe(_message(6, 10, "lunch later"))
+
+        embed.down = False
+        await retriever._flush_all()
+        stats = index.stats()
+        checkpoint = index.checkpoint(10)
+        await retriever.close()
+        return stats, checkpoint
+
+    stats, checkpoint = asyncio.run(run())
+    assert stats['messages'] == 6
+    assert checkpoint == (6, True)